@@ -5,75 +5,145 @@
 
 # Usage: bam2clone <infile> [<outfile>]
 # If no infile is supplied then the output is set to infile.csv
+#
+#        bam2clone --scan <image> [<image> ...] [-o <outdir>]
+# Scans whole disk images or archive dumps for anything that looks like a level and writes each one out
+# as <image>-<offset>.csv in outdir (default the current directory). The images are memory mapped and
+# scanned a chunk at a time, so they can be any size.
+#
+#        bam2clone --tobam <level.csv> [<outfile>]
+# The other way, writes a CSV level out as an original level file, by default level.bam
+#
+# The level formats are read and written by bamCodec.py
 
-import sys
+import sys, os, mmap
+from bamCodec import TILENAMES, ROWS, COLS, STRIDE, LEVEL_SIZE, decodeLevel, readCSV, writeCSV
+from bamCodec import writeOriginal, codecError
 
-tiles=[
-    "B",        # 0 = Blank
-    "H",        # 1 = Horizontal
-    "V",        # 2 = Vertical
-    "SEL",      # 3 = South East corner
-    "SWL",      # 4 = South West corner
-    "NEL",      # 5 = North East corner
-    "NWL",      # 6 = North West corner
-    "W",        # 7 = Wheel
-    "PV.Y",     # 8 = Yellow vertical painter
-    "PV.B",     # 9 = Blue vertical painter
-    "PV.G",     # A = Green vertical painter
-    "PV.R",     # B = Red vertical painter
-    "PH.Y",     # C = Yellow horizontal painter
-    "PH.B",     # D = Blue horizontal painter
-    "PH.G",     # E = Green horizontal painter
-    "PH.R",     # F = Red horizontal painter
-    "BV.Y",     # 10 = Yellow vertical blocker
-    "BV.B",     # 11 = Blue vertical blocker
-    "BV.G",     # 12 = Green vertical blocker
-    "BV.R",     # 13 = Red vertical blocker
-    "BH.Y",      # 14 = Yellow horizontal blocker
-    "BH.B",      # 15 = Blue horizontal blocker
-    "BH.G",     # 16 = Green hosizontal blocker
-    "BH.R",     # 17 = Red horizontal blocker
-    "ST",       # 18 = SouthT
-]
-if len(sys.argv) < 2:
-    print("Usage: bam2clone <infile> [<outfile>]")
-    exit(1)
-sys.argv.pop(0)
-infile=sys.argv.pop(0)
-if len(sys.argv)==0:
-    # No second argument
-    outfile=infile+".csv"
-else:
-    outfile=sys.argv.pop(0)
+# Scanning. A level is ROWS*COLS tile bytes in a row, STRIDE apart, all of them tiles we know
+TILE_W=TILENAMES.index("W")
+TILE_ST=TILENAMES.index("ST")
+TOP_ROW={TILENAMES.index(t) for t in TILENAMES if t in ("H", "ST") or t[:2] in ("PH", "BH")}   # Tiles the top ally is made of
+NOT_TOP=bytes(t for t in range(256) if t not in TOP_ROW)
+NOT_TILE=bytes(0 if t<len(TILENAMES) else 1 for t in range(256))     # Turns bytes into 0 for a tile, 1 if not
+LEVEL_RUN=bytes(ROWS*COLS)
+SCAN_CHUNK=64*1024*1024     # Scan this much of an image at a time, plus a level's worth of overlap
 
-print("Converting {} into {}....".format(infile, outfile))
+def plausible(codes):
+    # Do ROWS*COLS tile codes, in file order, look like a level? They must all be tiles (checked by the
+    # caller), have a wheel, and the top row must be the ball ally with at least one south T. Checking the
+    # whole top row stops us finding a level a column out when it has blank space next to it
+    top=codes[ROWS-1::ROWS]
+    return TILE_W in codes and TILE_ST in top and len(top.translate(None, NOT_TOP))==COLS
 
-with open(infile, "rb") as levfile:
-    # Read the entire file into a byte array
-    levarray = levfile.read()
-fileSize=len(levarray)
+def scanImage(filename):
+    # Generator, yields (offset, rows of tile names) for each level found in a disk image. Levels found
+    # overlapping one already found are skipped
+    with open(filename, "rb") as f:
+        size=os.fstat(f.fileno()).st_size
+        if(size<LEVEL_SIZE):
+            return
+        image=mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        nextFree=0
+        for start in range(0, size, SCAN_CHUNK):
+            end=min(size, start+SCAN_CHUNK+LEVEL_SIZE)
+            found=[]
+            for r in range(STRIDE):
+                # Every STRIDE'th byte from here, so a level is ROWS*COLS bytes in a row
+                codes=image[start+r:end:STRIDE]
+                # Look for runs of tiles with find(), which is far quicker than a regular expression
+                notTile=codes.translate(NOT_TILE)
+                run=notTile.find(LEVEL_RUN)
+                while(run>=0):
+                    runEnd=notTile.find(1, run)
+                    if(runEnd<0):
+                        runEnd=len(codes)
+                    # No wheel or no south T is usually empty space
+                    st=codes.find(TILE_ST, run, runEnd)
+                    if(st>=0 and codes.find(TILE_W, run, runEnd)>=0):
+                        # A level has a south T in its top row, so only the levels each south T could be the
+                        # top row of need checking. The top row is the last tile of each column
+                        last=runEnd-ROWS*COLS
+                        tops=set()
+                        while(st>=0):
+                            for c in range(COLS):
+                                i=st-(ROWS-1)-c*ROWS
+                                if(i>=run and i<=last):
+                                    tops.add(i)
+                            st=codes.find(TILE_ST, st+1, runEnd)
+                        for i in sorted(tops):
+                            offset=start+r+i*STRIDE-(STRIDE-1)
+                            if(offset>=start and offset<start+SCAN_CHUNK and plausible(codes[i:i+ROWS*COLS])):
+                                found.append(offset)
+                    run=notTile.find(LEVEL_RUN, runEnd)
+            for offset in sorted(found):
+                if(offset>=nextFree):
+                    yield (offset, decodeLevel(image, offset))
+                    nextFree=offset+LEVEL_SIZE
+    finally:
+        image.close()
 
-ofile = open(outfile, "w")
+def scan(images, outdir):
+    # Scan disk images and write out every level found
+    total=0
+    for image in images:
+        base=os.path.basename(image)
+        count=0
+        for (offset, levelData) in scanImage(image):
+            writeCSV(levelData, os.path.join(outdir, "{}-{:08X}.csv".format(base, offset)))
+            count+=1
+        print("{}: {} levels".format(image, count))
+        total+=count
+    return total
 
-hasUnknown=False
-for row in range(0,6):
-    for col in range(0,8):
-        # Data is in 5 byte blocks with the last byte being the most significat
-        # The layout is also sideways so we start at the bottom left, then go up the left
-        # hand side to the top left. The top right is the last byte.
-        pos=30*(col)+(30-row*5)-1
-        val=levarray[pos]
-        if tiles[val][0]=='U':
-            hasUnknown=True
-        #print("{:02X}  ".format(levarray[pos]),end="")
-        outstr="{}".format(tiles[val])
-        if(col!=7):
-            outstr+=","
-        print(outstr, end="")
-        ofile.write(outstr)
-    print()
-    ofile.write("\n")
-ofile.close
+def convert(infile, outfile):
+    # Convert a single level file
+    print("Converting {} into {}....".format(infile, outfile))
+    with open(infile, "rb") as levfile:
+        levelData=decodeLevel(levfile.read())
+    for row in levelData:
+        print(",".join(row))
+    writeCSV(levelData, outfile)
+    if any(t[0]=='U' for row in levelData for t in row):
+        print("Warning: This conversion has unknown tiles")
 
-if hasUnknown:
-    print("Warning: This conversion has unknown tiles")
\ No newline at end of file
+def convertBack(infile, outfile):
+    # Convert a CSV level into an original level file
+    print("Converting {} into {}....".format(infile, outfile))
+    writeOriginal([readCSV(infile)], outfile)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: bam2clone <infile> [<outfile>]")
+        print("       bam2clone --scan <image> [<image> ...] [-o <outdir>]")
+        print("       bam2clone --tobam <level.csv> [<outfile>]")
+        exit(1)
+    sys.argv.pop(0)
+    if sys.argv[0]=="--scan":
+        sys.argv.pop(0)
+        outdir="."
+        if "-o" in sys.argv:
+            i=sys.argv.index("-o")
+            outdir=sys.argv[i+1]
+            del sys.argv[i:i+2]
+        os.makedirs(outdir, exist_ok=True)
+        scan(sys.argv, outdir)
+        exit(0)
+    if sys.argv[0]=="--tobam":
+        sys.argv.pop(0)
+        infile=sys.argv.pop(0)
+        outfile=sys.argv.pop(0) if sys.argv else os.path.splitext(infile)[0]+".bam"
+        try:
+            convertBack(infile, outfile)
+        except codecError as e:
+            print("Error:", e)
+            exit(1)
+        exit(0)
+    infile=sys.argv.pop(0)
+    if len(sys.argv)==0:
+        # No second argument
+        outfile=infile+".csv"
+    else:
+        outfile=sys.argv.pop(0)
+    convert(infile, outfile)
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+#
+# bamAssets
+# A cache on disk of the images and sounds bamclone makes when it starts: the tile images, scaled explosion frames,
+# balls, wheel and decoded sounds. Each one is kept as its raw pixels or PCM samples, so the next start copies them
+# straight back into surfaces and sounds with no PNG or MP3 decoding, scaling or drawing.
+#
+# The cache has a key made from the modification times of every file the assets are made from and the sizes they
+# are made at. If anything changes the key doesn't match, the whole cache is thrown away and everything is made
+# again and saved. Delete the cache file to force this.
+#
+# Everything is little endian. The file is a header followed by the assets:
+#   magic "BAMASSET", version (u16), key (20 bytes), number of assets (u16)
+#   kind, name length (u8 each), width, height (u16 each), data length (u32), then the name (utf-8) and data
+# Images are RGBA for surfaces with per pixel alpha and RGB otherwise. Sounds are the mixer's own samples, so they
+# are kept under their name and the mixer settings, and the cache is still used with sound off (no mixer). A list
+# or dictionary of images is stored as its member names.
+import os, struct, hashlib
+import pygame
+
+ASSET_CACHE=os.path.join("cache", "assets.cache")
+
+CACHE_MAGIC=b"BAMASSET"
+CACHE_VERSION=1
+HEADER=struct.Struct("<8sH20sH")
+ENTRY=struct.Struct("<BBHHI")
+
+# Kinds of asset
+AS_RGB=0
+AS_RGBA=1
+AS_SOUND=2
+AS_LIST=3
+AS_DICT=4
+
+def cacheKey(files, sizes):
+    # Key for the files assets are made from and a list of (name, value) settings they depend on
+    parts=["{}:{}".format(f, os.path.getmtime(f)) for f in files]
+    parts+=["{}={!r}".format(name, value) for (name, value) in sizes]
+    parts.append("pygame={}".format(pygame.version.ver))
+    return hashlib.sha1("\n".join(parts).encode()).digest()
+
+class assetCache():
+    # Assets are asked for by name with a function to make them. If the cache has them they come from there,
+    # otherwise they are made and kept for save(). Images come back converted to the display format, so the
+    # display must be set up first
+    def __init__(self, key, cacheFile=ASSET_CACHE):
+        self.key=key
+        self.cacheFile=cacheFile
+        self.entries={}     # name: (kind, width, height, data) of everything in the cache
+        self.changed=False
+        self.load()
+
+    def load(self):
+        # The file is read in one go and the assets are views into it, so nothing is copied until the surfaces
+        # and sounds are made
+        try:
+            with open(self.cacheFile, "rb") as f:
+                data=memoryview(f.read())
+        except OSError:
+            # No cache yet
+            return
+        try:
+            (magic, version, key, count)=HEADER.unpack_from(data, 0)
+            if(magic!=CACHE_MAGIC or version!=CACHE_VERSION or key!=self.key):
+                return
+            p=HEADER.size
+            for i in range(count):
+                (kind, nameLen, w, h, size)=ENTRY.unpack_from(data, p)
+                p+=ENTRY.size
+                name=bytes(data[p:p+nameLen]).decode()
+                p+=nameLen
+                self.entries[name]=(kind, w, h, data[p:p+size])
+                p+=size
+        except struct.error:
+            # Cut short, everything will be made again
+            self.entries={}
+
+    def save(self):
+        # Write the cache out if anything had to be made. A cache that can't be written is just not used
+        if(not self.changed):
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cacheFile) or ".", exist_ok=True)
+            tmpFile=self.cacheFile+".tmp"
+            with open(tmpFile, "wb") as f:
+                f.write(HEADER.pack(CACHE_MAGIC, CACHE_VERSION, self.key, len(self.entries)))
+                for (name, (kind, w, h, data)) in self.entries.items():
+                    n=name.encode()
+                    f.write(ENTRY.pack(kind, len(n), w, h, len(data)))
+                    f.write(n)
+                    f.write(data)
+            os.replace(tmpFile, self.cacheFile)
+            self.changed=False
+        except OSError as e:
+            print("Asset cache not saved:", e)
+
+    def image(self, name, make):
+        # A surface, make() draws it if it isn't cached. The surface made straight on the cached pixels is
+        # converted, which copies them
+        if(name in self.entries):
+            (kind, w, h, data)=self.entries[name]
+            if(kind==AS_RGBA):
+                return pygame.image.frombuffer(data, (w, h), "RGBA").convert_alpha()
+            if(kind==AS_RGB):
+                return pygame.image.frombuffer(data, (w, h), "RGB").convert()
+        return self.keepImage(name, make())
+
+    def keepImage(self, name, img):
+        if(img.get_flags() & pygame.SRCALPHA):
+            self.entries[name]=(AS_RGBA, img.get_width(), img.get_height(), pygame.image.tobytes(img, "RGBA"))
+        else:
+            self.entries[name]=(AS_RGB, img.get_width(), img.get_height(), pygame.image.tobytes(img, "RGB"))
+        self.changed=True
+        return img
+
+    def images(self, name, make):
+        # A list or dictionary of surfaces, each cached as name/member
+        if(name in self.entries):
+            (kind, w, h, data)=self.entries[name]
+            keys=bytes(data).decode().split("\n") if len(data) else []
+            if(kind in (AS_LIST, AS_DICT) and all("{}/{}".format(name, k) in self.entries for k in keys)):
+                imgs={k:self.image("{}/{}".format(name, k), None) for k in keys}
+                return list(imgs.values()) if kind==AS_LIST else imgs
+        imgs=make()
+        if(isinstance(imgs, dict)):
+            keys=list(imgs)
+            for k in keys:
+                self.keepImage("{}/{}".format(name, k), imgs[k])
+            self.entries[name]=(AS_DICT, 0, 0, "\n".join(keys).encode())
+        else:
+            for (i, img) in enumerate(imgs):
+                self.keepImage("{}/{}".format(name, i), img)
+            self.entries[name]=(AS_LIST, 0, 0, "\n".join(str(i) for i in range(len(imgs))).encode())
+        self.changed=True
+        return imgs
+
+    def sound(self, name, filename):
+        # A pygame Sound, decoded from filename if it isn't cached for the mixer's settings
+        name="{}@{}".format(name, pygame.mixer.get_init())
+        if(name in self.entries and self.entries[name][0]==AS_SOUND):
+            return pygame.mixer.Sound(buffer=self.entries[name][3])
+        snd=pygame.mixer.Sound(filename)
+        self.entries[name]=(AS_SOUND, 0, 0, snd.get_raw())
+        self.changed=True
+        return snd
+# End of assetCache class
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+#
+# bamAtlas
+# Packs the images the game draws into one surface, a texture atlas, in the display's pixel format with per pixel
+# alpha. Each image is known by name and kept as a rectangle of the atlas, and is drawn by blitting that rectangle
+# of the one surface. Every blit then comes from the same pixel format, which saves converting pixels as they are
+# drawn on software renderers.
+#
+# Images are packed in shelves, tallest first, left to right and then down. The pixels (and alpha) are copied into
+# the atlas exactly, so drawing from the atlas gives the same result as drawing the separate images.
+import pygame
+
+ATLAS_WIDTH=1024        # Width of the atlas, unless an image is wider
+
+class textureAtlas():
+    def __init__(self, images, width=ATLAS_WIDTH):
+        # images is a dictionary of name: surface. The display must be set up first
+        self.rects={}
+        width=max([width]+[img.get_width() for img in images.values()])
+        x=0
+        y=0
+        shelf=0         # Height of the current shelf
+        for name in sorted(images, key=lambda n:(-images[n].get_height(), -images[n].get_width(), n)):
+            (w, h)=images[name].get_size()
+            if(x+w>width):
+                x=0
+                y+=shelf
+                shelf=0
+            self.rects[name]=pygame.Rect(x, y, w, h)
+            x+=w
+            shelf=max(shelf, h)
+        self.surface=pygame.Surface((width, max(1, y+shelf)), pygame.SRCALPHA).convert_alpha()
+        self.surface.fill((0,0,0,0))
+        for (name, img) in images.items():
+            # The atlas is clear, so taking the larger of each channel copies the pixels without blending them.
+            # Images with no alpha come out solid
+            self.surface.blit(img, self.rects[name], special_flags=pygame.BLEND_RGBA_MAX)
+
+    def __contains__(self, name):
+        return name in self.rects
+
+    def rect(self, name):
+        return self.rects[name]
+
+    def image(self, name):
+        # The image as a subsurface, sharing the atlas pixels
+        return self.surface.subsurface(self.rects[name])
+
+    def blit(self, dest, name, pos):
+        # Draw an image at pos on dest, returns the rectangle drawn
+        return dest.blit(self.surface, pos, self.rects[name])
+# End of textureAtlas class
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+#
+# bamBench
+# Times the game with no window (the SDL dummy video driver) and no sound, so it can be run anywhere and the numbers
+# compared from one change to the next. It imports bamclone, which sets everything up without playing, and then for
+# every level plays a few scripted scenarios through the real engine and front end:
+#   idle        The starting ball and nothing else
+#   chute       A new ball every CHUTE_GAP ticks, so the top ally is always full of balls
+#   rotate      Every wheel turning all the time
+#   explode     A full chute, with every ball on the board exploded every EXPLODE_EVERY ticks
+# Each scenario runs for a number of game ticks, drawing a frame every FPS/RENDER_FPS ticks as the game does. The
+# game ticks per second (game.step() only) and ms per drawGameScreen() are reported for each, along with the time
+# to start (importing bamclone), draw the tiles and draw every wheel frame, and the peak memory used.
+#
+# The results are written as JSON and compared with a baseline saved from an earlier run. Anything more than
+# REGRESSION worse than the baseline is reported and the exit status is 1. Baselines are only comparable on the
+# same machine, save one with --save-baseline before making changes.
+#
+# Usage: python bamBench.py [-t ticks] [-o results.json] [--baseline file] [--save-baseline] [level.csv ...]
+#   With no levels every level in levels/levelList is run
+import sys, os, time, json, math
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("BAMCLONE_SOUND", "0")
+import pygame
+from bamProfile import percentile
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, peak memory isn't reported
+    resource=None
+
+BENCH_VERSION=1
+BENCH_TICKS=600             # Game ticks each scenario runs for, 5 seconds of game time at 120 ticks a second
+BASELINE_FILE="benchBaseline.json"
+REGRESSION=0.15             # Report anything this much worse than the baseline
+EXPLODE_EVERY=120           # Ticks between explosions in the explode scenario
+CHUTE_GAP=None              # Ticks between balls in the chute, set from the ball size and speed by startup()
+
+bc=None                     # The bamclone module, once imported
+
+def idle(game, t):
+    pass
+
+def chute(game, t):
+    # Balls follow each other on to the board nose to tail
+    if(t%CHUTE_GAP==0):
+        game.launchNext()
+
+def rotate(game, t):
+    for w in game.wheels.values():
+        if(not w.rotating):
+            w.rotate()
+
+def explode(game, t):
+    chute(game, t)
+    if(t%EXPLODE_EVERY==EXPLODE_EVERY-1):
+        game.explodeAll()
+
+SCENARIOS={"idle":idle, "chute":chute, "rotate":rotate, "explode":explode}
+
+def startup():
+    # Import bamclone and time the parts of starting up that draw things
+    global bc, CHUTE_GAP
+    out={}
+    start=time.perf_counter()
+    import bamclone
+    bc=bamclone
+    out["importMs"]=(time.perf_counter()-start)*1000
+    CHUTE_GAP=math.ceil(bc.BALLSIZE/bc.BALLSPEED)
+    start=time.perf_counter()
+    bc.tileImages(bc.TILESIZE, bc.PWIDTH, bc.BALLCOLS)
+    out["tileImagesMs"]=(time.perf_counter()-start)*1000
+    # Every frame a wheel can show, from nothing
+    bc.wheelFrames.clear()
+    start=time.perf_counter()
+    for step in range(len(bc.DOCKSTEPS)):
+        for mask in range(16):
+            for blown in (False, True):
+                bc.getWheelFrame(step, mask, blown)
+    out["wheelFramesMs"]=(time.perf_counter()-start)*1000
+    return out
+
+def runScenario(filename, scenario, ticks):
+    # Play a scenario on a level as playLevel() would, with ticks and frames run back to back
+    bc.all_sprites=pygame.sprite.LayeredDirty()
+    start=time.perf_counter()
+    bc.loadLevel(filename)
+    loadMs=(time.perf_counter()-start)*1000
+    game=bc.game
+    bc.ts["levelTime"]=game.levelTime
+    bc.ts["nextUpdate"]=0
+    bc.drawGameScreen()
+    game.start()
+    bc.processGameEvents()
+    action=SCENARIOS[scenario]
+    frameTicks=max(1, round(bc.FPS/bc.RENDER_FPS))
+    stepTime=0
+    draws=[]
+    balls=0
+    for t in range(ticks):
+        if(game.state!=0):
+            break
+        action(game, t)
+        start=time.perf_counter()
+        game.step()
+        stepTime+=time.perf_counter()-start
+        balls=max(balls, len(game.balls))
+        if(t%frameTicks==0):
+            start=time.perf_counter()
+            bc.processGameEvents()
+            bc.all_sprites.update(1)
+            bc.updateTimer()
+            bc.drawGameScreen()
+            draws.append((time.perf_counter()-start)*1000)
+    draws.sort()
+    return (loadMs, {"ticks":game.ticks, "ticksPerSec":game.ticks/stepTime if stepTime else 0,
+                     "drawMs":sum(draws)/len(draws) if draws else 0, "drawP95Ms":percentile(draws, 95),
+                     "peakBalls":balls, "stepTime":stepTime, "draws":len(draws), "drawTime":sum(draws)})
+
+def peakMemory():
+    # Peak resident memory of the process in KB, or None if we can't tell
+    if(resource==None):
+        return None
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS gives bytes, everything else KB
+    return peak//1024 if sys.platform=="darwin" else peak
+
+def runBench(files, ticks):
+    results={"version":BENCH_VERSION, "ticks":ticks, "python":sys.version.split()[0], "pygame":pygame.version.ver}
+    results["startup"]=startup()
+    files=files or bc.levelList
+    levels={}
+    totals={s:{"ticks":0, "stepTime":0, "draws":0, "drawTime":0} for s in SCENARIOS}
+    loadTime=0
+    for filename in files:
+        level={}
+        for scenario in SCENARIOS:
+            (loadMs, r)=runScenario(filename, scenario, ticks)
+            level["loadMs"]=min(loadMs, level.get("loadMs", loadMs))
+            t=totals[scenario]
+            t["ticks"]+=r["ticks"]
+            for k in ("stepTime", "draws", "drawTime"):
+                t[k]+=r.pop(k)
+            level[scenario]=r
+        loadTime+=level["loadMs"]
+        levels[os.path.basename(filename)]=level
+    results["levels"]=levels
+    # Over every level, weighted by the ticks and frames run
+    results["totals"]={s:{"ticksPerSec":t["ticks"]/t["stepTime"] if t["stepTime"] else 0,
+                          "drawMs":t["drawTime"]/t["draws"] if t["draws"] else 0} for (s, t) in totals.items()}
+    results["startup"]["loadLevelMs"]=loadTime/len(files)
+    results["peakMemKB"]=peakMemory()
+    return results
+
+def flatten(results):
+    # The numbers compared with the baseline, as name: (value, higher is better)
+    out={"startup.{}".format(k):(v, False) for (k, v) in results["startup"].items()}
+    for (s, t) in results["totals"].items():
+        out["{}.ticksPerSec".format(s)]=(t["ticksPerSec"], True)
+        out["{}.drawMs".format(s)]=(t["drawMs"], False)
+    if(results.get("peakMemKB")!=None):
+        out["peakMemKB"]=(results["peakMemKB"], False)
+    return out
+
+def compare(results, baseline):
+    # Compare with a baseline, returns a list of (name, old, new, change, regressed). change is how much better
+    # (positive) or worse (negative) new is, as a fraction of old
+    now=flatten(results)
+    old=flatten(baseline)
+    out=[]
+    for (name, (value, higher)) in now.items():
+        if(name not in old or not old[name][0]):
+            continue
+        base=old[name][0]
+        change=(value-base)/base if higher else (base-value)/base
+        out.append((name, base, value, change, change<-REGRESSION))
+    return out
+
+def report(results):
+    s=results["startup"]
+    print("Startup {:.0f}ms, tiles {:.1f}ms, wheel frames {:.1f}ms, load level {:.2f}ms".format(
+        s["importMs"], s["tileImagesMs"], s["wheelFramesMs"], s["loadLevelMs"]))
+    print("{} levels, {} ticks each".format(len(results["levels"]), results["ticks"]))
+    for (name, t) in results["totals"].items():
+        print("  {:8} {:10.0f} ticks/s {:8.3f} ms/draw".format(name, t["ticksPerSec"], t["drawMs"]))
+    if(results["peakMemKB"]!=None):
+        print("Peak memory {:.1f}MB".format(results["peakMemKB"]/1024))
+
+if __name__ == "__main__":
+    args=sys.argv[1:]
+    ticks=BENCH_TICKS
+    outFile=None
+    baselineFile=BASELINE_FILE
+    saveBaseline=False
+    files=[]
+    while(args):
+        a=args.pop(0)
+        if(a=="-t"):
+            ticks=int(args.pop(0))
+        elif(a=="-o"):
+            outFile=args.pop(0)
+        elif(a=="--baseline"):
+            baselineFile=args.pop(0)
+        elif(a=="--save-baseline"):
+            saveBaseline=True
+        else:
+            files.append(a)
+    results=runBench(files, ticks)
+    report(results)
+    if(outFile):
+        with open(outFile, "w") as f:
+            json.dump(results, f, indent=1)
+    regressed=False
+    if(saveBaseline):
+        with open(baselineFile, "w") as f:
+            json.dump(results, f, indent=1)
+        print("Baseline saved to", baselineFile)
+    elif(os.path.exists(baselineFile)):
+        with open(baselineFile) as f:
+            baseline=json.load(f)
+        if(baseline.get("ticks")!=ticks or set(baseline.get("levels", {}))!=set(results["levels"])):
+            print("Baseline {} was run with different levels or ticks".format(baselineFile))
+        print("Compared with {}:".format(baselineFile))
+        for (name, old, new, change, bad) in compare(results, baseline):
+            print("  {:24} {:12.3f} {:12.3f} {:+7.1%}{}".format(name, old, new, change, "  REGRESSION" if bad else ""))
+            regressed=regressed or bad
+    sys.exit(1 if regressed else 0)
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+#
+# bamCheck
+# Checks level files without running the game, so a broken level is found before it is played rather than
+# stopping the game when it is loaded. Levels are checked in parallel in a pool of processes, one level at a
+# time per process, and nothing here imports pygame.
+#
+# Errors stop a level being played or completed:
+#   - Wrong number of rows or tiles in a row, or tile names we don't know
+#   - No south Ts or no wheels
+#   - A south T path that hits a dead end, leaves the board or goes round in a loop
+#   - Wheels no ball can ever reach, or which can never be given four balls of one colour
+# Warnings are things that are allowed, but probably a mistake:
+#   - A plain pipe leading nowhere (blockers and painters at the edge are used to bounce balls back, and the
+#     ends of the top ally are always closed)
+#   - A wheel with no exit a ball can be launched from
+#
+# For each level it also gives the number of wheels, south Ts, painters, blockers and dead ends, and the
+# fewest balls it can be completed with (see bamSolver.py).
+#
+# Usage: python bamCheck.py [-j jobs] [-v] [level.csv | directory ...]
+#   With no files every level in levels/levelList is checked, a directory checks every .csv file in it.
+#   -j sets the number of processes (1 checks in this process), -v lists the metrics for good levels too.
+#   Exits with 1 if any level has errors
+import sys, os, time
+from concurrent.futures import ProcessPoolExecutor
+from bamEngine import readLevel, compileBoard, walkSouthT, levelError
+from bamEngine import TILENAMES, TILE_UNK, TILE_W, TILE_ST, OPENENDS, DIRNAMES, EAST, WEST
+from bamCodec import levelListFiles
+from bamSolver import levelSolver
+
+# Tiles which are plain pipes, anything else with a dead end is there to bounce balls
+PIPES={TILENAMES.index(n) for n in ("H", "V", "SEL", "SWL", "NEL", "NWL")}
+
+def checkLevel(filename):
+    # Check one level file. Returns (filename, errors, warnings, metrics) where metrics is a dictionary,
+    # empty if the level couldn't be read
+    errors=[]
+    warnings=[]
+    metrics={}
+    try:
+        levelData=readLevel(filename)
+    except (levelError, OSError) as e:
+        return (filename, [str(e)], warnings, metrics)
+    (board, exits)=compileBoard(levelData)
+    tilesY=len(levelData)
+    tilesX=len(levelData[0])
+
+    deadEnds=0
+    wheels=[]
+    southTs=[]
+    for y in range(tilesY):
+        for x in range(tilesX):
+            code=board[y*tilesX+x]
+            if(code==TILE_UNK):
+                errors.append("Unknown tile {} at {}".format(levelData[y][x], (x, y)))
+                continue
+            if(code==TILE_W):
+                wheels.append((x, y))
+                continue
+            if(code==TILE_ST and y==0):
+                southTs.append((x, y))
+            # Open ends with nothing open facing them. Balls bounce back from these
+            closed=OPENENDS[code]&~exits[y*tilesX+x]
+            for d in range(4):
+                if((closed>>d)&1):
+                    deadEnds+=1
+                    if(code in PIPES and not (y==0 and (x, d) in ((0, WEST), (tilesX-1, EAST)))):
+                        warnings.append("Dead end going {} from {} at {}".format(DIRNAMES[d], TILENAMES[code],
+                                                                                 (x, y)))
+    metrics["wheels"]=len(wheels)
+    metrics["southTs"]=len(southTs)
+    metrics["painters"]=sum(1 for c in board if c!=TILE_UNK and TILENAMES[c][0]=="P")
+    metrics["blockers"]=sum(1 for c in board if c!=TILE_UNK and TILENAMES[c][0:2] in ("BH", "BV"))
+    metrics["deadEnds"]=deadEnds
+    if(len(wheels)==0):
+        errors.append("No wheels")
+    if(len(southTs)==0):
+        errors.append("No south Ts in the top ally")
+    if(errors):
+        # The south T paths can't be followed
+        return (filename, errors, warnings, metrics)
+
+    # Follow each south T path, and close the wheel slots they lead to, as gameEngine does
+    validExit={w:exits[w[1]*tilesX+w[0]] for w in wheels}
+    for st in southTs:
+        try:
+            (wheel, slot)=walkSouthT(board, levelData, st)
+        except levelError as e:
+            errors.append("South T at {}: {}".format(st, e))
+            continue
+        validExit[wheel]&=~(1<<slot)
+    for w in wheels:
+        if(validExit[w]==0):
+            warnings.append("Wheel at {} has no exits a ball can be launched from".format(w))
+    if(errors):
+        return (filename, errors, warnings, metrics)
+
+    # Where balls can get to
+    solver=levelSolver(levelData)
+    reached={w for (w, c) in solver.ballReach(0)}
+    for w in range(len(solver.wheelIds)):
+        if(w not in reached):
+            errors.append("Wheel at {} can't be reached".format(solver.wheelIds[w]))
+    if(reached and len(reached)==len(solver.wheelIds)):
+        metrics["minBalls"]=solver.lowest()
+        if(metrics["minBalls"]==None):
+            errors.append("Some wheel can never get four balls of one colour")
+    return (filename, errors, warnings, metrics)
+
+def levelFiles(args):
+    # The level files to check from the command line arguments
+    if(len(args)==0):
+        return levelListFiles()
+    files=[]
+    for a in args:
+        if(os.path.isdir(a)):
+            files+=sorted(os.path.join(a, f) for f in os.listdir(a) if f.endswith(".csv"))
+        else:
+            files.append(a)
+    return files
+
+def checkLevels(files, jobs=None):
+    # Check a list of level files, in a pool of jobs processes (None for one per CPU, 1 for none).
+    # Returns the checkLevel() results in the same order as files
+    if(jobs==1 or len(files)<2):
+        return [checkLevel(f) for f in files]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(checkLevel, files, chunksize=max(1, len(files)//(4*(jobs or os.cpu_count() or 1)))))
+
+if __name__ == "__main__":
+    args=sys.argv[1:]
+    jobs=None
+    verbose=False
+    names=[]
+    while(args):
+        a=args.pop(0)
+        if(a=="-j"):
+            jobs=int(args.pop(0))
+        elif(a=="-v"):
+            verbose=True
+        else:
+            names.append(a)
+    start=time.perf_counter()
+    results=checkLevels(levelFiles(names), jobs)
+    bad=0
+    warned=0
+    for (filename, errors, warnings, metrics) in results:
+        if(errors):
+            bad+=1
+        elif(warnings):
+            warned+=1
+        if(errors or warnings or verbose):
+            status="ERROR" if errors else ("WARNING" if warnings else "OK")
+            print("{}: {}".format(filename, " ".join([status]+["{}={}".format(k, v) for k, v in metrics.items()])))
+            for e in errors:
+                print("   error:", e)
+            for w in warnings:
+                print("   warning:", w)
+    print("{} levels, {} with errors, {} with warnings ({:.2f}s)".format(len(results), bad, warned,
+                                                                       time.perf_counter()-start))
+    sys.exit(1 if bad else 0)
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+#
+# bamCodec
+# Reads and writes levels in both formats: the CSV levels the game uses, and the original Bambuzle level files.
+# The game, bam2clone and the level tools all read levels through here. Nothing here imports pygame.
+#
+# An original level file is 240 bytes, in 5 byte blocks with the last byte of each block being the tile. The
+# layout is also sideways, so the first block is the bottom left tile, going up the left hand side to the top
+# left, then up the next column and so on, with the top right tile last. So the tiles are every 5th byte, a
+# column at a time. Decoding and encoding work on the tile bytes with slices, so a file with many levels one
+# after another, or a whole collection of files, is done in one go.
+#
+# Only the tile bytes are kept, encoding writes zeros in the other 4 bytes of each block. So CSV to original and
+# back gives the same level, and original to CSV and back gives the same file as long as those bytes were zero.
+#
+# Usage: python bamCodec.py [level.csv | level ...]
+#   Round trips each level through the other format and reports any that don't come back the same. With no
+#   files every level in levels/levelList is checked
+import sys, os, csv, time
+
+# Tile names, in the order of the codes the original level files use
+TILENAMES=[
+    "B",        # 0 = Blank
+    "H",        # 1 = Horizontal
+    "V",        # 2 = Vertical
+    "SEL",      # 3 = South East corner
+    "SWL",      # 4 = South West corner
+    "NEL",      # 5 = North East corner
+    "NWL",      # 6 = North West corner
+    "W",        # 7 = Wheel
+    "PV.Y",     # 8 = Yellow vertical painter
+    "PV.B",     # 9 = Blue vertical painter
+    "PV.G",     # A = Green vertical painter
+    "PV.R",     # B = Red vertical painter
+    "PH.Y",     # C = Yellow horizontal painter
+    "PH.B",     # D = Blue horizontal painter
+    "PH.G",     # E = Green horizontal painter
+    "PH.R",     # F = Red horizontal painter
+    "BV.Y",     # 10 = Yellow vertical blocker
+    "BV.B",     # 11 = Blue vertical blocker
+    "BV.G",     # 12 = Green vertical blocker
+    "BV.R",     # 13 = Red vertical blocker
+    "BH.Y",     # 14 = Yellow horizontal blocker
+    "BH.B",     # 15 = Blue horizontal blocker
+    "BH.G",     # 16 = Green horizontal blocker
+    "BH.R",     # 17 = Red horizontal blocker
+    "ST",       # 18 = SouthT
+]
+
+# Original level layout
+ROWS=6
+COLS=8
+STRIDE=5
+LEVEL_SIZE=ROWS*COLS*STRIDE
+LEVEL_TILES=ROWS*COLS
+
+# Name for every byte value. Codes that aren't a tile come out as U and the code, and go back to the same code
+CODENAMES=TILENAMES+["U{:02X}".format(v) for v in range(len(TILENAMES), 256)]
+NAMECODES={n:i for i,n in enumerate(CODENAMES)}
+
+LEVEL_DIR="levels"
+LEVEL_LIST_FILE=os.path.join(LEVEL_DIR, "levelList")
+
+class codecError(ValueError):
+    pass
+
+# ************* Original level files **********************
+
+def tileCodes(data, offset=0, count=1):
+    # The tile bytes of count levels one after another from offset in data (bytes, bytearray, memoryview or
+    # mmap), in file order
+    end=offset+count*LEVEL_SIZE
+    if(end>len(data)):
+        raise codecError("{} bytes of level data from {}, not {}".format(len(data)-offset, offset, count*LEVEL_SIZE))
+    return bytes(data[offset+STRIDE-1:end:STRIDE])
+
+def codesToRows(codes):
+    # One level's tile codes, in file order, as rows of tile names
+    return [[CODENAMES[v] for v in codes[ROWS-1-row::ROWS]] for row in range(ROWS)]
+
+def decodeLevel(data, offset=0):
+    # Rows of tile names for the level starting at offset in data
+    return codesToRows(tileCodes(data, offset))
+
+def decodeLevels(data):
+    # Every level in data, which holds any number of levels one after another
+    if(len(data)%LEVEL_SIZE):
+        raise codecError("{} bytes is not a whole number of {} byte levels".format(len(data), LEVEL_SIZE))
+    codes=tileCodes(data, 0, len(data)//LEVEL_SIZE)
+    return [codesToRows(codes[i:i+LEVEL_TILES]) for i in range(0, len(codes), LEVEL_TILES)]
+
+def rowsToCodes(levelData):
+    # One level's rows of tile names as tile codes in file order. Raises codecError for a level that isn't
+    # ROWS by COLS or a tile name we don't know
+    if(len(levelData)!=ROWS or any(len(row)!=COLS for row in levelData)):
+        raise codecError("Level is not {} rows of {} tiles".format(ROWS, COLS))
+    try:
+        # Transposed, then each column is reversed so it runs bottom to top
+        return bytes(NAMECODES[t] for col in zip(*levelData) for t in reversed(col))
+    except KeyError as e:
+        raise codecError("Unknown tile {}".format(e.args[0]))
+
+def encodeLevels(levels):
+    # Any number of levels, as one block of original level data
+    codes=b"".join(rowsToCodes(levelData) for levelData in levels)
+    data=bytearray(len(codes)*STRIDE)
+    data[STRIDE-1::STRIDE]=codes
+    return bytes(data)
+
+def encodeLevel(levelData):
+    return encodeLevels([levelData])
+
+def readOriginal(filename):
+    # All the levels in an original level file
+    with open(filename, "rb") as f:
+        return decodeLevels(f.read())
+
+def writeOriginal(levels, filename):
+    with open(filename, "wb") as f:
+        f.write(encodeLevels(levels))
+
+# ************* CSV levels **********************
+
+def readCSV(filename):
+    # Rows of tile names from a CSV level file, the size isn't checked
+    with open(filename, newline="") as f:
+        return list(csv.reader(f, skipinitialspace=True, delimiter=","))
+
+def csvText(levelData):
+    return "".join(",".join(row)+"\n" for row in levelData)
+
+def writeCSV(levelData, filename):
+    with open(filename, "w") as f:
+        f.write(csvText(levelData))
+
+# ************* Whole collections **********************
+
+def readLevels(files):
+    # Reads many level files of either type. Files ending in .csv are CSV, anything else is an original
+    # level file, which can hold more than one level. Returns a list of (filename, levels)
+    return [(f, [readCSV(f)] if f.endswith(".csv") else readOriginal(f)) for f in files]
+
+def convertLevels(files, outdir, toOriginal=False):
+    # Converts original level files into CSV levels in outdir, or CSV into original files with toOriginal.
+    # A file holding more than one level gives a CSV file for each, numbered. Returns the files written
+    written=[]
+    for (filename, levels) in readLevels(files):
+        base=os.path.splitext(os.path.basename(filename))[0]
+        if(toOriginal):
+            out=os.path.join(outdir, base+".bam")
+            writeOriginal(levels, out)
+            written.append(out)
+            continue
+        for (i, levelData) in enumerate(levels):
+            out=os.path.join(outdir, base+(".csv" if len(levels)==1 else "-{}.csv".format(i)))
+            writeCSV(levelData, out)
+            written.append(out)
+    return written
+
+def roundTrip(levels):
+    # Encodes levels (rows of tile names) in one go and decodes them again. Returns the positions of the
+    # levels that didn't come back the same, or raises codecError if one can't be encoded
+    back=decodeLevels(encodeLevels(levels))
+    return [i for (i, (a, b)) in enumerate(zip(levels, back)) if a!=b]
+
+def levelListFiles():
+    # Level files in play order, from the level list
+    with open(LEVEL_LIST_FILE) as f:
+        return [os.path.join(LEVEL_DIR, l.strip()) for l in f if l.strip()]
+
+if __name__ == "__main__":
+    files=sys.argv[1:] or levelListFiles()
+    start=time.perf_counter()
+    names=[]
+    levels=[]
+    for (filename, fileLevels) in readLevels(files):
+        names+=[filename]*len(fileLevels)
+        levels+=fileLevels
+    try:
+        bad=roundTrip(levels)
+    except codecError as e:
+        print("Error:", e)
+        sys.exit(1)
+    for i in bad:
+        print("{}: doesn't round trip".format(names[i]))
+    print("{} levels, {} bad ({:.3f}s)".format(len(levels), len(bad), time.perf_counter()-start))
+    sys.exit(1 if bad else 0)
@@ -0,0 +1,1220 @@
+# bamEngine
+# The game model for bamclone. Holds the board, balls, wheels, southTs and the level timer and has no
+# dependency on pygame, so a level can be stepped with no window, mixer or rendering. The pygame front
+# end in bamclone.py draws this model and feeds it mouse clicks.
+#
+# The model always works in board units, where a tile is TILESIZE across and (0,0) is the top left
+# corner of the board. Anything the front end needs to know about (sounds, new balls) is queued on
+# gameEngine.events and collected with popEvents()
+#
+# Inside the model, tiles, directions and ball colours are all small integers. The level file is
+# compiled into an array of tile codes when it is loaded, and what a ball does in the middle of a tile
+# is looked up in a table built once at import, rather than worked out from the tile names every tick.
+#
+# There are two ways to move the game on. step() is the normal one, everything moves on by one tick.
+# In analytic mode (gameEngine(..., analytic=True)) each ball works out the next point where something
+# can happen to it (tile middle, tile edge, bounce or docking) and the engine keeps a queue of these
+# events. advanceTo() runs the events up to a time and nextEventTime() says when the next one is, so a
+# headless run can jump from event to event instead of moving balls a pixel at a time.
+#
+# With vectorized=True step() moves the balls with NumPy instead. The positions, directions, colours and tiles of
+# every ball are kept in arrays in a ballStore, and all the balls in flight are moved, bounced, turned and painted
+# with whole array operations each tick. Only docking, south Ts and explosions are done a ball at a time. This is
+# for stress tests and levels with hundreds of balls, for a few balls moving them one at a time is quicker.
+import math, random, heapq
+from array import array
+from bamCodec import TILENAMES, readCSV
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+# Board geometry
+# ==============
+TILESIZE = 120          # The size of individual tiles (square)
+TILESX = 8              # Number of tiles across the X
+TILESY = 6              # Number of tiles across the y
+PWIDTH=TILESIZE//2.5     # Pipe width. Pipes and balls are based on this size
+WHSIZE=TILESIZE*0.9     # Size of a wheel
+BALLSIZE=math.floor(PWIDTH*0.7)
+
+ROTSTEPS=10             # Number of steps to rotate the wheel in
+EXPTIME = 200           # ms for the explosion to appear and the ball finally die
+EXP_NO=23               # Number of explosion frames
+EXP_INTERVAL=EXPTIME/EXP_NO
+
+# Ball colours. In the model a colour is its position in this list, 0=R, 1=G, 2=B, 3=Y
+BALLCOLS = {
+    "R":(255,0,0),
+    "G":(0,255,0),
+    "B":(0,0,255),
+    "Y":(255,255,0)
+}
+COLNAMES=list(BALLCOLS)
+
+# Directions are numbered clockwise from north. Wheel slots use the same numbers
+NORTH=0
+EAST=1
+SOUTH=2
+WEST=3
+DIRNAMES="NESW"
+DX=(0,1,0,-1)           # Tile step in each direction
+DY=(-1,0,1,0)
+
+# Tile codes. These are the same numbers the original Bambuzle level files use (TILENAMES, see bamCodec.py)
+TILECODES={n:i for i,n in enumerate(TILENAMES)}
+TILE_B=TILECODES["B"]
+TILE_W=TILECODES["W"]
+TILE_ST=TILECODES["ST"]
+TILE_UNK=255            # Any tile name we don't know
+
+# List structure of what tiles have open, used to decide if a ball can flow
+openEnds={
+    "N":["V","NEL","NWL","W", "BV", "PV"],
+    "E":["H", "ST", "NEL", "SEL", "W", "BH", "PH"],
+    "S":["V", "SEL", "SWL", "W", "BV", "PV"],
+    "W":["H", "ST", "NWL", "SWL", "W", "BH", "PH"]
+}
+
+# Middle of tile actions, returned in the third place of the MIDDLE table
+MID_NONE=0
+MID_SOUTHT=1            # Drop south if the southT's wheel slot is free
+
+# Player actions, as recorded in gameEngine.actions
+ACT_BALL="L"            # Left click, launch a ball
+ACT_WHEEL="R"           # Right click, turn a wheel
+ACT_EXPLODE="E"         # Test key, explode all balls
+
+# Analytic mode events
+EV_CROSS=0              # Ball crosses into the next tile
+EV_MIDDLE=1             # Ball reaches the middle of a tile
+EV_BOUNCE=2             # Ball hits a dead end and bounces back
+EV_DOCK=3               # Ball reaches a wheel slot
+EV_EXPLODED=4           # Explosion has finished, remove the ball
+EV_ROTATED=5            # Wheel has finished turning
+
+def compileTiles():
+    # Build the lookup tables used to move balls, indexed by tile code
+    #   OPENENDS[code] is a bit mask of the open ends of the tile, bit d for direction d
+    #   MIDDLE[(code*4+dir)*4+colour] is (direction, colour, action) for a ball reaching the middle
+    #     of the tile. A bounce off a blocker just comes back as the opposite direction
+    openMask=[0]*256
+    middle=[None]*(256*16)
+    for code in range(256):
+        if(code<len(TILENAMES)):
+            name=TILENAMES[code]
+        else:
+            name="UNK"
+        # Split tile type, to ignore colours on painters or blockers
+        sp=name.split(".")
+        for d in range(4):
+            if(sp[0] in openEnds[DIRNAMES[d]]):
+                openMask[code]|=1<<d
+        for d in range(4):
+            for c in range(len(COLNAMES)):
+                (nd, nc, act)=(d, c, MID_NONE)
+                if(name=="ST"):
+                    act=MID_SOUTHT
+                elif(name.endswith("L")):
+                    # We are on a corner, change direction
+                    nd=DIRNAMES.index(LotherEnd(name, DIRNAMES[(d+2)%4]))
+                elif(sp[0]=="PH" or sp[0]=="PV"):
+                    # Painter, change the colour of the ball
+                    nc=COLNAMES.index(sp[1])
+                elif(sp[0]=="BH" or sp[0]=="BV"):
+                    # Blocker, do we allow through or bounce?
+                    if(COLNAMES[c]!=sp[1]):
+                        nd=(d+2)%4
+                middle[(code*4+d)*4+c]=(nd, nc, act)
+    return (openMask, middle)
+
+def LotherEnd(type, entry):
+    # Returns the exit direction for a corner based on the entry
+    # String should be of the format 'xyL', check what the first two characters are
+    if(type[0]==entry):
+        r=type[1]
+    else:
+        r=type[0]
+    return r
+
+(OPENENDS, MIDDLE)=compileTiles()
+
+def genDockingSteps():
+    # Every wheel is the same size, so the docking positions for each step of a rotation only need
+    # to be worked out once. Entry 0 is the stationary wheel, entries 1 to ROTSTEPS are the positions
+    # as the wheel turns a quarter turn clockwise. Each entry is indexed by slot direction
+    halftile=math.floor(TILESIZE/2)
+    ballrad=math.floor(BALLSIZE/2)
+    cutdist=math.floor(WHSIZE/2)-ballrad+5
+    orig=(
+        (TILESIZE/2,halftile-cutdist),
+        (halftile+cutdist,TILESIZE/2),
+        (TILESIZE/2,halftile+cutdist),
+        (halftile-cutdist,TILESIZE/2)
+    )
+    steps=[orig]
+    rotdelta=(math.pi/2)/ROTSTEPS
+    for i in range(1, ROTSTEPS+1):
+        ang=rotdelta*i
+        # Calculate position changes
+        h=cutdist
+        xdelta=math.sin(ang)*h
+        ydelta=h-math.cos(ang)*h
+        # Adjust the docking positions, x then y
+        steps.append((
+            (orig[NORTH][0]+xdelta, orig[NORTH][1]+ydelta),
+            (orig[EAST][0]-ydelta, orig[EAST][1]+xdelta),
+            (orig[SOUTH][0]-xdelta, orig[SOUTH][1]-ydelta),
+            (orig[WEST][0]+ydelta, orig[WEST][1]-xdelta)
+        ))
+    return steps
+
+DOCKSTEPS=genDockingSteps()
+
+class levelError(Exception):
+    # Raised when a level file can not be loaded or does not make a playable board
+    pass
+
+# ************* Game classes *******************
+class Ball():
+    # Balls are used again once they have exploded, see gameEngine.addBall()
+    def __init__(self, game, col):
+        self.game=game
+        self.evVer=0            # Bumped when an event is queued, so older queued events are ignored
+        self.gen=0              # Bumped each time the ball is used, so the front end can tell the uses apart
+        self.reset(col)
+
+    def reset(self, col):
+        # Set up as a new ball of colour col coming on to the board
+        game=self.game
+        self.gen+=1
+        self.colour=col
+        self.newBall=True           # Will change to false on first dock/entry ally is free
+        self.direction=WEST         # Use 4 compass points as directions
+        self.wheel=-1               # Will have the number of a wheel if docked, -1 if in motion
+        self.myTile=(-1,-1)         # Track what tile we are on
+        # Centre of the ball. Start just off the right hand side of the top ally
+        self.x=TILESIZE*game.tilesX+BALLSIZE//2
+        self.y=TILESIZE/2
+        self.lastX=self.x           # Where we were at the start of the last tick, for the front end to
+        self.lastY=self.y           # draw between ticks
+        self.hitMiddle=False    # Track if we have been in the middle of the tile yet
+        self.exploState=-1         # < 0 if we are not exploding
+        self.nextExplo=0        # What time do we change the explode graphic?
+        self.alive=True         # False once the ball has exploded and been removed
+        # Used in analytic mode
+        self.target=None        # Where the next event happens
+        self.anchor=None        # Position and time the ball was last placed, for moving between events
+        self.exploStart=0
+
+    def update(self):
+        game=self.game
+        if(self.exploState>=0):
+            self.explode()
+        elif(self.wheel==-1):
+            speed=game.ballSpeed
+            d=self.direction
+            # What tile coord are we in, and what tile type is it?
+            xtile=math.floor(self.x/TILESIZE)
+            # Special case on launch as the ball is off the board
+            if(xtile>=game.tilesX):
+                self.x-=speed
+                return
+
+            ytile=math.floor(self.y/TILESIZE)
+            # Create tuple as useful index
+            tileTup=(xtile, ytile)
+            if(tileTup!=self.myTile):
+                self.hitMiddle=False
+                self.myTile=tileTup
+            cell=ytile*game.tilesX+xtile
+            code=game.board[cell]
+            # Calculate position within the tile
+            xpos=self.x-TILESIZE*xtile
+            ypos=self.y-TILESIZE*ytile
+
+            # Are we over a wheel?
+            if(code==TILE_W):
+                point=(d+2)%4
+                whid=tileTup
+                whdoc=game.wheels[whid].dockingpos[point]
+                # Dock if we have passed the docking location in x or y, but if we are over half way
+                # then we are being released and should not immediately doc
+                if(d==SOUTH and ypos>whdoc[1] and ypos<TILESIZE/2):
+                    # Dock to the north
+                    self.dock(whid, point)
+                elif(d==NORTH and ypos<whdoc[1] and ypos>TILESIZE/2):
+                    # Dock to the south
+                    self.dock(whid, point)
+                elif(d==EAST and xpos>whdoc[0] and xpos<TILESIZE/2):
+                    # Dock to the west
+                    self.dock(whid, point)
+                elif(d==WEST and xpos<whdoc[0] and xpos>TILESIZE/2):
+                    # Dock to the East
+                    self.dock(whid, point)
+            else:
+                atEdge=False
+                # Are we at the tile edge?
+                if(d==WEST and (xpos-BALLSIZE/2)<speed):
+                    atEdge=True
+                elif(d==EAST and (xpos+BALLSIZE/2)>TILESIZE):
+                    atEdge=True
+                elif(d==SOUTH and (ypos+BALLSIZE/2)>TILESIZE):
+                    atEdge=True
+                elif(d==NORTH and (ypos-BALLSIZE/2)<speed):
+                    atEdge=True
+                # Bounce if there is no open tile to move into
+                if(atEdge and not (game.exits[cell]>>d)&1):
+                    d=(d+2)%4
+                    self.hitMiddle=False
+
+                # Are we at the tile middle?
+                if(self.hitMiddle==False):
+                    # Track with hitMiddle, we don't want this executing multiple times. That could be detected.
+                    # If the ball is not moving at 1px per time it may never hit the middle exactly.
+                    # This must reset as we enter a new tile
+                    if(d==WEST and xpos<TILESIZE/2):
+                        self.hitMiddle=True
+                    elif(d==EAST and xpos>TILESIZE/2):
+                        self.hitMiddle=True
+                    elif(d==NORTH and ypos<TILESIZE/2):
+                        self.hitMiddle=True
+                    elif(d==SOUTH and ypos>TILESIZE/2):
+                        self.hitMiddle=True
+                    if(self.hitMiddle):
+                        # Take action on certain tiles, such as corners, painters, blockers or Ts
+                        (nd, self.colour, act)=MIDDLE[(code*4+d)*4+self.colour]
+                        if(act==MID_SOUTHT):
+                            if(game.checkSTopen(self.myTile)):
+                                nd=SOUTH
+                        d=nd
+                    # End of hitMiddle actions
+                self.direction=d
+            # End of 'not on a wheel'
+
+            # Move the ball if in motion
+            d=self.direction
+            if(d==WEST):
+                self.x-=speed
+            elif(d==EAST):
+                self.x+=speed
+            elif(d==NORTH):
+                self.y-=speed
+            elif(d==SOUTH):
+                self.y+=speed
+    # End of update
+
+    def planMove(self):
+        # Analytic mode. Work out the next point where something can happen to this moving ball and
+        # queue an event for when it gets there
+        game=self.game
+        d=self.direction
+        (tx, ty)=self.myTile
+        s=1 if (d==EAST or d==SOUTH) else -1
+        horiz=(d==EAST or d==WEST)
+        if(horiz):
+            pos=self.x-tx*TILESIZE
+        else:
+            pos=self.y-ty*TILESIZE
+        half=TILESIZE/2
+        if(tx>=game.tilesX):
+            # Still coming on to the board from the right
+            (kind, target)=(EV_CROSS, 0)
+        else:
+            cell=ty*game.tilesX+tx
+            code=game.board[cell]
+            if(code==TILE_W and s*(half-pos)>0):
+                # Heading into the wheel, dock at the slot we are coming in to
+                dockpos=DOCKSTEPS[0][(d+2)%4]
+                (kind, target)=(EV_DOCK, dockpos[0] if horiz else dockpos[1])
+            elif(code!=TILE_W and not self.hitMiddle):
+                (kind, target)=(EV_MIDDLE, half)
+            elif((game.exits[cell]>>d)&1):
+                # Open, carry on to the next tile
+                (kind, target)=(EV_CROSS, TILESIZE if s>0 else 0)
+            else:
+                # Dead end, bounce when the edge of the ball reaches the edge of the tile
+                (kind, target)=(EV_BOUNCE, TILESIZE-BALLSIZE/2 if s>0 else BALLSIZE/2)
+        # If we are already past the point it happens now
+        dist=max(0, s*(target-pos))
+        if(horiz):
+            self.target=(self.x+s*dist, self.y)
+        else:
+            self.target=(self.x, self.y+s*dist)
+        self.anchor=(self.x, self.y, game.time)
+        game.schedule(game.time+dist/game.speedPerMs, kind, self)
+
+    def moveEvent(self, kind):
+        # Analytic mode. The ball has reached the point planned by planMove
+        game=self.game
+        d=self.direction
+        (self.x, self.y)=self.target
+        if(kind==EV_CROSS):
+            self.myTile=(self.myTile[0]+DX[d], self.myTile[1]+DY[d])
+            self.hitMiddle=False
+        elif(kind==EV_MIDDLE):
+            # Take action on certain tiles, such as corners, painters, blockers or Ts
+            self.hitMiddle=True
+            code=game.board[self.myTile[1]*game.tilesX+self.myTile[0]]
+            (nd, self.colour, act)=MIDDLE[(code*4+d)*4+self.colour]
+            if(act==MID_SOUTHT):
+                if(game.checkSTopen(self.myTile)):
+                    nd=SOUTH
+            self.direction=nd
+        elif(kind==EV_BOUNCE):
+            self.direction=(d+2)%4
+            self.hitMiddle=False
+        elif(kind==EV_DOCK):
+            self.dock(self.myTile, (d+2)%4)
+            return
+        self.planMove()
+
+    def dock(self, whid, point):
+        # Dock the ball in the wheel
+        self.direction=point
+        self.wheel=whid
+        coord=self.game.wheels[whid].dockBall(self, point)
+        self.setCoord(coord, point)
+        if(self.newBall):
+            # This was a new ball, the top ally is now clear
+            self.newBall=False
+            self.game.launchNext()
+
+    def setCoord(self, coord, docPoint):
+        # Set the coordinate or the ball.
+        # Coord received will be center coords relative to the current tile
+        # docPoint will be the point of the wheel for a docked ball
+        self.x=coord[0]+self.myTile[0]*TILESIZE
+        self.y=coord[1]+self.myTile[1]*TILESIZE
+        if(docPoint!=None):
+            self.direction=docPoint
+
+    def hitTest(self, pos):
+        # Is the board position pos over this ball?
+        h=BALLSIZE/2
+        return abs(pos[0]-self.x)<=h and abs(pos[1]-self.y)<=h
+
+    def launch(self):
+        # Launch a docked ball out of its wheel, if it has a valid exit
+        if(self.wheel!=-1):
+            wheel=self.game.wheels[self.wheel]
+            # Check if I can launch in this direction
+            if(wheel.checkExit(self.direction)):
+                # Yes, all clear
+                wheel.undock(self.direction)
+                # Remove from wheel
+                self.wheel=-1
+                self.game.addEvent("launch")
+                if(self.game.analytic):
+                    self.planMove()
+
+    def explode(self):
+        # Start the explosion in motion or continue the explosion
+        if(self.exploState==-1):
+            # Explosion not started
+            self.exploState=EXP_NO
+            self.nextExplo=0
+            if(self.game.analytic):
+                self.exploStart=self.game.time
+                self.game.schedule(self.game.time+EXPTIME, EV_EXPLODED, self)
+        elif(self.exploState==0):
+            self.exploded()
+        else:
+            # Continue explosion
+            ctime=self.game.time
+            if(ctime>self.nextExplo):
+                # This is the next explosion step
+                self.nextExplo=ctime+EXP_INTERVAL
+                # Drop the explosion counter
+                self.exploState-=1
+
+    def exploded(self):
+        # Explosion effect finished
+        # If we are docked, undock
+        if(self.wheel!=-1):
+            self.game.wheels[self.wheel].undock(self.direction)
+        # And remove
+        self.game.removeBall(self)
+# End of Ball class
+
+# ************* Vectorized balls *******************
+# Things ballStore.oneAtATime() does
+DO_EXPLODE=0
+DO_DOCK=1
+DO_SOUTHT=2
+
+def storeField(name, kind):
+    # A Ball attribute kept in the ballStore array of the same name
+    def get(self):
+        return kind(getattr(self.store, name)[self.slot])
+    def set(self, value):
+        getattr(self.store, name)[self.slot]=value
+    return property(get, set)
+
+class storedBall(Ball):
+    # A Ball whose position, direction, colour and tile are kept in the game's ballStore, at index slot. It works
+    # the same as any other Ball, but ballStore.step() moves it along with all the others
+    x=storeField("x", float)
+    y=storeField("y", float)
+    lastX=storeField("lastX", float)
+    lastY=storeField("lastY", float)
+    direction=storeField("direction", int)
+    colour=storeField("colour", int)
+    hitMiddle=storeField("hitMiddle", bool)
+    exploState=storeField("exploState", int)
+    nextExplo=storeField("nextExplo", float)
+
+    def __init__(self, game, col):
+        self.store=game.store
+        self.slot=self.store.add(self)
+        Ball.__init__(self, game, col)
+
+    def reset(self, col):
+        Ball.reset(self, col)
+        # Balls are updated in the order they were put on the board, as in gameEngine.balls
+        self.store.order[self.slot]=self.store.added
+        self.store.added+=1
+
+    @property
+    def myTile(self):
+        return (int(self.store.tileX[self.slot]), int(self.store.tileY[self.slot]))
+
+    @myTile.setter
+    def myTile(self, tile):
+        (self.store.tileX[self.slot], self.store.tileY[self.slot])=tile
+
+    # Which balls are in flight is kept up to date in the store, from these
+    @property
+    def wheel(self):
+        return self._wheel
+
+    @wheel.setter
+    def wheel(self, whid):
+        self._wheel=whid
+        self.store.docked[self.slot]=whid!=-1
+
+    @property
+    def alive(self):
+        return self._alive
+
+    @alive.setter
+    def alive(self, alive):
+        self._alive=alive
+        self.store.alive[self.slot]=alive
+# End of storedBall class
+
+class ballStore():
+    # Arrays of everything about the balls that changes as they move, indexed by storedBall.slot. Balls are
+    # never taken out, exploded ones are used again (see gameEngine.addBall()), so slots are never freed
+    FIELDS=(("x", "f8"), ("y", "f8"), ("lastX", "f8"), ("lastY", "f8"), ("direction", "i1"), ("colour", "i1"),
+            ("tileX", "i4"), ("tileY", "i4"), ("hitMiddle", "?"), ("exploState", "i2"), ("nextExplo", "f8"),
+            ("docked", "?"), ("alive", "?"), ("order", "i8"))
+
+    def __init__(self, game, size=64):
+        self.game=game
+        self.count=0
+        self.added=0
+        self.balls=[]
+        for (name, dtype) in self.FIELDS:
+            setattr(self, name, numpy.zeros(size, dtype))
+        self.board=numpy.frombuffer(game.board, numpy.uint8).astype(numpy.intp)
+        self.exits=numpy.frombuffer(game.exits, numpy.uint8).astype(numpy.intp)
+        # MIDDLE split into arrays, and the wheel docking positions for each tile and slot, see move()
+        self.midDir=numpy.array([m[0] for m in MIDDLE], numpy.intp)
+        self.midCol=numpy.array([m[1] for m in MIDDLE], numpy.intp)
+        self.midAct=numpy.array([m[2] for m in MIDDLE], numpy.intp)
+        self.dockAlong=numpy.zeros(len(game.board)*4)
+        # Indexed by direction
+        self.dx=numpy.array(DX, numpy.intp)
+        self.dy=numpy.array(DY, numpy.intp)
+        self.horiz=numpy.array([d==EAST or d==WEST for d in range(4)])
+        self.sign=numpy.array([DX[d]+DY[d] for d in range(4)], numpy.intp)
+        self.opposite=numpy.array([(d+2)%4 for d in range(4)], numpy.intp)
+        for w in game.wheels.values():
+            self.placeDocks(w)
+
+    def add(self, ball):
+        # A slot for a new ball, growing the arrays if they are full
+        if(self.count==len(self.x)):
+            for (name, dtype) in self.FIELDS:
+                a=getattr(self, name)
+                setattr(self, name, numpy.concatenate((a, numpy.zeros(len(a), dtype))))
+        self.balls.append(ball)
+        self.count+=1
+        return self.count-1
+
+    def startTick(self):
+        n=self.count
+        self.lastX[:n]=self.x[:n]
+        self.lastY[:n]=self.y[:n]
+
+    def step(self):
+        # Move every ball one tick, with the same result as Ball.update() one at a time. The balls in flight
+        # all move together and explosions carry on together, apart from the few that need the wheels, see
+        # oneAtATime()
+        game=self.game
+        n=self.count
+        alive=self.alive[:n]
+        state=self.exploState[:n]
+        # Finished explosions undock their balls
+        todo=[(s, DO_EXPLODE, None) for s in numpy.flatnonzero(alive & (state==0))]
+        going=numpy.flatnonzero(alive & (state>0) & (game.time>self.nextExplo[:n]))
+        self.nextExplo[going]=game.time+EXP_INTERVAL
+        self.exploState[going]-=1
+        moving=numpy.flatnonzero(alive & ~self.docked[:n] & (state<0))
+        if(moving.size):
+            todo+=self.move(moving)
+        self.oneAtATime(todo)
+
+    def move(self, idx):
+        # Move the balls in slots idx, which are in flight. Works along the direction each ball is going, with
+        # sign +1 going east or south and -1 going west or north, so each test is one comparison for all four
+        # directions. Returns what has to be done one at a time for oneAtATime()
+        game=self.game
+        speed=game.ballSpeed
+        half=TILESIZE/2
+        x=self.x[idx]
+        y=self.y[idx]
+        d=self.direction[idx].astype(numpy.intp)
+        xtile=numpy.floor(x/TILESIZE).astype(numpy.intp)
+        # Balls still coming on to the board from the right only move left
+        off=xtile>=game.tilesX
+        if(off.any()):
+            self.x[idx[off]]-=speed
+            on=~off
+            (idx, x, y, d, xtile)=(idx[on], x[on], y[on], d[on], xtile[on])
+            if(idx.size==0):
+                return []
+        ytile=numpy.floor(y/TILESIZE).astype(numpy.intp)
+        # hitMiddle is reset on entering a tile
+        hm=self.hitMiddle[idx] & (self.tileX[idx]==xtile) & (self.tileY[idx]==ytile)
+        self.tileX[idx]=xtile
+        self.tileY[idx]=ytile
+        cell=ytile*game.tilesX+xtile
+        code=self.board[cell]
+        horiz=self.horiz[d]
+        along=numpy.where(horiz, x, y)-TILESIZE*numpy.where(horiz, xtile, ytile)
+        sign=self.sign[d]
+
+        # Over a wheel, dock once past the docking position, unless over half way and so being launched
+        onWheel=code==TILE_W
+        point=self.opposite[d]
+        dock=onWheel & (sign*(along-self.dockAlong[cell*4+point])>0) & (sign*(half-along)>0)
+
+        # Bounce at the edge of a tile with no way on
+        atEdge=numpy.where(sign>0, along+BALLSIZE/2>TILESIZE, along-BALLSIZE/2<speed)
+        bounce=~onWheel & atEdge & (((self.exits[cell]>>d)&1)==0)
+        d=numpy.where(bounce, point, d)
+        sign=numpy.where(bounce, -sign, sign)
+        hm&=~bounce
+
+        # Turn, paint or block at the middle of the tile
+        mid=~onWheel & ~hm & (sign*(along-half)>0)
+        hm|=mid
+        colour=self.colour[idx].astype(numpy.intp)
+        k=(code*4+d)*4+colour
+        newDir=self.midDir[k]
+        southT=mid & (self.midAct[k]==MID_SOUTHT)
+        self.colour[idx]=numpy.where(mid, self.midCol[k], colour)
+        self.hitMiddle[idx]=hm
+        d=numpy.where(mid, newDir, d)
+
+        # Move, except the balls docking or at a south T
+        move=~(dock | southT)
+        m=idx[move]
+        dm=d[move]
+        self.direction[m]=dm
+        self.x[m]=x[move]+speed*self.dx[dm]
+        self.y[m]=y[move]+speed*self.dy[dm]
+        todo=[(idx[j], DO_DOCK, ((int(xtile[j]), int(ytile[j])), int(point[j]))) for j in numpy.flatnonzero(dock)]
+        todo+=[(idx[j], DO_SOUTHT, ((int(xtile[j]), int(ytile[j])), int(newDir[j]))) for j in numpy.flatnonzero(southT)]
+        return todo
+
+    def placeDocks(self, wheel):
+        # Where each of a wheel's docking positions is along the way into its slot. Called when the wheel moves
+        c=(wheel.id[1]*self.game.tilesX+wheel.id[0])*4
+        self.dockAlong[c:c+4]=[p[0] if self.horiz[d] else p[1] for (d, p) in enumerate(wheel.dockingpos)]
+
+    def oneAtATime(self, todo):
+        # Explosions, docking and south Ts change the wheels, so they are done one ball at a time in the order
+        # Ball.update() would do them, the order the balls were put on the board. todo is a list of
+        # (slot, what, args). Docking can set off other balls, which still explode this tick if they come later
+        if(not todo):
+            return
+        game=self.game
+        speed=game.ballSpeed
+        todo=[(self.order[s], s, what, args) for (s, what, args) in todo]
+        heapq.heapify(todo)
+        done=set()
+        while(todo):
+            (order, s, what, args)=heapq.heappop(todo)
+            if(s in done):
+                continue
+            done.add(s)
+            b=self.balls[s]
+            if(what==DO_EXPLODE):
+                if(b.alive and b.exploState>=0):
+                    b.explode()
+                continue
+            if(what==DO_DOCK):
+                b.dock(*args)
+                for other in game.wheels[args[0]].docked+[b]:
+                    if(other!=None and other.exploState>=0 and self.order[other.slot]>order):
+                        heapq.heappush(todo, (self.order[other.slot], other.slot, DO_EXPLODE, None))
+            else:
+                # Drop south if the wheel slot is free, otherwise carry on
+                (tile, d)=args
+                b.direction=SOUTH if game.checkSTopen(tile) else d
+            # Move on this tick, as in Ball.update(). Docked balls move too
+            b.x+=speed*DX[b.direction]
+            b.y+=speed*DY[b.direction]
+# End of ballStore class
+
+class Wheel():
+    def __init__(self, game, id):
+        self.game=game
+        self.id=id
+        self.rotating=False         # Track if we are rotating
+        self.rotstep=0              # How far through the rotation we are
+        self.posStep=0              # Which entry of DOCKSTEPS the docking positions are from
+        self.blown=False
+        self.docked=[None,None,None,None]       # Ball in each slot, indexed by direction
+        self.numDocked=0
+        self.changes=0              # Bumped whenever the look of the wheel changes, for the front end
+        self.evVer=0                # Analytic mode, see Ball
+        self.rotStart=0
+        # Docking positions for drawing the balls and doing cutouts. These are shared between all
+        # wheels, so are never changed, only swapped for the next step
+        self.dockingOrig=DOCKSTEPS[0]
+        self.dockingpos=self.dockingOrig
+
+        # Determine which exits are valid and do not allow ball launch if not
+        # i.e. a wheel that goes to a southT or nowhere. Worked out when the level is compiled
+        exits=game.level.wheels[id]
+        self.validExit=[bool((exits>>d)&1) for d in range(4)]
+    # End of init
+
+    def update(self):
+        if(self.rotating):
+            self.rotstep+=1
+            if(self.rotstep<=ROTSTEPS):
+                # Look up the docking positions for this step
+                self.setStep(self.rotstep)
+            else:
+                self.rotated()
+    # End of update
+
+    def setStep(self, step):
+        # Move the docking positions, and the docked balls with them, to a step of the rotation
+        self.posStep=step
+        self.dockingpos=DOCKSTEPS[step]
+        self.placeBalls()
+        if(self.game.store!=None):
+            self.game.store.placeDocks(self)
+
+    def rotated(self):
+        # Finished turning
+        self.rotating=False
+        self.game.turning.pop(self.id, None)
+        # Rotate the array of docked balls, each moves one slot clockwise
+        self.docked=[self.docked[WEST]]+self.docked[:WEST]
+        # Reset the docking positions to the original
+        self.setStep(0)
+
+    def placeBalls(self):
+        # Sets the position of any docked balls to match the docking positions
+        for d in range(4):
+            if(self.docked[d]!=None):
+                self.docked[d].setCoord(self.dockingpos[d], d)
+        self.changes+=1
+
+    def rotate(self):
+        # Start the wheel turning
+        self.rotating=True
+        self.game.turning[self.id]=self
+        self.rotstep=0
+        self.game.addEvent("woosh")
+        if(self.game.analytic):
+            # The tick after the last step of the rotation
+            self.rotStart=self.game.time
+            self.game.schedule(self.game.time+(ROTSTEPS+1)*self.game.tickTime, EV_ROTATED, self)
+
+    def emptyMask(self):
+        # Bit mask of the empty slots, bit d for direction d
+        m=0
+        for d in range(4):
+            if(self.docked[d]==None):
+                m|=1<<d
+        return m
+
+    def slotEmpty(self, d):
+        # Is there a ball in slot d? True if empty, false if there is a ball
+        if(self.docked[d]==None):
+            return True
+        else:
+            return False
+
+    def dockBall(self, ball, point):
+        # Dock the ball and return coordinates for docking point
+        game=self.game
+        # Is there already another ball docked here?
+        if(self.docked[point]!=None):
+            # Yes, explode both
+            self.docked[point].explode()
+            ball.explode()
+            # The explosion undocks and decreases the counter at the end
+            game.addEvent("explode")
+        else:
+            self.docked[point]=ball
+            self.numDocked+=1
+            game.addEvent("dock")
+        # Are we full?
+        if(self.numDocked==4):
+            # Yes
+            # What colour is north?
+            c=self.docked[NORTH].colour
+            sameCol=True
+            for b in self.docked:
+                # Is this the same colour? (North obviously will be)
+                if(b.colour!=c):
+                    sameCol=False
+            if(sameCol==True):
+                # All the same colour, explode
+                game.addEvent("explode")
+                for b in self.docked:
+                    b.explode()
+                    # Has this already been blown?
+                    if(self.blown==False):
+                        self.blown=True
+                        game.blownWheels+=1
+                        # Game over is tracked in the game step
+        self.changes+=1
+        return self.dockingOrig[point]
+
+    def checkExit(self, point):
+        # Does this point contain a valid exit from the wheel?
+        return self.validExit[point]
+
+    def undock(self, point):
+        # Ball has been launched or exploded, drop reference to it
+        # The slot might be none if the first of two balls has already exploded
+        if(self.docked[point]!=None):
+            self.docked[point]=None
+            self.numDocked-=1
+            self.changes+=1
+
+    def setInvalid(self, point):
+        # Mark an exit point as invalid
+        self.validExit[point]=False
+
+    def hitTest(self, pos):
+        # Is the board position pos over this wheel's tile?
+        x=self.id[0]*TILESIZE
+        y=self.id[1]*TILESIZE
+        return pos[0]>=x and pos[0]<x+TILESIZE and pos[1]>=y and pos[1]<y+TILESIZE
+
+# End of Wheel class
+
+class SouthT():
+    # southT class. These are special, used to drop balls from the top gully. There are a few rules:
+    # - Balls will not drop if the wheel at the end of the T has a docked ball facing it
+    # - Balls can not be ejected from the wheel in the direction of a southT
+    #
+    # I believe the original game had southTs mapping directly to wheels, but we need to permit
+    # something more interesting
+    def __init__(self, game, id):
+        self.game=game
+        self.id=id      # ID is sent as a tuple of the tile coordinates
+        # The wheel, and which slot in the wheel it checks. Found when the level is compiled
+        (self.linkedWheel, self.wheelLoc)=game.level.southTs[id]
+        game.wheels[self.linkedWheel].setInvalid(self.wheelLoc)
+    # End of init
+
+    def isOpen(self):
+        # Return if the path is open
+        return self.game.wheels[self.linkedWheel].slotEmpty(self.wheelLoc)
+
+# End of southT class
+
+class gameEngine():
+    # One level being played. Step it once per game tick with step()
+    #
+    # state:
+    #   0 = running
+    #   1 = finished, success
+    #   2 = finished, failure/time out
+    def __init__(self, levelData, ballSpeed=2, levelTime=150, fps=120, ballLimit=-1, analytic=False, seed=None,
+                 compiled=None, vectorized=False):
+        # compiled is the compiledLevel for levelData if we already have it, from a level pack say. vectorized
+        # keeps the balls in a ballStore, it is ignored in analytic mode or without NumPy
+        if(compiled==None):
+            compiled=compileLevel(levelData)
+        self.level=compiled
+        self.levelData=levelData
+        self.tilesY=len(levelData)
+        self.tilesX=len(levelData[0])
+        self.ballSpeed=ballSpeed        # Board units to move per tick
+        self.tickTime=1000/fps          # ms of game time per tick
+        self.ballLimit=ballLimit        # -1 for infinite balls
+        self.levelTime=levelTime*1000   # How long the level has in ms
+        self.time=0                     # ms of game time played, does not advance while paused
+        self.timeLeft=self.levelTime
+        self.ticks=0
+        self.paused=False
+        self.state=0
+        self.winTime=-1                 # Time to declare the level won, allows explosions to finish
+        self.ballCount=0                # Track the number of balls released
+        self.blownWheels=0
+        self.balls=[]
+        self.ballPool=[]                # Exploded balls, to be used again
+        self.events=[]
+        self.nextCol=None
+        # Ball colours come from our own random generator, so a game can be played again from its seed
+        if(seed==None):
+            seed=random.randrange(1<<32)
+        self.seed=seed
+        self.rng=random.Random(seed)
+        self.actions=[]                 # Player input as (tick, action, x, y), see bamReplay.py
+        self.analytic=analytic
+        self.speedPerMs=ballSpeed*fps/1000      # Analytic mode ball speed
+        self.queue=[]                   # Analytic mode event queue, a heap of (time, order, kind, object, version)
+        self.queued=0
+        self.board=compiled.board
+        self.exits=compiled.exits
+        self.store=None
+
+        # Initialise wheels and south Ts
+        self.wheels={}
+        self.turning={}                 # Wheels part way through a turn, by tile. Only these are updated
+        self.southTs={}
+        for id in compiled.wheels:
+            self.wheels[id]=Wheel(self, id)
+        self.numWheels=len(self.wheels)
+        for id in compiled.southTs:
+            self.southTs[id]=SouthT(self, id)
+        if(vectorized and not analytic and numpy!=None):
+            self.store=ballStore(self)
+    # End of init
+
+    def start(self):
+        # Add a ball to get us started and pick the one to follow
+        self.addBall(self.nextBall())
+        self.nextCol=self.nextBall()
+        self.addEvent("launch")
+
+    def step(self):
+        # Advance the game by one tick
+        if(self.paused or self.state!=0):
+            return
+        self.ticks+=1
+        if(self.store!=None):
+            self.store.startTick()
+        else:
+            for b in self.balls:
+                b.lastX=b.x
+                b.lastY=b.y
+        if(self.analytic):
+            self.advanceTo(self.time+self.tickTime)
+            return
+        self.time+=self.tickTime
+        for w in list(self.turning.values()):
+            w.update()
+        if(self.store!=None):
+            self.store.step()
+        else:
+            for b in list(self.balls):
+                b.update()
+
+        self.timeLeft=self.levelTime-self.time
+        if(self.timeLeft<=0):
+            # Out of time
+            self.state=2
+        # Check to see if all wheels are blown
+        if(self.blownWheels==self.numWheels):
+            # Delay for a little to finish the ball explode annimation
+            if(self.winTime==-1):
+                self.winTime=self.time+EXPTIME+300
+            if(self.time>self.winTime):
+                self.state=1
+
+    def schedule(self, t, kind, obj):
+        # Analytic mode. Queue an event for a ball or wheel, replacing any it already has queued
+        obj.evVer+=1
+        self.queued+=1
+        heapq.heappush(self.queue, (t, self.queued, kind, obj, obj.evVer))
+
+    def nextEventTime(self):
+        # Analytic mode. Game time of the next thing that will happen, which may be the end of the level
+        q=self.queue
+        # Drop any events which have been replaced
+        while(q and q[0][4]!=q[0][3].evVer):
+            heapq.heappop(q)
+        t=self.levelTime
+        if(q and q[0][0]<t):
+            t=q[0][0]
+        if(self.winTime!=-1 and self.winTime<t):
+            t=self.winTime
+        return max(t, self.time)
+
+    def advanceTo(self, t):
+        # Analytic mode. Run all the queued events up to game time t, then put balls and wheels where
+        # they should be at that time
+        if(self.paused or self.state!=0):
+            return
+        q=self.queue
+        end=min(t, self.levelTime)
+        while(q and q[0][0]<=end):
+            (et, order, kind, obj, ver)=heapq.heappop(q)
+            if(ver!=obj.evVer):
+                # Replaced by a later event
+                continue
+            self.time=max(self.time, et)
+            if(kind==EV_EXPLODED):
+                obj.exploded()
+            elif(kind==EV_ROTATED):
+                obj.rotated()
+            else:
+                obj.moveEvent(kind)
+            if(self.blownWheels==self.numWheels and self.winTime==-1):
+                # Delay for a little to finish the ball explode annimation
+                self.winTime=self.time+EXPTIME+300
+        self.time=max(self.time, t)
+
+        # Positions between events, only needed for drawing and clicks
+        for w in self.turning.values():
+            if(w.rotating):
+                step=min(ROTSTEPS, int((self.time-w.rotStart)/self.tickTime))
+                if(step!=w.posStep):
+                    w.setStep(step)
+        for b in self.balls:
+            if(b.exploState>=0):
+                b.exploState=max(0, EXP_NO-1-int((self.time-b.exploStart)/EXP_INTERVAL))
+            elif(b.wheel==-1):
+                (ax, ay, at)=b.anchor
+                dist=(self.time-at)*self.speedPerMs
+                b.x=ax+DX[b.direction]*dist
+                b.y=ay+DY[b.direction]*dist
+
+        self.timeLeft=self.levelTime-self.time
+        if(self.timeLeft<=0):
+            # Out of time
+            self.state=2
+        if(self.winTime!=-1 and self.time>=self.winTime):
+            self.state=1
+
+    def addEvent(self, name, obj=None):
+        # Queue something for the front end, such as a sound to play
+        self.events.append((name, obj))
+
+    def popEvents(self):
+        # Return and clear the queued events
+        e=self.events
+        self.events=[]
+        return e
+
+    def addBall(self, col):
+        # Exploded balls are used again, so a long game doesn't keep making new ones
+        if(self.ballPool):
+            b=self.ballPool.pop()
+            b.reset(col)
+        elif(self.store!=None):
+            b=storedBall(self, col)
+        else:
+            b=Ball(self, col)
+        self.balls.append(b)
+        self.addEvent("newBall", b)
+        if(self.analytic):
+            # Coming on to the board from the right of the top ally
+            b.myTile=(self.tilesX, 0)
+            b.planMove()
+        return b
+
+    def removeBall(self, ball):
+        # Anything still queued for the ball is dropped, it may have been blown up part way through its explosion
+        ball.alive=False
+        ball.evVer+=1
+        self.balls.remove(ball)
+        self.ballPool.append(ball)
+
+    def nextBall(self):
+        # Pick a random colour for the next ball
+        r=self.rng.randrange(len(COLNAMES))
+        self.addEvent("nextBall", r)
+        return r
+
+    def launchNext(self):
+        # Launch the next ball and pick the one to come after
+        if(self.ballCount>=self.ballLimit-1 and self.ballLimit!=-1):
+            print("Ball limit reached")
+        else:
+            self.addBall(self.nextCol)
+            self.nextCol=self.nextBall()
+            self.ballCount+=1
+
+    def checkSTopen(self, tile):
+        # Check if a tile is open to the south - is the associated wheel slot free?
+        return self.southTs[tile].isOpen()
+
+    def wheelAt(self, pos):
+        # The wheel on the tile under board position pos, or None. Wheels are keyed by tile so this is a
+        # straight look up, whatever the size of the board
+        return self.wheels.get((int(pos[0]//TILESIZE), int(pos[1]//TILESIZE)))
+
+    def clickBall(self, pos):
+        # Left click at board position pos. Launch the ball if it is docked
+        # Returns true if a docked ball was under the click
+        if(self.paused):
+            return False
+        self.actions.append((self.ticks, ACT_BALL, pos[0], pos[1]))
+        # Only docked balls can be launched, and they are always inside their wheel's tile, so just
+        # check the slots of the wheel under the click
+        w=self.wheelAt(pos)
+        if(w==None):
+            return False
+        for b in w.docked:
+            if(b!=None and b.hitTest(pos)):
+                b.launch()
+                return True
+        return False
+
+    def clickWheel(self, pos):
+        # Right click at board position pos, turn any wheel under it
+        if(self.paused):
+            return
+        self.actions.append((self.ticks, ACT_WHEEL, pos[0], pos[1]))
+        w=self.wheelAt(pos)
+        if(w!=None):
+            w.rotate()
+
+    def explodeAll(self):
+        # Test explode function, explode all balls, except the one in the top ally
+        self.actions.append((self.ticks, ACT_EXPLODE, 0, 0))
+        for b in self.balls:
+            if(b.newBall==False):
+                b.explode()
+
+    def levelScore(self, dm):
+        # Score for a completed level, with difficulty multiplier dm
+        ballScore=100-(self.ballCount-self.numWheels*4)
+        if(ballScore<0):
+            ballScore=0
+        timeScore=int(self.timeLeft/1000)
+        return (ballScore+timeScore)*dm
+
+# End of gameEngine class
+
+# ************* Functions **********************
+
+def readLevel(filename):
+    # Loads the level from file, returning a list of rows of tile names. Levels can be any size, as long as
+    # every row is the same length. The original levels are TILESX by TILESY
+    levelData=readCSV(filename)
+    if(len(levelData)==0 or len(levelData[0])==0):
+        raise levelError("Error: Level file {} is empty".format(filename))
+    width=len(levelData[0])
+    for (lineCount, row) in enumerate(levelData):
+        l=len(row)
+        if(l!=width):
+            raise levelError("Error: In level file {}, line {} contains {} tiles, not {}".format(filename, lineCount, l, width))
+    return levelData
+
+def walkSouthT(board, levelData, id):
+    # Walk the path down from the south T on tile id until we find a wheel. Returns the wheel's tile and
+    # the slot the path arrives at, raises levelError if the path is broken
+    tilesX=len(levelData[0])
+    tilesY=len(levelData)
+    tilex=id[0]         # What tile are we on?
+    tiley=id[1]
+    entrydir=WEST       # Which direction did we enter from? Doesn't really matter for a T
+    visited=set()       # Cells on the path, a path coming back to one goes round in a loop
+    while(True):
+        code=board[tiley*tilesX+tilex]
+        # Find the exit
+        if(code==TILE_ST):
+            # Special case, first tile, we should never encounter another one
+            exit=SOUTH
+        else:
+            # All tiles should have one entry and one exit
+            ends=OPENENDS[code]
+            if(code==TILE_UNK):
+                raise levelError("Unknown tile type {}".format(levelData[tiley][tilex]))
+            if(ends==0):
+                raise levelError("Problem. SouthT leads to a dead end. This is not a valid level")
+            elif(bin(ends).count("1")!=2):
+                raise levelError("Problem, we found the wrong number of open ends {}".format(listOpenEnds(code)))
+            # Which end do we look at? If we entered from one end leave by the other
+            if((ends>>entrydir)&1):
+                ends&=~(1<<entrydir)
+            exit=(ends&-ends).bit_length()-1
+
+        tilex+=DX[exit]
+        tiley+=DY[exit]
+        # Have we exceeded limits?
+        if(tilex<0 or tiley<0 or tilex>=tilesX or tiley>=tilesY):
+            raise levelError("Error, ST path took us off screen")
+        # What direction do we enter the tile from?
+        entrydir=(exit+2)%4
+        # Looks good, is the next tile a wheel?
+        if(board[tiley*tilesX+tilex]==TILE_W):
+            # Yes
+            break
+        cell=tiley*tilesX+tilex
+        if(cell in visited):
+            raise levelError("Error: Unable to find wheel, infinite loop from tile {}".format(id))
+        visited.add(cell)
+    # End of wheel while loop
+    return ((tilex, tiley), entrydir)
+
+def compileBoard(levelData):
+    # Turn rows of tile names into a flat array of tile codes, indexed by y*width+x, plus an array of
+    # bit masks saying which directions a ball can leave each tile into an open neighbouring tile
+    h=len(levelData)
+    w=len(levelData[0])
+    board=array("B", [TILECODES.get(t, TILE_UNK) for row in levelData for t in row])
+    exits=array("B", bytes(w*h))
+    for y in range(h):
+        for x in range(w):
+            m=0
+            for d in range(4):
+                nx=x+DX[d]
+                ny=y+DY[d]
+                if(nx>=0 and ny>=0 and nx<w and ny<h):
+                    # Is the end facing us open?
+                    if((OPENENDS[board[ny*w+nx]]>>((d+2)%4))&1):
+                        m|=1<<d
+            exits[y*w+x]=m
+    return (board, exits)
+
+class compiledLevel():
+    # A level turned into what the game needs to start playing it, with no names to look up or paths to
+    # follow. Made by compileLevel(), or read from a level pack (see bamPack.py)
+    def __init__(self, levelData, board, exits, wheels, southTs):
+        self.levelData=levelData        # Rows of tile names, for drawing
+        self.tilesY=len(levelData)
+        self.tilesX=len(levelData[0])
+        self.board=board                # Tile codes and open exits, see compileBoard()
+        self.exits=exits
+        self.wheels=wheels              # Wheel tile: bit mask of the exits a ball can be launched from
+        self.southTs=southTs            # South T tile: (wheel tile, slot), see walkSouthT()
+# End of compiledLevel class
+
+def compileLevel(levelData):
+    # Compile rows of tile names into a compiledLevel. Raises levelError if a south T path is broken
+    (board, exits)=compileBoard(levelData)
+    w=len(levelData[0])
+    wheels={}
+    for i in range(len(board)):
+        if(board[i]==TILE_W):
+            wheels[(i%w, i//w)]=exits[i]
+    # South Ts in the top ally, balls can't be launched back up them
+    southTs={}
+    for x in range(w):
+        if(board[x]==TILE_ST):
+            (wheel, slot)=walkSouthT(board, levelData, (x, 0))
+            southTs[(x, 0)]=(wheel, slot)
+            wheels[wheel]&=~(1<<slot)
+    return compiledLevel(levelData, board, exits, wheels, southTs)
+
+def listOpenEnds(code):
+    # Lists the names of the ends open for a tile code
+    return [DIRNAMES[d] for d in range(4) if (OPENENDS[code]>>d)&1]
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+#
+# bamHost
+# Runs many headless games at once in one process, for bot tournaments and load testing. Everything about a game
+# is kept in its gameEngine, so any number can be played side by side. A gameSession is one game and the bot
+# playing it, and a gameHost plays its sessions as asyncio tasks, each one running HOST_SLICE ticks and then
+# letting the others have a turn. Sessions can run flat out, or in real time with game time kept in step with the
+# clock, as they would be for players.
+#
+# Each level is compiled once (or loaded from the level pack) and every session on it shares the compiledLevel and
+# its rows of tile names, which the engine only reads. A session holds just its own balls, wheels and south Ts.
+# Nothing here imports pygame.
+#
+# A bot is a function bot(session) called every botEvery ticks, which plays by calling clickBall(), clickWheel()
+# and so on on session.game. randomBot() clicks at random, using the session's own generator so a session with
+# the same seed plays the same game.
+#
+# Usage: python bamHost.py [-n sessions] [-t ticks] [-s seed] [--realtime] [--analytic] [--mem] [level.csv ...]
+#   Plays n sessions (default HOST_SESSIONS) shared out over the levels, every level in levels/levelList if none
+#   are given, and prints how they did. -t stops each session after that many ticks, --mem reports the memory used
+import sys, os, time, random, asyncio
+from bamEngine import gameEngine, compileLevel, readLevel, levelError, TILESIZE
+from bamCodec import LEVEL_DIR, levelListFiles
+from bamPack import levelPack, packIsCurrent, PACK_FILE
+
+HOST_SLICE=120              # Ticks a session runs before letting the others have a turn, a second of game time
+HOST_SESSIONS=100
+BOT_EVERY=30                # Ticks between a bot's moves
+
+def randomBot(session):
+    # Turn a random wheel, or launch a ball from one
+    game=session.game
+    w=game.wheels[session.rng.choice(session.wheelIds)]
+    pos=((w.id[0]+0.5)*TILESIZE, (w.id[1]+0.5)*TILESIZE)
+    if(session.rng.random()<0.5):
+        game.clickWheel(pos)
+        return
+    for b in w.docked:
+        if(b!=None):
+            game.clickBall((b.x, b.y))
+            return
+
+class gameSession():
+    def __init__(self, level, seed=None, bot=randomBot, botEvery=BOT_EVERY, maxTicks=None, **params):
+        # level is a compiledLevel, shared with the other sessions on it. params go to gameEngine (ballSpeed,
+        # levelTime, fps, ballLimit, analytic)
+        self.game=gameEngine(level.levelData, seed=seed, compiled=level, **params)
+        self.rng=random.Random(self.game.seed)
+        self.wheelIds=sorted(self.game.wheels)
+        self.bot=bot
+        self.botEvery=botEvery
+        self.maxTicks=maxTicks
+        self.game.start()
+        self.game.popEvents()
+
+    def playing(self):
+        return self.game.state==0 and (self.maxTicks==None or self.game.ticks<self.maxTicks)
+
+    def advance(self, ticks):
+        # Play up to ticks ticks, returns False once the game is over
+        game=self.game
+        for i in range(ticks):
+            if(not self.playing()):
+                return False
+            if(self.bot!=None and game.ticks%self.botEvery==0):
+                self.bot(self)
+            game.step()
+        # Nobody is listening for sounds or new balls
+        game.popEvents()
+        return self.playing()
+
+    def result(self):
+        game=self.game
+        return {"seed":game.seed, "state":game.state, "ticks":game.ticks, "balls":game.ballCount,
+                "blown":game.blownWheels, "wheels":game.numWheels,
+                "score":game.levelScore(1) if game.state==1 else 0}
+# End of gameSession class
+
+class gameHost():
+    def __init__(self, slice=HOST_SLICE, realTime=False):
+        self.slice=slice
+        self.realTime=realTime
+        self.sessions=[]
+
+    def add(self, session):
+        self.sessions.append(session)
+        return session
+
+    async def play(self, session):
+        # One session's task. In real time it waits until the clock catches up with the game after each slice
+        loop=asyncio.get_running_loop()
+        start=loop.time()
+        while(session.advance(self.slice)):
+            if(self.realTime):
+                await asyncio.sleep(max(0, start+session.game.time/1000-loop.time()))
+            else:
+                await asyncio.sleep(0)
+
+    async def run(self):
+        # Play every session to the end
+        await asyncio.gather(*(self.play(s) for s in self.sessions))
+
+    def runAll(self):
+        asyncio.run(self.run())
+        return [s.result() for s in self.sessions]
+# End of gameHost class
+
+def loadLevels(files):
+    # Compile each level once. Files in the level directory come from the level pack if it is up to date,
+    # anything else is compiled from the file given, even if a packed level has the same name
+    pack=levelPack(PACK_FILE) if packIsCurrent(files) else None
+    levelDir=os.path.abspath(LEVEL_DIR)
+    levels=[]
+    for f in files:
+        packed=pack and os.path.abspath(os.path.dirname(f))==levelDir
+        i=pack.find(os.path.basename(f)) if packed else -1
+        levels.append(pack.load(i) if i>=0 else compileLevel(readLevel(f)))
+    if(pack):
+        pack.close()
+    return levels
+
+if __name__ == "__main__":
+    args=sys.argv[1:]
+    count=HOST_SESSIONS
+    maxTicks=None
+    seed=None
+    realTime=False
+    analytic=False
+    mem=False
+    files=[]
+    while(args):
+        a=args.pop(0)
+        if(a=="-n"):
+            count=int(args.pop(0))
+        elif(a=="-t"):
+            maxTicks=int(args.pop(0))
+        elif(a=="-s"):
+            seed=int(args.pop(0))
+        elif(a=="--realtime"):
+            realTime=True
+        elif(a=="--analytic"):
+            analytic=True
+        elif(a=="--mem"):
+            mem=True
+        else:
+            files.append(a)
+    files=files or levelListFiles()
+    if(mem):
+        import tracemalloc
+        tracemalloc.start()
+    try:
+        levels=loadLevels(files)
+    except levelError as e:
+        print(e)
+        sys.exit(1)
+    rng=random.Random(seed)
+    host=gameHost(realTime=realTime)
+    before=tracemalloc.get_traced_memory()[0] if mem else 0
+    for i in range(count):
+        host.add(gameSession(levels[i%len(levels)], seed=rng.randrange(1<<32), maxTicks=maxTicks,
+                             analytic=analytic))
+    if(mem):
+        startMem=tracemalloc.get_traced_memory()[0]-before
+        print("{} sessions, {:.1f}KB each to start".format(count, startMem/count/1024))
+    start=time.perf_counter()
+    results=host.runAll()
+    secs=time.perf_counter()-start
+    ticks=sum(r["ticks"] for r in results)
+    won=sum(1 for r in results if r["state"]==1)
+    blown=sum(r["blown"] for r in results)
+    wheels=sum(r["wheels"] for r in results)
+    print("{} sessions on {} levels: {} won, {} of {} wheels blown".format(count, len(levels), won, blown, wheels))
+    print("{} ticks in {:.1f}s, {:.0f} ticks/s".format(ticks, secs, ticks/max(secs, 1e-9)))
+    if(mem):
+        (current, peak)=tracemalloc.get_traced_memory()
+        print("Peak {:.1f}MB, {:.1f}KB a session".format(peak/1024/1024, (peak-before)/count/1024))
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+#
+# bamPack
+# Builds all the levels into one binary level pack, and loads levels back out of it. A pack holds each level
+# already compiled (tile codes, open exits, wheels with their valid exits and south T to wheel links), so
+# loading a level is copying a few bytes out of the file, with no CSV to parse or south T paths to follow.
+# The pack is memory mapped, so opening it reads nothing until a level is asked for.
+#
+# Everything is little endian. The file starts with a header and an index with an entry for each level:
+#   magic "BAMPACK\0", version (u16), number of levels (u16)
+#   offset, length (u32, u32) of each level's record, in play order
+# Each level record is:
+#   tilesX, tilesY (u16 each), wheels, south Ts (u32 each), name length (u16), then the name (utf-8)
+#   tile codes, open exits (tilesX*tilesY bytes each, see compileBoard())
+#   x, y (u16 each), valid exit mask (u8) for each wheel
+#   x, y, wheel x, wheel y (u16 each), wheel slot (u8) for each south T
+# So a board can be up to MAX_SIDE tiles across and down, and a pack can hold up to MAX_LEVELS levels and
+# 4GB. packLevel() and buildPack() raise levelError for anything bigger.
+#
+# Usage: python bamPack.py build [-o pack] [level.csv ...]     Build a pack, by default from levels/levelList
+#        python bamPack.py list [pack]                         List the levels in a pack
+import sys, os, mmap, struct, time
+from array import array
+from bamEngine import readLevel, compileLevel, compiledLevel, levelError, TILENAMES, TILE_UNK
+from bamCodec import LEVEL_DIR, LEVEL_LIST_FILE, levelListFiles
+
+PACK_FILE=os.path.join(LEVEL_DIR, "levels.pack")
+
+PACK_MAGIC=b"BAMPACK\0"
+PACK_VERSION=2
+HEADER=struct.Struct("<8sHH")
+INDEX=struct.Struct("<II")
+LEVEL_HEADER=struct.Struct("<HHIIH")
+WHEEL=struct.Struct("<HHB")
+SOUTHT=struct.Struct("<HHHHB")
+MAX_SIDE=0xffff             # Most tiles across or down a packed board
+MAX_LEVELS=0xffff           # Most levels in a pack
+
+def packLevel(name, level):
+    # A compiledLevel as a pack record. Raises levelError if it is too big for the pack
+    if(level.tilesX>MAX_SIDE or level.tilesY>MAX_SIDE):
+        raise levelError("Error: Level {} is {}x{}, a pack holds boards up to {} tiles a side".format(name,
+                         level.tilesX, level.tilesY, MAX_SIDE))
+    nameBytes=name.encode()
+    if(len(nameBytes)>0xffff):
+        raise levelError("Error: Level name {}... is too long for a pack".format(name[:40]))
+    data=bytearray(LEVEL_HEADER.pack(level.tilesX, level.tilesY, len(level.wheels), len(level.southTs),
+                                     len(nameBytes)))
+    data+=nameBytes
+    data+=level.board.tobytes()
+    data+=level.exits.tobytes()
+    for ((x, y), mask) in level.wheels.items():
+        data+=WHEEL.pack(x, y, mask)
+    for ((x, y), ((wx, wy), slot)) in level.southTs.items():
+        data+=SOUTHT.pack(x, y, wx, wy, slot)
+    return bytes(data)
+
+def buildPack(files, packFile=PACK_FILE):
+    # Compile level files into a pack, in the order given. Levels are known by their file name without the
+    # directory. Raises levelError if a level can't be compiled
+    records=[]
+    for filename in files:
+        levelData=readLevel(filename)
+        level=compileLevel(levelData)
+        for y in range(level.tilesY):
+            for x in range(level.tilesX):
+                if(level.board[y*level.tilesX+x]==TILE_UNK):
+                    raise levelError("Error: In level file {}, unknown tile {} at {}".format(filename,
+                                     levelData[y][x], (x, y)))
+        records.append(packLevel(os.path.basename(filename), level))
+    if(len(records)>MAX_LEVELS):
+        raise levelError("Error: {} levels, a pack holds up to {}".format(len(records), MAX_LEVELS))
+    offset=HEADER.size+INDEX.size*len(records)
+    if(offset+sum(len(r) for r in records)>0xffffffff):
+        raise levelError("Error: The levels are too big for one pack")
+    with open(packFile, "wb") as f:
+        f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, len(records)))
+        for r in records:
+            f.write(INDEX.pack(offset, len(r)))
+            offset+=len(r)
+        for r in records:
+            f.write(r)
+
+class levelPack():
+    # An open level pack. Levels can be loaded by position or by name
+    def __init__(self, packFile=PACK_FILE):
+        self.packFile=packFile
+        with open(packFile, "rb") as f:
+            self.map=mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, count)=HEADER.unpack_from(self.map, 0)
+        if(magic!=PACK_MAGIC or version!=PACK_VERSION):
+            self.map.close()
+            raise levelError("Error: {} is not a version {} level pack".format(packFile, PACK_VERSION))
+        self.index=[INDEX.unpack_from(self.map, HEADER.size+INDEX.size*i) for i in range(count)]
+        # Names are read as they are needed for find()
+        self.nameIndex=None
+
+    def __len__(self):
+        return len(self.index)
+
+    def name(self, i):
+        # Name of level i, the level file it came from
+        offset=self.index[i][0]
+        n=LEVEL_HEADER.unpack_from(self.map, offset)[4]
+        start=offset+LEVEL_HEADER.size
+        return self.map[start:start+n].decode()
+
+    def names(self):
+        return [self.name(i) for i in range(len(self.index))]
+
+    def find(self, name):
+        # Position of a level from its name, or -1
+        if(self.nameIndex==None):
+            self.nameIndex={n:i for i,n in enumerate(self.names())}
+        return self.nameIndex.get(name, -1)
+
+    def load(self, i):
+        # Make level i into a compiledLevel
+        (offset, length)=self.index[i]
+        (tilesX, tilesY, numWheels, numSouthTs, nameLen)=LEVEL_HEADER.unpack_from(self.map, offset)
+        p=offset+LEVEL_HEADER.size+nameLen
+        size=tilesX*tilesY
+        board=array("B", self.map[p:p+size])
+        p+=size
+        exits=array("B", self.map[p:p+size])
+        p+=size
+        wheels={}
+        for w in range(numWheels):
+            (x, y, mask)=WHEEL.unpack_from(self.map, p)
+            wheels[(x, y)]=mask
+            p+=WHEEL.size
+        southTs={}
+        for s in range(numSouthTs):
+            (x, y, wx, wy, slot)=SOUTHT.unpack_from(self.map, p)
+            southTs[(x, y)]=((wx, wy), slot)
+            p+=SOUTHT.size
+        levelData=[[TILENAMES[board[y*tilesX+x]] for x in range(tilesX)] for y in range(tilesY)]
+        return compiledLevel(levelData, board, exits, wheels, southTs)
+
+    def close(self):
+        self.map.close()
+# End of levelPack class
+
+def packIsCurrent(files, packFile=PACK_FILE):
+    # True if the pack exists, is this version and is newer than all the level files and the level list
+    try:
+        built=os.path.getmtime(packFile)
+        if(not all(os.path.getmtime(f)<=built for f in files+[LEVEL_LIST_FILE] if os.path.exists(f))):
+            return False
+        with open(packFile, "rb") as f:
+            head=f.read(HEADER.size)
+        return len(head)==HEADER.size and HEADER.unpack(head)[:2]==(PACK_MAGIC, PACK_VERSION)
+    except OSError:
+        return False
+
+if __name__ == "__main__":
+    args=sys.argv[1:]
+    if(len(args)==0 or args[0] not in ("build", "list")):
+        print("Usage: {} build [-o pack] [level.csv ...] | list [pack]".format(sys.argv[0]))
+        sys.exit(2)
+    cmd=args.pop(0)
+    if(cmd=="build"):
+        packFile=PACK_FILE
+        if(args[:1]==["-o"]):
+            packFile=args[1]
+            args=args[2:]
+        files=args or levelListFiles()
+        start=time.perf_counter()
+        try:
+            buildPack(files, packFile)
+        except levelError as e:
+            print(e)
+            sys.exit(1)
+        print("{} levels packed into {}, {} bytes ({:.3f}s)".format(len(files), packFile,
+                                                                  os.path.getsize(packFile), time.perf_counter()-start))
+    else:
+        pack=levelPack(args[0] if args else PACK_FILE)
+        start=time.perf_counter()
+        for i in range(len(pack)):
+            level=pack.load(i)
+            print("{:3} {:20} {} wheels, {} south Ts".format(i, pack.name(i), len(level.wheels), len(level.southTs)))
+        print("{} levels loaded ({:.3f}s)".format(len(pack), time.perf_counter()-start))
+        pack.close()
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+#
+# bamProfile
+# Times where each frame goes. The frame is split into phases, the game loop calls mark() at the end of each phase
+# and the time since the last mark goes to that phase. For the last PROFILE_WINDOW frames the profiler keeps the
+# time of every phase, for rolling percentiles, and a histogram of whole frame times since it was turned on. Each
+# frame can also be written to a CSV file as it ends, one row per frame, for looking at afterwards.
+#
+# Nothing is timed unless the profiler is on, every call returns straight away otherwise. Nothing here imports
+# pygame, the front end draws the overlay from stats().
+#
+# Usage: python bamProfile.py frames.csv [...]
+#   Prints the percentiles of each phase from CSV files written by the profiler
+import sys, csv, time
+from collections import deque
+
+PROFILE_WINDOW=600          # Frames kept for the percentiles
+HIST_BUCKET=1.0             # Histogram buckets are this many ms wide
+HIST_BUCKETS=40             # The last bucket holds everything longer
+PERCENTILES=(50, 95, 99)
+
+def percentile(values, p):
+    # Nearest rank percentile of a sorted list
+    if(not values):
+        return 0.0
+    return values[min(len(values)-1, int(len(values)*p/100))]
+
+class frameProfiler():
+    def __init__(self, phases, window=PROFILE_WINDOW):
+        self.phases=list(phases)
+        self.window=window
+        self.enabled=False
+        self.csvFile=None
+        self.reset()
+
+    def reset(self):
+        # Forget everything timed so far
+        self.recent={p:deque(maxlen=self.window) for p in self.phases+["total"]}
+        self.hist=[0]*HIST_BUCKETS
+        self.frames=0
+        self.started=time.perf_counter()
+        self.inFrame=False
+
+    def enable(self, on=True):
+        if(on and not self.enabled):
+            self.reset()
+        self.enabled=on or self.csvFile!=None
+
+    def openCSV(self, filename):
+        # Write every frame to filename from now on, this turns the profiler on
+        self.closeCSV()
+        self.csvFile=open(filename, "w", newline="")
+        self.csv=csv.writer(self.csvFile)
+        self.csv.writerow(["frame", "ms"]+self.phases+["total"])
+        self.enable()
+
+    def closeCSV(self):
+        if(self.csvFile!=None):
+            self.csvFile.close()
+            self.csvFile=None
+
+    def startFrame(self):
+        if(not self.enabled):
+            return
+        self.inFrame=True
+        self.frameStart=self.last=time.perf_counter()
+        self.times=dict.fromkeys(self.phases, 0.0)
+
+    def mark(self, phase):
+        # The time since the last mark was spent in phase. Marks outside a frame are ignored
+        if(not self.inFrame):
+            return
+        t=time.perf_counter()
+        self.times[phase]+=t-self.last
+        self.last=t
+
+    def endFrame(self):
+        if(not self.inFrame):
+            return
+        self.inFrame=False
+        total=(time.perf_counter()-self.frameStart)*1000
+        row=[]
+        for p in self.phases:
+            ms=self.times[p]*1000
+            self.recent[p].append(ms)
+            row.append(ms)
+        self.recent["total"].append(total)
+        self.hist[min(HIST_BUCKETS-1, int(total/HIST_BUCKET))]+=1
+        self.frames+=1
+        if(self.csvFile!=None):
+            self.csv.writerow([self.frames, "{:.3f}".format((self.frameStart-self.started)*1000)]+
+                              ["{:.3f}".format(ms) for ms in row+[total]])
+
+    def stats(self):
+        # (phase, p50, p95, p99) in ms for each phase and the whole frame, over the last window frames
+        out=[]
+        for p in self.phases+["total"]:
+            values=sorted(self.recent[p])
+            out.append((p,)+tuple(percentile(values, q) for q in PERCENTILES))
+        return out
+# End of frameProfiler class
+
+def readCSV(filename):
+    # The columns of a profiler CSV file, as name: list of ms
+    with open(filename, newline="") as f:
+        rows=list(csv.reader(f))
+    names=rows[0][2:]
+    return {n:[float(r[i+2]) for r in rows[1:]] for (i, n) in enumerate(names)}
+
+if __name__ == "__main__":
+    if(len(sys.argv)<2):
+        print("Usage: python bamProfile.py frames.csv [...]")
+        sys.exit(1)
+    for filename in sys.argv[1:]:
+        cols=readCSV(filename)
+        print("{}: {} frames".format(filename, len(cols.get("total", []))))
+        print("  {:10} {:>8} {:>8} {:>8}".format("phase", *("p{}".format(q) for q in PERCENTILES)))
+        for (name, values) in cols.items():
+            values.sort()
+            print("  {:10} {:8.3f} {:8.3f} {:8.3f}".format(name, *(percentile(values, q) for q in PERCENTILES)))
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+#
+# bamReplay
+# Save a played level with its seed and player input, and play it again with no window. The engine only
+# moves on when step() is called and takes its ball colours from a seeded generator, so replaying the
+# same input on the same ticks gives the same game. Useful for bug reports, and as a fixed workload when
+# timing the engine.
+#
+# A replay is a small text file, one item per line:
+#   bamreplay 1                     Format version
+#   seed 2713                       Seed for the game's random generator
+#   params 2 150 120 -1             ballSpeed, levelTime, fps, ballLimit
+#   level H,ST,H,H,H,H,ST,H         The level, one line per row
+#   result 1 8642 17 2 212          state, ticks, ballCount, blownWheels, score at the end
+#   dm 1                            Difficulty multiplier used for the score
+#   input 120 R 400 300             tick, action, board x, board y. Actions are in order
+#
+# Usage: python bamReplay.py file.rep [file.rep ...]
+import sys, time
+from bamEngine import gameEngine, ACT_BALL, ACT_WHEEL, ACT_EXPLODE
+
+REPLAY_VERSION=1
+
+def saveReplay(game, filename, dm=1):
+    # Write out a game, usually once it has finished
+    with open(filename, "w") as f:
+        f.write("bamreplay {}\n".format(REPLAY_VERSION))
+        f.write("seed {}\n".format(game.seed))
+        f.write("params {} {} {} {}\n".format(game.ballSpeed, game.levelTime//1000, round(1000/game.tickTime),
+                                             game.ballLimit))
+        for row in game.levelData:
+            f.write("level {}\n".format(",".join(row)))
+        f.write("result {} {} {} {} {}\n".format(game.state, game.ticks, game.ballCount, game.blownWheels,
+                                                game.levelScore(dm)))
+        f.write("dm {}\n".format(dm))
+        for (tick, act, x, y) in game.actions:
+            f.write("input {} {} {} {}\n".format(tick, act, x, y))
+
+def loadReplay(filename):
+    # Read a replay file into a dictionary
+    rec={"level":[], "input":[], "dm":1}
+    with open(filename) as f:
+        for line in f:
+            sp=line.split()
+            if(len(sp)==0):
+                continue
+            if(sp[0]=="bamreplay"):
+                if(int(sp[1])!=REPLAY_VERSION):
+                    raise ValueError("{}: unknown replay version {}".format(filename, sp[1]))
+            elif(sp[0]=="seed"):
+                rec["seed"]=int(sp[1])
+            elif(sp[0]=="params"):
+                rec["params"]=(int(sp[1]), int(sp[2]), int(sp[3]), int(sp[4]))
+            elif(sp[0]=="level"):
+                rec["level"].append(sp[1].split(","))
+            elif(sp[0]=="result"):
+                rec["result"]=tuple(int(v) for v in sp[1:])
+            elif(sp[0]=="dm"):
+                rec["dm"]=int(sp[1])
+            elif(sp[0]=="input"):
+                rec["input"].append((int(sp[1]), sp[2], float(sp[3]), float(sp[4])))
+    return rec
+
+def replay(rec):
+    # Play a loaded replay as fast as possible, returns the game as it was when the recording ended
+    (ballSpeed, levelTime, fps, ballLimit)=rec["params"]
+    game=gameEngine(rec["level"], ballSpeed, levelTime, fps, ballLimit, seed=rec["seed"])
+    game.start()
+    endTick=rec["result"][1]
+    inputs=rec["input"]
+    i=0
+    while(game.state==0):
+        # Input is applied before the tick it was recorded on
+        while(i<len(inputs) and inputs[i][0]<=game.ticks):
+            (tick, act, x, y)=inputs[i]
+            if(act==ACT_BALL):
+                game.clickBall((x, y))
+            elif(act==ACT_WHEEL):
+                game.clickWheel((x, y))
+            elif(act==ACT_EXPLODE):
+                game.explodeAll()
+            i+=1
+        if(game.ticks>=endTick):
+            # Player quit before the end of the level
+            break
+        game.step()
+        game.popEvents()
+    return game
+
+def checkReplay(rec):
+    # Replay and compare the end of the game with the recording. Returns (ok, game)
+    game=replay(rec)
+    result=(game.state, game.ticks, game.ballCount, game.blownWheels, game.levelScore(rec["dm"]))
+    return (result==rec["result"], game)
+
+if __name__ == "__main__":
+    if(len(sys.argv)<2):
+        print("Usage: {} file.rep [file.rep ...]".format(sys.argv[0]))
+        sys.exit(2)
+    failed=0
+    for filename in sys.argv[1:]:
+        rec=loadReplay(filename)
+        start=time.perf_counter()
+        (ok, game)=checkReplay(rec)
+        secs=time.perf_counter()-start
+        print("{}: {} state={} ticks={} balls={} score={} ({:.0f} ticks/s)".format(
+            filename, "OK" if ok else "MISMATCH", game.state, game.ticks, game.ballCount,
+            game.levelScore(rec["dm"]), game.ticks/max(secs, 1e-9)))
+        if(not ok):
+            print("  expected state, ticks, balls, wheels, score =", rec["result"])
+            failed+=1
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,1220 @@
+#!/usr/bin/python
+#
+# bamSolver
+# Finds the fewest balls needed to complete a level, and a sequence of moves that does it.
+#
+# The solver plays an abstract version of the game where each move is played out before the next one
+# starts, so time doesn't matter. The state is how many balls of each colour are docked in each wheel and
+# which wheels have been blown. Which slot a ball is in isn't kept, as between moves a wheel can always be
+# turned to bring any ball to any exit, or a free slot round to catch a ball. The moves are:
+#   - Launch a docked ball. It is followed through corners, painters, blockers and Ts to the wheel it
+#     docks in. If there is no free slot it explodes with a docked ball, and four of the same colour blow
+#     the wheel
+#   - Drop the waiting ball from the top ally through a south T. This is the only move that uses up a ball
+# Normally the colour of each ball dropped is picked by the solver, which gives the best case for the level.
+# With a seed the colours come in the order a gameEngine with that seed would give them.
+#
+# The waiting ball comes on at the right of the top ally and goes back and forth along it, dropping through
+# the first south T it gets to with a free slot under it. To get past a T it has to be shut, with a ball
+# turned into the slot under it, so a wheel can shut as many of its Ts as it has balls docked. A ball that
+# has just come on can only be dropped as far along as the first T that can't be shut. While every T can be
+# shut the ball is held in the top ally, balls can be launched, and it can be let through any T. A launch
+# can leave one T open, the held ball then has to drop through it next.
+#
+# Where a launched ball goes only depends on the wheel, exit and colour, never on what else is docked, so
+# the wheels and colours a ball could ever get to are worked out once. Every wheel needs four balls which
+# can reach it in the same colour, so no solution can use fewer balls than the shortest run of balls that
+# can be shared out like that. solve() finds that run by matching balls to wheels, then plays it out,
+# sharing out the balls left again before each one, taking each ball to its wheel and getting rid of spare
+# ones. Wheels under south Ts are blown last, as once blown their Ts can't be shut. When that gets stuck it
+# goes back and tries other wheels for the balls before, and failing that tries again with one more ball.
+# A solution at the lower bound can't be beaten. Otherwise it only shows the level can be done with that
+# many, so a depth first branch and bound search over the abstract game goes through the counts below it
+# from the lower bound up. A state is dropped once the balls used plus the fewest that could still be needed
+# go over the count, and every state reached is kept so none is searched twice. Each count it rules out
+# raises the lower bound, and the first count it finds a solution for is the minimum. If it gives up after
+# MAX_STATES states the minimum isn't proven, and the output says so.
+#
+# A solution is only used once verify() has played it through a gameEngine, turning wheels and clicking
+# balls as a player would, and the game was won. The game is given CHECK_TIME seconds, as the solver takes
+# no account of how long the moves take.
+#
+# Usage: python bamSolver.py [--seed n] [--moves] [level.csv ...]
+#   With no level files every level in levels/levelList is solved
+import sys, time, random, math
+from bamEngine import gameEngine, readLevel, levelError, MIDDLE, MID_SOUTHT, TILE_W
+from bamEngine import EAST, SOUTH, WEST, DX, DY, DIRNAMES, COLNAMES, TILESIZE, BALLSIZE, ROTSTEPS
+from bamCodec import levelListFiles
+
+MAX_STATES=50000            # States search() looks at in all before giving up
+MAX_BALLS=500               # How many seeded colours to look ahead
+MAX_EXTRA=20                # Balls over the fewest possible to try before searching
+MAX_TRIES=30000             # Balls play() places before it gives up on a count
+CHECK_TIME=3600             # Seconds of game time verify() gives a solution
+SETTLE_TICKS=20000          # Ticks verify() waits for anything before giving up
+
+# A wheel's state is packed into an int, 3 bits per colour holding how many balls of that colour are
+# docked, and a bit for blown
+COUNTBITS=3
+COUNTMASK=7
+BLOWN=1<<(COUNTBITS*len(COLNAMES))
+
+# Moves, as stored in the solution
+MV_LAUNCH="launch"          # (MV_LAUNCH, wheel, colour, exit, colour hit or None)
+MV_DROP="drop"              # (MV_DROP, south T, colour, colour at the T, colour hit or None)
+
+def colourCount(w, c):
+    # How many balls of colour c are docked in packed wheel w
+    return (w>>(COUNTBITS*c))&COUNTMASK
+
+def ballCount(w):
+    return sum(colourCount(w, c) for c in range(len(COLNAMES)))
+
+def dockInto(w, c):
+    # Dock a ball of colour c in packed wheel w, which has a free slot. Same as Wheel.dockBall(), four of
+    # the same colour blow the wheel and empty it
+    w+=1<<(COUNTBITS*c)
+    if(colourCount(w, c)==4):
+        w=BLOWN
+    return w
+
+def turned(slots, r):
+    # What is in each slot of a wheel after r quarter turns. Wheels turn clockwise
+    return slots[-r:]+slots[:-r] if r else list(slots)
+
+class levelSolver():
+    def __init__(self, levelData, colours=None):
+        # colours is the list of ball colours in the order they arrive, or None to let the solver pick
+        # Build a game to compile the board and link the south Ts to their wheels. This also checks
+        # the level is valid
+        game=gameEngine(levelData)
+        self.levelData=levelData
+        self.tilesX=game.tilesX
+        self.board=game.board
+        self.exits=game.exits
+        self.colours=colours
+        self.wheelIds=sorted(game.wheels)
+        self.wheelIndex={w:i for i,w in enumerate(self.wheelIds)}
+        self.validExit=[list(game.wheels[w].validExit) for w in self.wheelIds]
+        # (tile, wheel index) for each south T, and the slot of the wheel under it
+        self.southTs=[]
+        self.stSlot=[]
+        self.stWheel={}
+        self.stIndex={}
+        for st in sorted(game.southTs):
+            s=game.southTs[st]
+            cell=st[1]*self.tilesX+st[0]
+            self.stIndex[cell]=len(self.southTs)
+            self.stWheel[cell]=self.wheelIndex[s.linkedWheel]
+            self.southTs.append((st, self.wheelIndex[s.linkedWheel]))
+            self.stSlot.append(s.wheelLoc)
+        self.traces={}              # Cache of traces which did not pass a south T
+        self.lengths={}             # How many tiles the last trace() from each place went through
+        self.launchList={}          # Cache of launches()
+        self.reachable={}           # Cache of reach()
+        self.feeds={}               # Cache of feed()
+        self.loops={}               # Cache of loop()
+        # The south Ts the waiting ball can get to, as {wheel tile: [(south T, slot)]}, and how many slots
+        # each wheel has to fill to shut all of them
+        self.tSlots={}
+        for c in range(len(COLNAMES)):
+            for (s, k) in self.feed(c):
+                ts=self.tSlots.setdefault(self.wheelIds[self.southTs[s][1]], [])
+                if((s, self.stSlot[s]) not in ts):
+                    ts.append((s, self.stSlot[s]))
+        self.tCount={self.wheelIndex[w]:len({slot for (s, slot) in ts}) for (w, ts) in self.tSlots.items()}
+        self.states=0
+        self.lowerBound=None        # Set by solve(), no solution can use fewer balls
+        self.optimal=False          # Set by solve() if the solution found is proven to be the minimum
+        self.problem=None           # Set by solve(), why the last solution found didn't win in the game
+
+    # ---- Following balls ----
+
+    def trace(self, cell, d, colour, wheels=None):
+        # Follow a ball leaving tile cell in direction d until it docks. Returns (wheel index, colour, slot),
+        # or None if it never docks. This is the tick by tick movement with the time taken out
+        key=(cell, d, colour)
+        if(key in self.traces):
+            return self.traces[key]
+        usedST=False
+        seen=set()
+        steps=0
+        while(True):
+            steps+=1
+            if(not (self.exits[cell]>>d)&1):
+                # Dead end, bounce back through the middle of this tile
+                d=(d+2)%4
+            else:
+                cell+=DX[d]+DY[d]*self.tilesX
+                if(self.board[cell]==TILE_W):
+                    result=(self.wheelIndex[(cell%self.tilesX, cell//self.tilesX)], colour, (d+2)%4)
+                    break
+            if((cell, d, colour) in seen):
+                # Going round in circles
+                result=None
+                break
+            seen.add((cell, d, colour))
+            (nd, colour, act)=MIDDLE[(self.board[cell]*4+d)*4+colour]
+            if(act==MID_SOUTHT):
+                # Open if the wheel has a free slot to turn to it
+                usedST=True
+                if(wheels==None or ballCount(wheels[self.stWheel[cell]])<4):
+                    nd=SOUTH
+            d=nd
+        if(not usedST):
+            self.traces[key]=result
+        self.lengths[key]=steps
+        return result
+
+    def launches(self, i, c):
+        # Every launch of a ball of colour c from wheel i, as a list of (exit, wheel index, colour)
+        key=(i, c)
+        if(key not in self.launchList):
+            (x, y)=self.wheelIds[i]
+            out=[]
+            for d in range(4):
+                if(self.validExit[i][d]):
+                    r=self.trace(y*self.tilesX+x, d, c)
+                    if(r!=None):
+                        out.append((d, r[0], r[1]))
+            self.launchList[key]=out
+        return self.launchList[key]
+
+    def landing(self, i, c, d):
+        # Where a ball of colour c launched from wheel i to d docks, (wheel index, colour, slot)
+        (x, y)=self.wheelIds[i]
+        return self.trace(y*self.tilesX+x, d, c)
+
+    def feed(self, c):
+        # The south Ts a new ball of colour c passes in the top ally while they are all shut, in the order it
+        # first gets to them, as a list of (south T, its colour there). It comes on at the right heading west
+        if(c not in self.feeds):
+            out=[]
+            (cell, d, col)=(self.tilesX-1, WEST, c)
+            seen=set()
+            while((cell, d, col) not in seen and self.board[cell]!=TILE_W):
+                seen.add((cell, d, col))
+                (d, col, act)=MIDDLE[(self.board[cell]*4+d)*4+col]
+                if(act==MID_SOUTHT and cell in self.stIndex and (self.stIndex[cell], col) not in out):
+                    out.append((self.stIndex[cell], col))
+                if((self.exits[cell]>>d)&1):
+                    cell+=DX[d]+DY[d]*self.tilesX
+                else:
+                    d=(d+2)%4
+            self.feeds[c]=out
+        return self.feeds[c]
+
+    def loop(self, c):
+        # The south Ts a ball which came on as colour c passes once it is just going back and forth, as a list of
+        # (south T, its colour there). Painters in the top ally can make these different to the first time past
+        if(c not in self.loops):
+            (cell, d, col)=(self.tilesX-1, WEST, c)
+            path=[]
+            while((cell, d, col) not in path and self.board[cell]!=TILE_W):
+                path.append((cell, d, col))
+                (d, col, act)=MIDDLE[(self.board[cell]*4+d)*4+col]
+                if((self.exits[cell]>>d)&1):
+                    cell+=DX[d]+DY[d]*self.tilesX
+                else:
+                    d=(d+2)%4
+            out=[]
+            if((cell, d, col) in path):
+                for (pc, pd, pcol) in path[path.index((cell, d, col)):]:
+                    (nd, ncol, act)=MIDDLE[(self.board[pc]*4+pd)*4+pcol]
+                    if(act==MID_SOUTHT and pc in self.stIndex and (self.stIndex[pc], ncol) not in out):
+                        out.append((self.stIndex[pc], ncol))
+            self.loops[c]=out
+        return self.loops[c]
+
+    def drop(self, s, c):
+        # Where a ball which is colour c at south T s docks when it drops, (wheel index, colour, slot) or None
+        (x, y)=self.southTs[s][0]
+        return self.trace(y*self.tilesX+x, SOUTH, c)
+
+    def reach(self, i, c):
+        # Every (wheel, colour) a ball of colour c docked in wheel i could get to with launches, if the
+        # wheels on the way have room
+        key=(i, c)
+        if(key not in self.reachable):
+            seen={key}
+            todo=[key]
+            while(todo):
+                (wi, wc)=todo.pop()
+                for (d, ni, nc) in self.launches(wi, wc):
+                    if((ni, nc) not in seen):
+                        seen.add((ni, nc))
+                        todo.append((ni, nc))
+            self.reachable[key]=frozenset(seen)
+        return self.reachable[key]
+
+    def dropColours(self, n):
+        # Colours ball n could be dropped as
+        if(self.colours==None):
+            return range(len(COLNAMES))
+        return (self.colours[n],)
+
+    def ballReach(self, n):
+        # Every (wheel, colour) ball n could be taken to, through any south T it can get to
+        out=set()
+        for c in self.dropColours(n):
+            for (s, k) in self.feed(c):
+                r=self.drop(s, k)
+                if(r!=None):
+                    out|=self.reach(r[0], r[1])
+        return out
+
+    # ---- The waiting ball ----
+
+    def short(self, wheels):
+        # The south Ts that can't be shut, as {wheel index: how many}
+        out={}
+        for (w, n) in self.tCount.items():
+            b=ballCount(wheels[w])
+            if(b<n):
+                out[w]=n-b
+        return out
+
+    def drops(self, wheels, fresh, n):
+        # Where ball n can be dropped, as a list of (south T, colour, colour at the T, can hit). fresh says the
+        # ball has only just come on. It can explode with a docked ball turned under the T once it has gone
+        # through, but not if it drops while a launched ball is on its way
+        short=self.short(wheels)
+        out=[]
+        for c in self.dropColours(n):
+            feed=self.feed(c)
+            if(not short):
+                # Held, let it through any T with room under it. Once it has been held for a launch it may
+                # have been past where it came on, so it can only be the colours it has going back and forth
+                out+=[(s, c, k, True) for (s, k) in (feed if fresh else self.loop(c))
+                      if ballCount(wheels[self.southTs[s][1]])<4]
+            elif(fresh):
+                # It only gets as far as the first T that can't be shut
+                shut={}
+                for (s, k) in feed:
+                    li=self.southTs[s][1]
+                    b=ballCount(wheels[li])
+                    need=shut.setdefault(li, set())
+                    if(self.stSlot[s] not in need and len(need)<=b<4):
+                        out.append((s, c, k, True))
+                    need.add(self.stSlot[s])
+                    if(len(need)>b):
+                        break
+            elif(sum(short.values())==1):
+                # A launch left one T open, it drops through that when it next gets there. Which way it is
+                # going then isn't known, so it must be the same colour either way
+                (li,)=short
+                ts={s for (s, k) in feed if self.southTs[s][1]==li}
+                cols={k for (s, k) in feed if s in ts}
+                if(len(ts)==1 and len(cols)==1):
+                    out.append((ts.pop(), c, cols.pop(), False))
+        return out
+
+    def canLaunch(self, wheels, left, after):
+        # Can a ball be launched from wheels, leaving left while it is on its way and after once it has
+        # landed. The waiting ball has to be held, and at most one T left open for it to drop through
+        if(self.short(wheels)):
+            return False
+        gone=self.short(left)
+        done=self.short(after)
+        return sum(done.values())<=1 and (not gone or gone==done)
+
+    def apply(self, wheels, fresh, move, n):
+        # Play a move with n balls dropped so far. Returns (wheels, fresh) after it, or None if it isn't allowed
+        wheels=tuple(wheels)
+        if(move[0]==MV_LAUNCH):
+            (kind, i, c, d, hit)=move
+            r=next(((ni, nc) for (ed, ni, nc) in self.launches(i, c) if ed==d), None)
+            if(r==None or colourCount(wheels[i], c)==0):
+                return None
+            left=wheels[:i]+(wheels[i]-(1<<(COUNTBITS*c)),)+wheels[i+1:]
+            after=next((nw for (h, nw) in self.arrive(left, r[0], r[1]) if h==hit), None)
+            if(after==None or not self.canLaunch(wheels, left, after)):
+                return None
+            return (after, False)
+        (kind, s, c, k, hit)=move
+        if(not any(m[:3]==(s, c, k) and (hit==None or m[3]) for m in self.drops(wheels, fresh, n))):
+            return None
+        r=self.drop(s, k)
+        after=next((nw for (h, nw) in self.arrive(wheels, r[0], r[1]) if h==hit), None)
+        return None if after==None else (after, True)
+
+    def follow(self, wheels, fresh, n, moves):
+        # Play a list of moves, returns (wheels, fresh) after them or None if one isn't allowed
+        for m in moves:
+            r=self.apply(wheels, fresh, m, n)
+            if(r==None):
+                return None
+            (wheels, fresh)=r
+            if(m[0]==MV_DROP):
+                n+=1
+        return (wheels, fresh)
+
+    # ---- Sharing balls out between wheels ----
+
+    def share(self, balls, needs):
+        # Pick a colour for every wheel and give each the balls it needs from balls, a list of ballReach()
+        # sets. needs has (colour or None, balls needed) for each wheel, None if blown. Returns (wheel
+        # colours, {ball: wheel index}), or None if it can't be done
+        nw=len(self.wheelIds)
+        options=[]
+        for w in range(nw):
+            if(needs[w]==None):
+                options.append([])
+                continue
+            (k, n)=needs[w]
+            cols=[k] if k!=None else range(len(COLNAMES))
+            cols=[k for k in cols if sum(1 for b in balls if (w, k) in b)>=n]
+            if(len(cols)==0):
+                return None
+            options.append(cols)
+        # Fewest choices first, so dead ends are found early
+        order=sorted((w for w in range(nw) if needs[w]!=None), key=lambda w: len(options[w]))
+        wheelCol=[None]*nw
+
+        def augment(match, w, seen):
+            # Find wheel w one more ball, moving balls already given out to other wheels if needed
+            for b in range(len(balls)):
+                if(b in seen or (w, wheelCol[w]) not in balls[b]):
+                    continue
+                seen.add(b)
+                if(b not in match or augment(match, match[b], seen)):
+                    match[b]=w
+                    return True
+            return False
+
+        def fill(n, match):
+            if(n==len(order)):
+                return match
+            w=order[n]
+            # Colours fewest other wheels have first, so a ball on its way through a wheel is less likely to
+            # blow it
+            for k in sorted(options[w], key=lambda k: wheelCol.count(k)):
+                wheelCol[w]=k
+                m=dict(match)
+                if(all(augment(m, w, set()) for i in range(needs[w][1]))):
+                    r=fill(n+1, m)
+                    if(r!=None):
+                        return r
+            wheelCol[w]=None
+            return None
+
+        match=fill(0, {})
+        if(match==None):
+            return None
+        return (wheelCol, match)
+
+    def needs(self, wheels, spare):
+        # What each wheel still needs for share(), from the balls in it which aren't spare
+        out=[]
+        for w in range(len(wheels)):
+            if(wheels[w]&BLOWN):
+                out.append(None)
+                continue
+            own=[colourCount(wheels[w], c)-spare[w][c] for c in range(len(COLNAMES))]
+            out.append((next((c for c in range(len(COLNAMES)) if own[c]), None), 4-sum(own)))
+        return out
+
+    def lowest(self):
+        # The fewest balls any solution could use, None if no number of balls will do
+        nw=len(self.wheelIds)
+        needs=[(None, 4)]*nw
+        if(self.colours==None):
+            # Every ball can be any colour, so every ball reaches the same places
+            return 4*nw if self.share([self.ballReach(0)]*(4*nw), needs) else None
+        balls=[]
+        for n in range(len(self.colours)):
+            balls.append(self.ballReach(n))
+            if(n+1>=4*nw and self.share(balls, needs)!=None):
+                return n+1
+        return None
+
+    # ---- Playing it out ----
+
+    def route(self, wheels, i, c, goal):
+        # Find launches taking a ball of colour c docked in wheel i to goal, a (wheel, colour). Wheels on
+        # the way need a free slot and must not be blown by it. Returns a list of launches as (wheel,
+        # colour, exit), or None
+        if((i, c)==goal):
+            return []
+        came={(i, c):None}
+        todo=[(i, c)]
+        while(todo):
+            nxt=[]
+            for (wi, wc) in todo:
+                for (d, ni, nc) in self.launches(wi, wc):
+                    if((ni, nc) in came):
+                        continue
+                    if((ni, nc)!=goal):
+                        # The ball has left wheel i, so there is an extra slot there
+                        w=wheels[ni]
+                        if(ni==i):
+                            w-=1<<(COUNTBITS*c)
+                        if(ballCount(w)>=4 or colourCount(w, nc)==3):
+                            continue
+                    came[(ni, nc)]=(wi, wc, d)
+                    if((ni, nc)==goal):
+                        path=[]
+                        while(came[(ni, nc)]!=None):
+                            (ni, nc, d)=came[(ni, nc)]
+                            path.append((ni, nc, d))
+                        path.reverse()
+                        return path
+                    nxt.append((ni, nc))
+            todo=nxt
+        return None
+
+    def place(self, wheels, spare, n, goal, fresh):
+        # Drop ball n and take it to goal, a (wheel, colour), or leave it as a spare if goal is None. Spare
+        # balls in the way are moved on. Returns (wheels, spare, moves, fresh) after, or None if it can't be
+        # done
+        start=wheels
+        wheels=list(wheels)
+        spare=[list(s) for s in spare]
+        moves=[]
+
+        def launch(wi, c, d):
+            # Launch a ball which is known to dock
+            (ni, nc)=next((ni, nc) for (ed, ni, nc) in self.launches(wi, c) if ed==d)
+            wheels[wi]-=1<<(COUNTBITS*c)
+            wheels[ni]=dockInto(wheels[ni], nc)
+            moves.append((MV_LAUNCH, wi, c, d, None))
+
+        def moveSpare(wi, c):
+            # Get a spare ball out of wheel wi, exploding it with another spare ball or leaving it in a
+            # wheel that is blown or has none of its own balls, going through other wheels if needed
+            spare[wi][c]-=1
+            wheels[wi]-=1<<(COUNTBITS*c)
+            came={(wi, c):None}
+            todo=[(wi, c)]
+            end=None
+            while(todo and end==None):
+                nxt=[]
+                for (pw, pc) in todo:
+                    for (d, ni, nc) in self.launches(pw, pc):
+                        if((ni, nc) in came):
+                            continue
+                        w=wheels[ni]
+                        if(sum(spare[ni]) and ni!=wi):
+                            end=(ni, nc, True)
+                        elif(ballCount(w)>=4 or colourCount(w, nc)==3):
+                            continue
+                        elif(ni!=wi and (w&BLOWN or ballCount(w)==0)):
+                            end=(ni, nc, False)
+                        came[(ni, nc)]=(pw, pc, d)
+                        if(end):
+                            break
+                        nxt.append((ni, nc))
+                    if(end):
+                        break
+                todo=nxt
+            wheels[wi]+=1<<(COUNTBITS*c)
+            if(end==None):
+                spare[wi][c]+=1
+                return False
+            (ni, nc, hit)=end
+            path=[]
+            node=(ni, nc)
+            while(came[node]!=None):
+                path.append(came[node])
+                node=came[node][:2]
+            path.reverse()
+            for (pw, pc, d) in path[:-1]:
+                launch(pw, pc, d)
+            (pw, pc, d)=path[-1]
+            if(hit):
+                # Turn a spare ball to meet it
+                k=next(k for k in range(len(COLNAMES)) if spare[ni][k])
+                spare[ni][k]-=1
+                wheels[pw]-=1<<(COUNTBITS*pc)
+                wheels[ni]-=1<<(COUNTBITS*k)
+                moves.append((MV_LAUNCH, pw, pc, d, k))
+            else:
+                spare[ni][nc]+=1
+                launch(pw, pc, d)
+            return True
+
+        def clear(wi):
+            # Move every spare ball out of wheel wi
+            for c in range(len(COLNAMES)):
+                while(spare[wi][c]):
+                    if(not moveSpare(wi, c)):
+                        return False
+            return True
+
+        def done():
+            # Check the moves are allowed before handing them back
+            r=self.follow(start, fresh, n, moves)
+            return None if r==None else (wheels, spare, moves, r[1])
+
+        if(goal==None):
+            # A spare ball. Best is to leave it shutting a south T which can't be shut, so later balls can get
+            # past. Then explode it with another spare ball if that doesn't open one, or leave it somewhere out
+            # of the way. Failing that move it on from where it lands
+            short=self.short(wheels)
+            options=[]
+            for (s, c, k, canHit) in self.drops(wheels, fresh, n):
+                r=self.drop(s, k)
+                if(r==None):
+                    continue
+                (di, dc)=r[:2]
+                w=wheels[di]
+                free=w&BLOWN or ballCount(w)==sum(spare[di])
+                if(di in short and free and colourCount(w, dc)<3):
+                    options.append((0, s, c, k, di, dc))
+                elif(sum(spare[di]) and canHit and ballCount(w)>self.tCount.get(di, 0)):
+                    options.append((1, s, c, k, di, dc))
+                elif(colourCount(w, dc)<3):
+                    options.append((2 if free else 3, s, c, k, di, dc))
+            if(len(options)==0):
+                return None
+            (kind, s, c, k, di, dc)=min(options)
+            if(kind==1):
+                h=next(h for h in range(len(COLNAMES)) if spare[di][h])
+                spare[di][h]-=1
+                wheels[di]-=1<<(COUNTBITS*h)
+                moves.append((MV_DROP, s, c, k, h))
+            else:
+                wheels[di]=dockInto(wheels[di], dc)
+                spare[di][dc]+=1
+                moves.append((MV_DROP, s, c, k, None))
+                if(kind==3):
+                    # Not much use if it can't be moved, it will have to wait to be hit
+                    moveSpare(di, dc)
+            return done()
+        if(sum(spare[goal[0]]) and not clear(goal[0])):
+            # Spare balls in the wheel would stop it blowing
+            return None
+        for s in range(len(self.southTs)):
+            li=self.southTs[s][1]
+            if(ballCount(wheels[li])>=4 and (li==goal[0] or not sum(spare[li]) or not clear(li))):
+                # No room under the T
+                continue
+            # Anything moved out of the way has given the waiting ball time to get past where it came on
+            for (ds, c, k, canHit) in self.drops(wheels, fresh and not moves, n):
+                if(ds!=s):
+                    continue
+                r=self.drop(s, k)
+                if(r==None):
+                    continue
+                (di, dc)=r[:2]
+                if((di, dc)!=goal and colourCount(wheels[di], dc)==3):
+                    # Would blow the wheel it lands in
+                    continue
+                test=list(wheels)
+                test[di]+=1<<(COUNTBITS*dc)
+                path=self.route(test, di, dc, goal)
+                if(path==None):
+                    continue
+                wheels[di]=dockInto(wheels[di], dc)
+                moves.append((MV_DROP, s, c, k, None))
+                for (wi, wc, d) in path:
+                    launch(wi, wc, d)
+                r=done()
+                if(r!=None):
+                    return r
+                # Not allowed, say it leaves two Ts open on the way, so take it back and try the next T
+                wheels[:]=test
+                wheels[di]-=1<<(COUNTBITS*dc)
+                del moves[len(moves)-len(path)-1:]
+        return None
+
+    def early(self, wheels, goal):
+        # Would taking a ball to goal blow a wheel under a south T while there are other wheels to blow? Once
+        # blown its Ts can't be shut, and every new ball drops through them. So those wheels go last, and the
+        # one whose T the new ball gets to first goes last of all
+        (w, k)=goal
+        if(w not in self.tCount or colourCount(wheels[w], k)!=3):
+            return False
+        order=[self.southTs[s][1] for (s, c) in self.feed(k)]
+        for i in range(len(wheels)):
+            if(i!=w and not wheels[i]&BLOWN):
+                if(i not in self.tCount or i in order and w in order and order.index(i)>order.index(w)):
+                    return True
+        return False
+
+    def play(self, count, maxTries=MAX_TRIES):
+        # Try to complete the level with count balls. Before each ball the rest are shared out between the
+        # wheels again, and the ball is taken to the wheel it was given to. If it can't get there, any other
+        # wheel (or leaving it spare) which still lets the rest be shared out will do. When that gets stuck,
+        # or the moves don't win when verify() plays them, we go back and try the other choices for the balls
+        # before, placing at most maxTries balls in all. Returns the moves, or None
+        balls=[self.ballReach(n) for n in range(count)]
+        seen=set()
+        tries=[0]
+
+        def go(n, wheels, spare, fresh, moves):
+            # The moves to finish from ball n, or None
+            if(all(w&BLOWN for w in wheels)):
+                self.problem=self.verify(moves)
+                return moves if self.problem==None else None
+            key=(tuple(wheels), tuple(tuple(s) for s in spare), fresh, n)
+            if(n==count or key in seen or tries[0]>=maxTries):
+                return None
+            seen.add(key)
+            needs=self.needs(wheels, spare)
+            shared=self.share(balls[n:], needs)
+            if(shared==None):
+                return None
+            (wheelCol, match)=shared
+            goals=[]
+            if(0 in match):
+                goals.append((match[0], wheelCol[match[0]]))
+            for (w, need) in enumerate(needs):
+                if(need!=None):
+                    for k in ([need[0]] if need[0]!=None else range(len(COLNAMES))):
+                        if((w, k) in balls[n] and (w, k) not in goals):
+                            goals.append((w, k))
+            goals.sort(key=lambda g: self.early(wheels, g))
+            goals.append(None)
+            for goal in goals:
+                tries[0]+=1
+                r=self.place(wheels, spare, n, goal, fresh)
+                if(r!=None):
+                    out=go(n+1, r[0], r[1], r[3], moves+r[2])
+                    if(out!=None):
+                        return out
+            return None
+
+        return go(0, [0]*len(self.wheelIds), [[0]*len(COLNAMES) for w in self.wheelIds], True, [])
+
+    # ---- Searching ----
+
+    def moves(self, wheels, fresh, dropped):
+        # Generate (move, new wheels, fresh after, balls used) for every move from a state
+        if(not self.short(wheels)):
+            for i in range(len(wheels)):
+                w=wheels[i]
+                for c in range(len(COLNAMES)):
+                    if(colourCount(w, c)==0):
+                        continue
+                    left=wheels[:i]+(w-(1<<(COUNTBITS*c)),)+wheels[i+1:]
+                    for (d, ni, nc) in self.launches(i, c):
+                        if((ni, nc)==(i, c)):
+                            # Back where it started
+                            continue
+                        for (hit, nw) in self.arrive(left, ni, nc):
+                            if(self.canLaunch(wheels, left, nw)):
+                                yield ((MV_LAUNCH, i, c, d, hit), nw, False, 0)
+        if(self.colours!=None and dropped>=len(self.colours)):
+            return
+        for (s, c, k, canHit) in self.drops(wheels, fresh, dropped):
+            r=self.drop(s, k)
+            if(r==None):
+                continue
+            for (hit, nw) in self.arrive(wheels, r[0], r[1]):
+                if(hit==None or canHit):
+                    yield ((MV_DROP, s, c, k, hit), nw, True, 1)
+
+    def arrive(self, wheels, i, colour):
+        # A ball of colour arrives at wheel i. Yields (what it hit, new wheels), where what it hit is
+        # None if it docked, or the colour of the ball it exploded with
+        w=wheels[i]
+        if(ballCount(w)<4):
+            yield (None, wheels[:i]+(dockInto(w, colour),)+wheels[i+1:])
+        # Turn a docked ball to meet it and both explode. Costs two balls, but it can be the only way to
+        # clear a wheel
+        for c in range(len(COLNAMES)):
+            if(colourCount(w, c)):
+                yield (c, wheels[:i]+(w-(1<<(COUNTBITS*c)),)+wheels[i+1:])
+
+    def estimate(self, wheels):
+        # Fewest balls that could still be needed, four for every wheel not blown less the balls on the board
+        # which can still get to one of them. Never too many, so search() can drop a state on it
+        live={i for i in range(len(wheels)) if not wheels[i]&BLOWN}
+        need=4*len(live)
+        for i in range(len(wheels)):
+            for c in range(len(COLNAMES)):
+                n=colourCount(wheels[i], c)
+                if(n and any(w in live for (w, k) in self.reach(i, c))):
+                    need-=n
+        return max(0, need)
+
+    def progress(self, wheels):
+        # How far on we look, used to pick between states with the same estimate. Four for every blown
+        # wheel, plus the most of any one colour in each wheel still to blow
+        p=0
+        for w in wheels:
+            if(w&BLOWN):
+                p+=4
+            else:
+                p+=max(colourCount(w, c) for c in range(len(COLNAMES)))
+        return p
+
+    def symmetric(self):
+        # Is every colour the same as any other? True if nothing on the board cares what colour a ball is,
+        # and we pick the colours. Then a colour not on the board is as good as any other one that isn't
+        if(self.colours!=None):
+            return False
+        for c in range(len(COLNAMES)):
+            if(self.feed(c)!=[(s, c) for (s, k) in self.feed(0)] or self.loop(c)!=[(s, c) for (s, k) in self.loop(0)]):
+                return False
+            for s in range(len(self.southTs)):
+                r=self.drop(s, 0)
+                if(self.drop(s, c)!=(r and (r[0], c, r[2]))):
+                    return False
+            for i in range(len(self.wheelIds)):
+                if(self.launches(i, c)!=[(d, ni, c) for (d, ni, nc) in self.launches(i, 0)]):
+                    return False
+        return True
+
+    def branches(self, wheels, fresh, used, count, same):
+        # The moves from a state which could still finish with count balls, as an iterator of (move, new
+        # wheels, fresh after, balls used) with the lowest estimate then the most progress first. If same,
+        # only one of the colours not on the board is dropped
+        if(same):
+            there={c for w in wheels for c in range(len(COLNAMES)) if colourCount(w, c)}
+            there.add(next((c for c in range(len(COLNAMES)) if c not in there), 0))
+        out=[]
+        for (move, nw, nf, cost) in self.moves(wheels, fresh, used):
+            if(same and move[0]==MV_DROP and move[2] not in there):
+                continue
+            nu=used+cost
+            f=nu+self.estimate(nw)
+            if(f<=count):
+                out.append((f, -self.progress(nw), len(out), (move, nw, nf, nu)))
+        out.sort()
+        return (o[3] for o in out)
+
+    def search(self, count, maxStates=MAX_STATES):
+        # Depth first branch and bound, can the level be completed with count balls? A state is dropped once
+        # the balls used plus estimate() go over count. Every state reached is kept with the fewest balls it
+        # was reached with, so it is only searched again if it is reached with fewer. Whether the waiting ball
+        # has just come on only matters while a T can't be shut, or with painters in the top ally. With a
+        # fixed colour order how many balls have gone is part of the state, as that says what comes next.
+        # Returns the moves, False if there is no way to do it, or None if we gave up after maxStates states
+        fixed=self.colours!=None
+        painted=any(self.feed(c)!=self.loop(c) for c in range(len(COLNAMES)))
+        same=self.symmetric()
+        start=(0,)*len(self.wheelIds)
+        best={}
+        path=[]
+        stack=[self.branches(start, True, 0, count, same)]
+        states=0
+        while(stack):
+            nxt=next(stack[-1], None)
+            if(nxt==None):
+                # Nothing more down here
+                stack.pop()
+                if(path):
+                    path.pop()
+                continue
+            (move, wheels, fresh, used)=nxt
+            key=(wheels, fresh if painted or self.short(wheels) else None, used if fixed else None)
+            if(key in best and best[key]<=used):
+                continue
+            best[key]=used
+            if(all(w&BLOWN for w in wheels)):
+                return path+[move]
+            self.states+=1
+            states+=1
+            if(states>maxStates):
+                return None
+            path.append(move)
+            stack.append(self.branches(wheels, fresh, used, count, same))
+        return False
+
+    def solve(self, maxStates=MAX_STATES):
+        # Returns (balls, moves) for the fewest balls found, or (None, None) if there isn't a solution (or we
+        # gave up). play() tries the fewest balls that could possibly do first, then one more each time, which
+        # gives a solution to beat. Then search() goes through the counts from lowerBound up to it. Each count
+        # it rules out moves lowerBound up one, and a solution it finds is the minimum. optimal is set once the
+        # solution uses lowerBound balls, if search() gives up first it isn't known if fewer would do
+        self.states=0
+        self.optimal=False
+        self.problem=None
+        self.lowerBound=self.lowest()
+        if(self.lowerBound==None):
+            # Some wheel can never get four balls of one colour
+            return (None, None)
+        last=self.lowerBound+MAX_EXTRA
+        if(self.colours!=None):
+            last=min(last, len(self.colours))
+        (balls, moves)=(None, None)
+        for count in range(self.lowerBound, last+1):
+            moves=self.play(count)
+            if(moves!=None):
+                balls=count
+                self.problem=None
+                break
+        for count in range(self.lowerBound, last+1 if balls==None else balls):
+            found=self.search(count, maxStates-self.states)
+            if(found==None):
+                # Gave up
+                break
+            if(found==False):
+                self.lowerBound=count+1
+                continue
+            problem=self.verify(found)
+            if(problem!=None):
+                self.problem=problem
+                break
+            (balls, moves)=(count, found)
+            break
+        self.optimal=balls==self.lowerBound
+        return (balls, moves)
+
+    # ---- Checking in the game ----
+
+    def verify(self, moves):
+        # Play moves in a gameEngine as a player would, turning wheels to line balls up and clicking them.
+        # After each move the wheels must hold what the solver says they do. Returns None if the game is
+        # won, otherwise what went wrong
+        colours=self.colours
+        if(colours==None):
+            colours=[m[2] for m in moves if m[0]==MV_DROP]
+        game=gameEngine(self.levelData, levelTime=CHECK_TIME)
+        game.rng=dealtColours(colours)
+        game.start()
+        wheels=(0,)*len(self.wheelIds)
+        fresh=True
+        n=0
+        for (m, move) in enumerate(moves):
+            if(not self.settle(game)):
+                return "move {}, {}: the game didn't settle".format(m+1, self.describe(move))
+            after=self.apply(wheels, fresh, move, n)
+            if(after==None):
+                return "move {}, {}: not allowed".format(m+1, self.describe(move))
+            if(move[0]==MV_LAUNCH):
+                problem=self.playLaunch(game, move)
+            else:
+                # A launch which left a south T open may have let it drop already
+                then=moves[m+1] if m+1<len(moves) else None
+                problem=self.playDrop(game, move, then) if game.ballCount<=n else None
+                n+=1
+            if(problem!=None):
+                return "move {}, {}: {}".format(m+1, self.describe(move), problem)
+            (wheels, fresh)=after
+            if(not self.settle(game)):
+                return "move {}, {}: the game didn't settle".format(m+1, self.describe(move))
+            if(game.ballCount==n and self.packWheels(game)!=wheels):
+                return "move {}, {}: the wheels don't match".format(m+1, self.describe(move))
+        for t in range(SETTLE_TICKS):
+            if(game.state!=0):
+                break
+            game.step()
+        if(game.state!=1):
+            return "the level wasn't won"
+        return None
+
+    def packWheels(self, game):
+        # The wheels of a game, packed as the solver keeps them
+        out=[]
+        for id in self.wheelIds:
+            wheel=game.wheels[id]
+            w=BLOWN if wheel.blown else 0
+            for b in wheel.docked:
+                if(b!=None):
+                    w+=1<<(COUNTBITS*b.colour)
+            out.append(w)
+        return tuple(out)
+
+    def waiting(self, ball):
+        # Is this the new ball going back and forth in the top ally?
+        return (ball.newBall and ball.wheel==-1 and ball.exploState<0 and ball.y<TILESIZE and
+                (ball.direction==EAST or ball.direction==WEST))
+
+    def waitingBall(self, game):
+        return next((b for b in game.balls if self.waiting(b)), None)
+
+    def settle(self, game):
+        # Step the game until nothing is moving but the waiting ball. False if that doesn't happen
+        for t in range(SETTLE_TICKS):
+            if(game.state!=0):
+                return game.state==1
+            if(not game.turning and all(b.exploState<0 and (b.wheel!=-1 or self.waiting(b)) for b in game.balls)):
+                return True
+            game.step()
+        return False
+
+    def ahead(self, ball):
+        # The south Ts the waiting ball gets to next if they are all shut, as a list of (ticks until it
+        # gets there, south T, its colour there), worked out a tile at a time from where it is
+        half=TILESIZE/2
+        d=ball.direction
+        col=ball.colour
+        tx=math.floor(ball.x/TILESIZE)
+        ty=math.floor(ball.y/TILESIZE)
+        if(tx>=self.tilesX):
+            # Still coming on from the right
+            cell=ty*self.tilesX+self.tilesX-1
+            dist=ball.x-(self.tilesX-1)*TILESIZE-half
+        else:
+            cell=ty*self.tilesX+tx
+            pos=ball.x-tx*TILESIZE if(d==EAST or d==WEST) else ball.y-ty*TILESIZE
+            dist=(half-pos)*(1 if(d==EAST or d==SOUTH) else -1)
+            if(ball.hitMiddle and ball.myTile==(tx, ty)):
+                # Past the middle of this tile, on to the next. hitMiddle is left over from the last tile until
+                # the ball has moved on this one
+                (cell, d, more)=self.nextMiddle(cell, d)
+                dist+=more
+        out=[]
+        for i in range(4*self.tilesX):
+            (d, col, act)=MIDDLE[(self.board[cell]*4+d)*4+col]
+            if(act==MID_SOUTHT and cell in self.stIndex):
+                out.append((dist/ball.game.ballSpeed, self.stIndex[cell], col))
+            (cell, d, more)=self.nextMiddle(cell, d)
+            dist+=more
+        return out
+
+    def nextMiddle(self, cell, d):
+        # From the middle of tile cell heading d to the middle of the next tile, or back to the middle of
+        # this one if it is a dead end. Returns (cell, direction, distance)
+        if((self.exits[cell]>>d)&1):
+            return (cell+DX[d]+DY[d]*self.tilesX, d, TILESIZE)
+        return (cell, (d+2)%4, TILESIZE-BALLSIZE)
+
+    def layout(self, game):
+        # What is in each slot of every wheel of a game, as {wheel tile: [colour or None]}
+        return {id:[b.colour if b!=None else None for b in w.docked] for (id, w) in game.wheels.items()}
+
+    def plan(self, layout, need, open=None):
+        # How far to turn wheels laid out as layout, as {wheel tile: quarter turns}. need has a test for the
+        # slots of wheels which must be turned a certain way. Every wheel under a south T is turned to shut as
+        # many as it can, except south T open which is left open. None if a wheel can't pass its test
+        out={}
+        for id in set(need)|set(self.tSlots):
+            best=None
+            for r in range(4):
+                t=turned(layout[id], r)
+                if(id in need and not need[id](t)):
+                    continue
+                if(any(s==open and t[slot]!=None for (s, slot) in self.tSlots.get(id, ()))):
+                    continue
+                shut=sum(1 for (s, slot) in self.tSlots.get(id, ()) if s!=open and t[slot]!=None)
+                if(best==None or shut>best[0]):
+                    best=(shut, r)
+            if(best==None):
+                return None
+            if(best[1]):
+                out[id]=best[1]
+        return out
+
+    def safeTurn(self, game, id):
+        # Can wheel id start a quarter turn now? Not if it opens a south T the waiting ball will get to
+        # before the next quarter turn shuts it again
+        ball=self.waitingBall(game)
+        if(ball==None or id not in self.tSlots):
+            return True
+        slots=game.wheels[id].docked
+        now=turned(slots, 1)
+        opened={s for (s, slot) in self.tSlots[id] if slots[slot]!=None and now[slot]==None}
+        return not any(s in opened and ROTSTEPS-1<=t<=2*(ROTSTEPS+1)+4 for (t, s, k) in self.ahead(ball))
+
+    def turn(self, game, plan, careful=True):
+        # Turn wheels by the quarter turns in plan, all at once. If careful a quarter turn isn't started
+        # while it could let the waiting ball drop. False if it takes too long
+        left=dict(plan)
+        for t in range(SETTLE_TICKS):
+            for id in list(left):
+                wheel=game.wheels[id]
+                if(left[id]==0):
+                    del left[id]
+                elif(not wheel.rotating and (not careful or self.safeTurn(game, id))):
+                    game.clickWheel(((id[0]+0.5)*TILESIZE, (id[1]+0.5)*TILESIZE))
+                    left[id]-=1
+            if(not left and not game.turning):
+                return True
+            game.step()
+        return False
+
+    def turnTime(self, plan):
+        # Ticks to turn the wheels in plan, all at once
+        return max(plan.values(), default=0)*(ROTSTEPS+1)
+
+    def waitClear(self, game, ts, ticks):
+        # Wait until the waiting ball won't get to any of the south Ts ts in the next ticks ticks. False if
+        # that never happens
+        for t in range(SETTLE_TICKS):
+            ball=self.waitingBall(game)
+            if(ball==None or not any(s in ts and p<ticks for (p, s, k) in self.ahead(ball))):
+                return True
+            game.step()
+        return False
+
+    def shutAll(self, game):
+        # Turn every wheel under a south T to shut as many as it can
+        plan=self.plan(self.layout(game), {})
+        return plan!=None and self.turn(game, plan)
+
+    def playLaunch(self, game, move):
+        # Turn the wheels so the ball is at the exit and there is a slot (or the ball to hit) where it lands,
+        # launch it, then shut the south Ts again. Lining up can leave a south T open, so wait for the waiting
+        # ball to be well clear of them first. Returns what went wrong, or None
+        (kind, i, c, d, hit)=move
+        (ni, nc, a)=self.landing(i, c, d)
+        (src, dst)=(self.wheelIds[i], self.wheelIds[ni])
+        land=lambda t: t[a]==hit
+        if(src==dst):
+            need={src:lambda t: t[d]==c and (a==d and hit==None or land(t))}
+        else:
+            need={src:lambda t: t[d]==c, dst:land}
+        if(not self.shutAll(game)):
+            return "the south Ts can't be shut"
+        layout=self.layout(game)
+        line=self.plan(layout, need)
+        if(line==None):
+            return "the wheels can't be turned to line it up"
+        # Once it has gone, turn back to shut the south Ts, keeping the slot it lands in
+        after={id:turned(slots, line.get(id, 0)) for (id, slots) in layout.items()}
+        after[src][d]=None
+        shut=self.plan(after, {dst:land})
+        ts={s for id in set(line)|set(shut)|{src, dst} for (s, slot) in self.tSlots.get(id, ())}
+        ticks=self.turnTime(line)+self.turnTime(shut)+ROTSTEPS
+        # Keeping the slot it lands in free can leave a T open which could otherwise be shut, until it docks
+        free=self.plan(after, {})
+        opened=any(turned(after[id], shut.get(id, 0))[slot]==None and turned(after[id], free.get(id, 0))[slot]!=None
+                   for (id, slots) in self.tSlots.items() for (s, slot) in slots)
+        if(opened):
+            ticks+=self.lengths[(src[1]*self.tilesX+src[0], d, c)]*TILESIZE/game.ballSpeed+self.turnTime(free)
+        if(not self.waitClear(game, ts, ticks)):
+            return "the waiting ball never got clear"
+        if(not self.turn(game, line, False)):
+            return "the wheels didn't turn"
+        ball=game.wheels[src].docked[d]
+        game.clickBall((ball.x, ball.y))
+        if(ball.wheel!=-1):
+            return "the ball didn't launch"
+        if(not self.turn(game, shut, False)):
+            return "the wheels didn't turn back"
+        if(opened):
+            for t in range(SETTLE_TICKS):
+                if(ball.wheel!=-1 or ball.exploState>=0):
+                    break
+                game.step()
+            if(not self.shutAll(game)):
+                return "the south Ts can't be shut"
+        return None
+
+    def playDrop(self, game, move, then=None):
+        # Shut every other south T and wait for the ball to be on its way to this one in the right colour
+        # before opening it. To hit a docked ball, turn it under the T once the ball has gone through. then is
+        # the next move, if it is a drop its T is opened as soon as this ball is through
+        (kind, s, c, k, hit)=move
+        ball=self.waitingBall(game)
+        if(ball==None):
+            return "there is no ball waiting"
+        (tile, li)=self.southTs[s]
+        (wid, slot)=(self.wheelIds[li], self.stSlot[s])
+        nxt=next((p for p in self.ahead(ball) if p[1]==s or game.checkSTopen(self.southTs[p[1]][0])), None)
+        if(not game.checkSTopen(tile) or nxt==None or nxt[1:]!=(s, k)):
+            if(not self.shutAll(game)):
+                return "the south Ts can't be shut"
+            plan=self.plan(self.layout(game), {}, s)
+            if(plan==None):
+                return "the south T can't be opened"
+            turns=plan.get(wid, 0)
+            for t in range(SETTLE_TICKS):
+                if(game.checkSTopen(tile)):
+                    break
+                nxt=next((p for p in self.ahead(ball) if p[1]==s or game.checkSTopen(self.southTs[p[1]][0])), None)
+                if(nxt!=None and nxt[1:]==(s, k) and nxt[0]>=self.turnTime({wid:turns})+4):
+                    break
+                game.step()
+            else:
+                return "the ball never lined up with the south T"
+            if(not self.turn(game, {wid:turns}, False)):
+                return "the wheel didn't turn"
+        for t in range(SETTLE_TICKS):
+            if(not self.waiting(ball)):
+                break
+            game.step()
+        else:
+            return "the ball didn't drop"
+        if(hit!=None):
+            r=next((r for r in range(4) if turned(self.layout(game)[wid], r)[slot]==hit), None)
+            if(r==None or not self.turn(game, {wid:r}, False)):
+                return "the ball to hit can't be turned under the south T"
+        elif(then!=None and then[0]==MV_DROP and self.southTs[then[1]][1]!=li):
+            # The next ball comes on as soon as this one docks, and a new ball can be dropped through a T near
+            # where it comes on. Open it now, or the ball will be past it before it could be opened
+            nid=self.wheelIds[self.southTs[then[1]][1]]
+            plan=self.plan(self.layout(game), {}, then[1])
+            if(plan!=None and not self.turn(game, {nid:plan.get(nid, 0)}, False)):
+                return "the wheel didn't turn"
+        return None
+
+    def describe(self, move):
+        # A move as text
+        if(move[0]==MV_LAUNCH):
+            text="launch {} from wheel {} to the {}".format(COLNAMES[move[2]], self.wheelIds[move[1]],
+                                                         DIRNAMES[move[3]])
+        else:
+            text="drop {} through south T {}".format(COLNAMES[move[2]], self.southTs[move[1]][0])
+            if(move[3]!=move[2]):
+                text+=", painted {} on the way".format(COLNAMES[move[3]])
+        if(move[-1]!=None):
+            text+=", exploding with a {}".format(COLNAMES[move[-1]])
+        return text
+# End of levelSolver class
+
+class dealtColours():
+    # Stands in for a game's random generator in verify(), so balls come in the colours the moves were worked
+    # out for. Once they run out the rest are random
+    def __init__(self, colours):
+        self.colours=colours
+        self.dealt=0
+        self.rng=random.Random(0)
+
+    def randrange(self, n):
+        self.dealt+=1
+        if(self.dealt<=len(self.colours)):
+            return self.colours[self.dealt-1]
+        return self.rng.randrange(n)
+# End of dealtColours class
+
+def seededColours(seed, count):
+    # The ball colours a gameEngine with this seed will give, in order
+    rng=random.Random(seed)
+    return [rng.randrange(len(COLNAMES)) for i in range(count)]
+
+if __name__ == "__main__":
+    args=sys.argv[1:]
+    seed=None
+    showMoves=False
+    files=[]
+    while(args):
+        a=args.pop(0)
+        if(a=="--seed"):
+            seed=int(args.pop(0))
+        elif(a=="--moves"):
+            showMoves=True
+        else:
+            files.append(a)
+    if(len(files)==0):
+        files=levelListFiles()
+    total=time.perf_counter()
+    for filename in files:
+        try:
+            levelData=readLevel(filename)
+            colours=None
+            if(seed!=None):
+                # The first is the ball waiting in the top ally
+                colours=seededColours(seed, MAX_BALLS)
+            solver=levelSolver(levelData, colours)
+        except levelError as e:
+            print("{}: {}".format(filename, e))
+            continue
+        start=time.perf_counter()
+        (balls, moves)=solver.solve()
+        secs=time.perf_counter()-start
+        if(balls==None):
+            if(solver.lowerBound==None):
+                print("{}: can't be completed".format(filename))
+            else:
+                print("{}: no solution found, needs at least {} balls ({} states, {:.1f}s)".format(
+                    filename, solver.lowerBound, solver.states, secs))
+            if(solver.problem!=None):
+                print("    Last one tried didn't win in the game, at {}".format(solver.problem))
+            continue
+        if(solver.optimal):
+            print("{}: {} wheels, minimum {} balls ({} moves, {:.1f}s)".format(filename, len(solver.wheelIds),
+                balls, len(moves), secs))
+        else:
+            print("{}: {} wheels, {} balls, minimum not proven, at least {} ({} moves, {} states, {:.1f}s)".format(
+                filename, len(solver.wheelIds), balls, solver.lowerBound, len(moves), solver.states, secs))
+            if(solver.problem!=None):
+                print("    A solution with fewer didn't win in the game, at {}".format(solver.problem))
+        if(showMoves):
+            for m in moves:
+                print("   ", solver.describe(m))
+    print("Total {:.1f}s".format(time.perf_counter()-total))
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+#
+# bamSound
+# Plays the game's sound effects. Each effect has its own mixer channels, set aside when the manager is made, so a
+# burst of one effect can't take the channels of another and nothing is allocated while playing. When every
+# channel of an effect is busy the one started longest ago is cut off. The same effect played again within
+# SOUND_COALESCE ms is only played once, so four balls exploding in a wheel, and the wheel blowing, in the same
+# frame make one sound rather than five on top of each other.
+#
+# With sound off the mixer is never started and no sounds are loaded, playing does nothing. The front end turns
+# it off for headless runs.
+import pygame
+
+SOUND_COALESCE=40           # ms an effect is not played again for
+DEFAULT_CHANNELS=1          # Channels for an effect not given a number
+
+class soundManager():
+    def __init__(self, files, load, channels={}, enabled=True):
+        # files is a dictionary of effect name: file, load(name, file) gives a pygame Sound for one. channels is
+        # how many channels to set aside for each effect
+        self.enabled=enabled
+        self.sounds={}
+        self.channels={}
+        self.started={}     # When each channel of each effect last started playing
+        self.lastPlayed={}
+        if(not enabled):
+            return
+        if(not pygame.mixer.get_init()):
+            try:
+                pygame.mixer.init()
+            except pygame.error as e:
+                print("No sound:", e)
+                self.enabled=False
+                return
+        counts={name:channels.get(name, DEFAULT_CHANNELS) for name in files}
+        total=sum(counts.values())
+        pygame.mixer.set_num_channels(total)
+        # Reserved channels are never picked by Sound.play(), so only we decide which effect uses them
+        pygame.mixer.set_reserved(total)
+        c=0
+        for (name, f) in files.items():
+            self.sounds[name]=load(name, f)
+            self.channels[name]=[pygame.mixer.Channel(c+i) for i in range(counts[name])]
+            self.started[name]=[0]*counts[name]
+            self.lastPlayed[name]=None
+            c+=counts[name]
+
+    def __contains__(self, name):
+        return name in self.sounds
+
+    def play(self, name):
+        # Play an effect, unless it was played in the last SOUND_COALESCE ms
+        if(name not in self.sounds):
+            return
+        now=pygame.time.get_ticks()
+        last=self.lastPlayed[name]
+        if(last!=None and now-last<SOUND_COALESCE):
+            return
+        self.lastPlayed[name]=now
+        # A free channel, or if they are all busy the one started longest ago
+        chans=self.channels[name]
+        started=self.started[name]
+        i=min(range(len(chans)), key=lambda i:(chans[i].get_busy(), started[i]))
+        started[i]=now
+        chans[i].play(self.sounds[name])
+
+    def stop(self):
+        if(self.enabled):
+            pygame.mixer.stop()
+# End of soundManager class
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# bamText
+# Text for the game screens, rendered once and kept. Outlined text takes dozens of blits to draw, and the lobby and
+# info panel draw the same few strings over and over, so textCache keeps what has been rendered by everything it
+# was rendered from (the text, font, colours and outline width). The least recently used is dropped when it holds
+# more than its size. Surfaces from the cache are shared, so they are only ever blitted, never drawn on.
+#
+# The timer changes every second, so rather than rendering it glyphStrip renders each character it can show once
+# into a strip (a textureAtlas) and draws strings a glyph at a time from there. Glyphs are spaced by their advance
+# and the kerning between each pair, worked out once from the font. The font renders whole strings at fractions of
+# a pixel, so a glyph can land a pixel away from where rendering the whole string would put it.
+import pygame
+from collections import OrderedDict
+from bamAtlas import textureAtlas
+
+TEXT_CACHE=64           # Rendered strings kept
+
+# Draw a font with outline. Copied from
+# https://stackoverflow.com/questions/54363047/how-to-draw-outline-on-the-fontpygame
+_circle_cache = {}
+def _circlepoints(r):
+    r = int(round(r))
+    if r in _circle_cache:
+        return _circle_cache[r]
+    x, y, e = r, 0, 1 - r
+    _circle_cache[r] = points = []
+    while x >= y:
+        points.append((x, y))
+        y += 1
+        if e < 0:
+            e += 2 * y - 1
+        else:
+            x -= 1
+            e += 2 * (y - x) - 1
+    points += [(y, x) for x, y in points if x > y]
+    points += [(-x, y) for x, y in points if x]
+    points += [(x, -y) for x, y in points if y]
+    points.sort()
+    return points
+
+def outlineText(text, font, gfcolor=pygame.Color('dodgerblue'), ocolor=(255, 255, 255), opx=2):
+    # Also from stack overflow. Uses above function to produce text with an outline
+    textsurface = font.render(text, True, gfcolor).convert_alpha()
+    w = textsurface.get_width() + 2 * opx
+    h = font.get_height()
+
+    osurf = pygame.Surface((w, h + 2 * opx)).convert_alpha()
+    osurf.fill((0, 0, 0, 0))
+
+    surf = osurf.copy()
+
+    osurf.blit(font.render(text, True, ocolor).convert_alpha(), (0, 0))
+
+    for dx, dy in _circlepoints(opx):
+        surf.blit(osurf, (dx + opx, dy + opx))
+
+    surf.blit(textsurface, (opx, opx))
+    return surf
+
+class textCache():
+    def __init__(self, size=TEXT_CACHE):
+        self.size=size
+        self.surfaces=OrderedDict()     # key: surface, least recently used first
+
+    def get(self, key, make):
+        # The surface for key, make() draws it if it isn't kept
+        if(key in self.surfaces):
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+        surf=make()
+        self.surfaces[key]=surf
+        while(len(self.surfaces)>self.size):
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def render(self, text, font, colour):
+        # Plain antialiased text
+        return self.get(("text", text, font, tuple(colour)), lambda: font.render(text, True, colour))
+
+    def outline(self, text, font, gfcolor, ocolor, opx=2):
+        # Text with an outline, as outlineText()
+        return self.get(("outline", text, font, tuple(gfcolor), tuple(ocolor), opx),
+                        lambda: outlineText(text, font, gfcolor, ocolor, opx))
+
+    def clear(self):
+        self.surfaces.clear()
+# End of textCache class
+
+class glyphStrip():
+    def __init__(self, font, chars, colour):
+        # Renders each of chars in font. The display must be set up first
+        self.atlas=textureAtlas({c:font.render(c, True, colour) for c in chars})
+        self.height=font.get_height()
+        self.advance={c:font.size(c)[0] for c in chars}
+        # How much closer (or further apart) each pair of glyphs is than their advances
+        self.kern={(a, b):font.size(a+b)[0]-self.advance[a]-self.advance[b] for a in chars for b in chars}
+
+    def width(self, text):
+        return sum(self.advance[c] for c in text)+sum(self.kern[p] for p in zip(text, text[1:]))
+
+    def draw(self, dest, text, pos):
+        # Draw text at pos on dest a glyph at a time, returns the rectangle drawn. Every character must be in the strip
+        (x, y)=pos
+        prev=None
+        for c in text:
+            if(prev!=None):
+                x+=self.kern[(prev, c)]
+            dest.blit(self.atlas.surface, (x, y), self.atlas.rect(c))
+            x+=self.advance[c]
+            prev=c
+        return pygame.Rect(pos, (self.width(text), self.height))
+# End of glyphStrip class
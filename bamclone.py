@@ -4,23 +4,67 @@
 # A clone of the old Archimedes game bambuzle, by Kuldip S Pardesi, published by Arxe Systems
 
 import pygame
-import csv, math, random
-import os, sys
+import math
+import os, sys, time
+from collections import OrderedDict
 from tileImages import tileImages
+from bamAssets import assetCache, cacheKey
+from bamAtlas import textureAtlas
+from bamText import textCache, glyphStrip
+from bamProfile import frameProfiler
+from bamSound import soundManager
+from bamReplay import saveReplay
+from bamPack import levelPack, packIsCurrent, PACK_FILE
+from bamEngine import gameEngine, readLevel, levelError
+from bamEngine import TILESIZE, TILESX, TILESY, PWIDTH, WHSIZE, BALLSIZE, BALLCOLS, EXP_NO
+from bamEngine import DOCKSTEPS
 
 # Constants
 # =========
-TILESIZE = 120          # The size of individual tiles (square)
-TILESX = 8              # Number of tiles across the X
-TILESY = 6               # Number of tiles across the y
-WINMARG = TILESIZE//3      # The margin around the tiles
-PWIDTH=TILESIZE//2.5     # Pipe width. Pipes and balls are based on this size
-WHSIZE=TILESIZE*0.9     # Size of a wheel
-BALLSIZE=math.floor(PWIDTH*0.7)
-
-# Define the top bar
-TOPMARG=WINMARG//2       # Use a smaller margin, screen down will go TOPMARG, TOPBAR, TOPMARG
-TOPBAR=BALLSIZE+8       # Allow display for a ball, and a border
+# Tile, pipe, wheel and ball sizes are set in bamEngine, as the game model is built on them. The window can be
+# drawn at any of SCALES times that size, by resizing it or with the +/- keys. TILESIZE, PWIDTH, WHSIZE and
+# BALLSIZE here are the sizes on the screen at the current scale (see setSizes()), the model always works at
+# BOARD_TILESIZE. Everything drawn for a scale is kept for the last SCALE_CACHE scales used, so going back to
+# one is instant
+BOARD_TILESIZE = TILESIZE
+SCALES = (0.5, 0.75, 1, 1.25, 1.5, 1.75, 2)
+START_SCALE = 1
+SCALE_CACHE = 3
+SCALE = START_SCALE
+
+# Levels can be bigger than the TILESX by TILESY tiles the window shows. The view then scrolls over the board with
+# the arrow keys or mouse wheel, and only the tiles, wheels and balls in view are drawn. The rest of the board
+# still plays
+SCROLL_SPEED = 8            # Tiles a second the arrow keys scroll
+scroll = [0, 0]             # Board position at the top left of the view, in board units
+VIEW = 1                    # Screen pixels per board unit
+
+def setSizes(scale):
+    # Work out the sizes on the screen for drawing at scale, in the same way bamEngine does for the model
+    global TILESIZE, PWIDTH, WHSIZE, BALLSIZE, WINMARG, TOPMARG, TOPBAR, WIDTH, HEIGHT, origin, VIEW
+    global bxmarg, bymarg, brad
+    TILESIZE = round(BOARD_TILESIZE*scale)
+    PWIDTH = TILESIZE//2.5
+    WHSIZE = TILESIZE*0.9
+    BALLSIZE = math.floor(PWIDTH*0.7)
+    VIEW = TILESIZE/BOARD_TILESIZE
+    WINMARG = TILESIZE//3      # The margin around the tiles
+
+    # Define the top bar
+    TOPMARG=WINMARG//2       # Use a smaller margin, screen down will go TOPMARG, TOPBAR, TOPMARG
+    TOPBAR=BALLSIZE+8       # Allow display for a ball, and a border
+
+    # Claculate the window size
+    WIDTH=(TILESIZE*TILESX)+(WINMARG*2)
+    HEIGHT=(TILESIZE*TILESY)+(WINMARG*2)+TOPBAR
+    #print(WIDTH,HEIGHT)
+    # Where the top left of the board is on the screen, moved by scrolling, see showView()
+    origin=(WINMARG, WINMARG+TOPBAR)
+
+    bxmarg=40*scale           # Button border margin
+    bymarg=30*scale
+    brad=round(20*scale)      # Button corner radius
+setSizes(SCALE)
 
 # Parameters for difficulty settints
 diffParam = {
@@ -31,28 +75,54 @@ diffParam = {
 difficulty="Normal"         # This will error if the difficulty does not match the above
 showSeconds = True          # Set to false to not display the seconds on the countdown timer
 
-# Ball speed, rot steps and FPS control how fast the game flows. If you make the tiles smaller, you may
+# Ball speed, rot steps (in bamEngine) and FPS control how fast the game flows. If you make the tiles smaller, you may
 # want to drop FPS or slow down the ball, as it will still cover the same amount of pixels as a larger tile
 BALLSPEED=diffParam[difficulty]["ballspeed"]            # Number of pixels to move per cycle
-ROTSTEPS=10             # Number of steps to rotate the wheel in
-FPS = diffParam[difficulty]["FPS"]              # Game frames per second
-EXPTIME = 200           # ms for the explosion to appear and the ball finally die
+FPS = diffParam[difficulty]["FPS"]              # Game ticks per second, the game always runs at this rate
+# The screen is drawn separately from the game ticks, with balls drawn between their last two positions. Drop
+# RENDER_FPS to 30 on slow machines, the game will still run at the same speed
+RENDER_FPS = 60         # Screen frames per second
+MAX_STEPS = 12          # Most game ticks to catch up in one frame. Any further behind and the game slows down
 BALL_LIMIT = -1          # -1 for infinite balls. May set a limit for testing or an extra challenge
-ballCount = 0           # Track the number of balls released
 SCORE = 0
 
 LEVEL_TIME = diffParam[difficulty]["levelTime"]        # Default number of seconds for the level
 LEVEL_LIST_FILE = os.path.join("levels", "levelList")
+# Set SAVE_REPLAYS to keep a replay of every level played in REPLAY_DIR, play them back with bamReplay.py
+SAVE_REPLAYS = False
+REPLAY_DIR = "replays"
+# F3 shows how long each phase of a frame takes. Set PROFILE_CSV to a file name to write the phases of every frame
+# to it as well, see bamProfile.py
+PROFILE_PHASES = ("wait", "events", "game", "sprites", "timer", "draw", "flip")
+PROFILE_CSV = None
+OVERLAY_UPDATE = 500        # ms between redrawing the profiler overlay
 
 # Explosion details
 EXP_PREFIX=os.path.join("sprites","expl_03_00")
 EXP_SUFFIX=".png"
-EXP_NO=23
-EXP_INTERVAL=EXPTIME/EXP_NO
 
-# Global game counters
-NUM_WHEELS=0        # Count of the number of wheels
-BLOWN_WHEELS=0      # Count the number of wheels blown
+# Sounds, by the name of the game event they are played for
+soundDir="sounds"
+SOUND_FILES={
+    "woosh":"punch-2-166695.mp3",
+    "dock":"clank1-91862.mp3",
+    "explode":"impact-152508.mp3",
+    "launch":"sci-fi-glitch-sound-105730.wav",
+    "success":"game-start-6104.wav",
+    "fail":"failure-drum-sound-effect-2-7184.wav"
+}
+# Mixer channels set aside for each sound, see bamSound.py. Run with BAMCLONE_SOUND=0 for no sound at all, the mixer
+# isn't even started
+SOUND_CHANNELS={"woosh":2, "dock":2, "explode":3, "launch":1, "success":1, "fail":1}
+SOUND = os.environ.get("BAMCLONE_SOUND", "1")!="0"
+
+# Everything the images and sounds are made from. When one of these files or sizes changes the asset cache is
+# made again (see bamAssets.py)
+ASSET_FILES=[os.path.join('sprites','300gradball.png'), os.path.join('sprites','blownCoin.png'), "tileImages.py",
+             __file__]+[EXP_PREFIX+str(i+1).zfill(2)+EXP_SUFFIX for i in range(EXP_NO)]+[
+             os.path.join(soundDir, f) for f in SOUND_FILES.values()]
+ASSET_SIZES=[("TILESIZE", TILESIZE), ("PWIDTH", PWIDTH), ("WHSIZE", WHSIZE), ("BALLSIZE", BALLSIZE),
+             ("BALLCOLS", BALLCOLS), ("EXP_NO", EXP_NO)]
 
 # Colours
 BG=(0,0,64)
@@ -71,36 +141,11 @@ fontName='freesansbold'    # This should be a generic font on all systems
 
 LINECOL=(200,200,200)
 LINEWIDTH=2
-bxmarg=40           # Button border margin
-bymarg=30
-brad=20             # Button corner radius
-
-# Ball colours
-BALLCOLS = {
-    "R":(255,0,0),
-    "G":(0,255,0),
-    "B":(0,0,255),
-    "Y":(255,255,0)
-}
+
 ICONBOR=3                   # Number of pixels wide for icon border
 INFOPBOR=4                  # Size of info panel border
 TIMEBARBOR=12               # Margin for timer slider
 
-# List structure of what tiles have open, used to decide if a ball can flow
-openEnds={
-    "N":["V","NEL","NWL","W", "BV", "PV"],
-    "E":["H", "ST", "NEL", "SEL", "W", "BH", "PH"],
-    "S":["V", "SEL", "SWL", "W", "BV", "PV"],
-    "W":["H", "ST", "NWL", "SWL", "W", "BH", "PH"]
-}
-
-# Claculate the window size
-WIDTH=(TILESIZE*TILESX)+(WINMARG*2)
-HEIGHT=(TILESIZE*TILESY)+(WINMARG*2)+TOPBAR
-#print(WIDTH,HEIGHT)
-origin=(WINMARG, WINMARG+TOPBAR)
-paused=False
-nextCol="R"
 showInfoPan=False
 
 # Set up level data
@@ -108,8 +153,10 @@ showInfoPan=False
 
 # levelFile=os.path.join("levels","level1.csv")
 # Process command line arguments
-# Basic - If a second argument is supplied, assume this is the path to a level file
-if(len(sys.argv)>1):
+# Basic - If a second argument is supplied, assume this is the path to a level file. When we are imported (by
+# bamBench.py) the command line isn't ours and the level list is loaded
+pack=None
+if(__name__=="__main__" and len(sys.argv)>1):
     # File supplied on command line, game is only single level
     levelList=[sys.argv[1]]
     curLevel=0
@@ -124,603 +171,228 @@ else:
             levelList.append(os.path.join("levels", l.rstrip('\n')))
             maxLevels+=1
     #print(levelList)
+    # Load the levels from the level pack if it has been built (python bamPack.py build) and is up to
+    # date, otherwise from the level files
+    if(packIsCurrent(levelList)):
+        pack=levelPack(PACK_FILE)
 print("Number of levels = ", maxLevels)
 
 
-# Start pygame
-pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
+# Start pygame. With sound off everything but the mixer is started
+if(SOUND):
+    pygame.init()
+else:
+    pygame.display.init()
+screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
 pygame.display.set_caption("Bamclone")
 # Init fonts
 pygame.font.init()
 clock = pygame.time.Clock()
-all_sprites = pygame.sprite.Group()
+all_sprites = pygame.sprite.LayeredDirty()
 
-# Load in images
-tImg = tileImages(TILESIZE, PWIDTH, BALLCOLS)
+# Images and sounds come from the asset cache when it is up to date, otherwise they are made and the cache is
+# saved once everything has been made. The cache holds the images for START_SCALE
+assets = assetCache(cacheKey(ASSET_FILES, ASSET_SIZES))
 
-# Define the level array
-levelData=[]
-wheels={}
-southTs={}
+# Images drawn at each scale, most recently used last. See setScale()
+scaleCache=OrderedDict()
 
+# Outlined text and lobby buttons, kept by what they were drawn from. See bamText
+texts=textCache()
 
+# Frame timing, only done while the overlay is shown or PROFILE_CSV is set
+profiler=frameProfiler(PROFILE_PHASES)
+if(PROFILE_CSV):
+    profiler.openCSV(PROFILE_CSV)
+showProfile=False
+profOverlay={"image":None, "nextUpdate":0}
 
-# Define opposites, used for traversing tiles
-opposite={"N":"S","E":"W","S":"N","W":"E"}
+# The game model of the level being played, see bamEngine
+game=None
 
 # Load images
-gradball = pygame.image.load(os.path.join('sprites','300gradball.png')).convert()
-gradball.set_colorkey((0,0,0))
-blownIcon = pygame.image.load(os.path.join('sprites','blownCoin.png')).convert_alpha()
-blownIcon = pygame.transform.scale(blownIcon, (WHSIZE/8,WHSIZE/8))
-nextBallIcon = pygame.Surface((TOPBAR,TOPBAR))
+gradball = None         # Only loaded if the wheel or balls have to be drawn, see gradballImage()
+nextBallIcon = None     # Atlas rectangle of the next ball icon, see genNextBallIcon()
+
+# Rendering is done with dirty rectangles. The tiles never change during a level so they are drawn once
+# onto the background, then only the parts of the screen that change each frame are redrawn and updated.
+# The background and board are set up for the scale by setScale(). boardRect is the part of the screen the
+# board is shown in, the view
+background = None
+boardRect = None
+wheelSprites = {}           # Sprites of the wheels in view, by tile, see showWheels()
+BALL_LAYER = 1              # Balls are drawn over the wheels
+screenState = {
+    "fullRedraw":True,      # Redraw and flip the whole screen on the next frame
+    "topBar":None,          # What the top bar was last drawn with, it is redrawn when this changes
+    "infoPan":None          # Message on the info panel when last drawn, None if not shown
+}
 
 # Set up sounds
-soundDir="sounds"
-sounds={
-    "woosh":pygame.mixer.Sound(os.path.join(soundDir, "punch-2-166695.mp3")),
-    "dock":pygame.mixer.Sound(os.path.join(soundDir, "clank1-91862.mp3")),
-    "explode":pygame.mixer.Sound(os.path.join(soundDir, "impact-152508.mp3")),
-    "launch":pygame.mixer.Sound(os.path.join(soundDir, "sci-fi-glitch-sound-105730.wav")),
-    "success":pygame.mixer.Sound(os.path.join(soundDir, "game-start-6104.wav")),
-    "fail":pygame.mixer.Sound(os.path.join(soundDir, "failure-drum-sound-effect-2-7184.wav"))
-}
+sounds=soundManager(SOUND_FILES, lambda name, f:assets.sound(name, os.path.join(soundDir, f)), SOUND_CHANNELS, SOUND)
 
 # Create structure for the timer
+# The level clock itself is kept by the game model, which stops it while paused
 ts = {
-    "startTime":0,        # Time clock starts
-    "endTime":0,          # Game over time
     "levelTime":LEVEL_TIME*1000,    # How long the level has
     "timeLeft":0,         # Remaining time
     "timerMask":(0,0,0,0),     # The size of the mask over the timer bar, calculated as a rect
-    "nextUpdate":0,        # We don't update timers and do calculations every cycle of the loop as this is very frequent 
-    "pauseStart":0         # Used to adjust time when the game is paused
+    "nextUpdate":0        # We don't update timers and do calculations every cycle of the loop as this is very frequent 
 }
 
 # ************* Game classes *******************
-class Ball(pygame.sprite.Sprite):
-    def __init__(self, col):
-        pygame.sprite.Sprite.__init__(self)
-        self.colour=col
-        self.image=ballImage[col]
-        self.newBall=True           # Will change to false on first dock/entry ally is free
-        self.direction="W"          # Use 4 compass points as directions
-        self.wheel=-1               # Will have the number of a wheel if docked, -1 if in motion
-        self.myTile=(-1,-1)         # Track what tile we are on
-        self.rect=self.image.get_rect()
-        self.rect.x=origin[0]+TILESIZE*TILESX
-        self.rect.centery=origin[1]+TILESIZE/2
-        self.hitMiddle=False    # Track if we have been in the middle of the tile yet
-        self.msg=""             # A persistant message which can be set, useful for debugging. Will print if changed on update
-        self.exploState=-1         # < 0 if we are not exploding
-        self.nextExplo=0        # What time do we change the explode graphic?
-        
-    def update(self):
-        if(paused):
+# The game itself lives in bamEngine. These sprites draw the model objects on the screen
+
+class ballSprite(pygame.sprite.DirtySprite):
+    # Draws a Ball, drawn straight from the atlas with source_rect the part of it to draw. Sprites are kept in
+    # ballSprites when their ball starts to explode, and used again for the next ball, see newBallSprite()
+    def __init__(self):
+        pygame.sprite.DirtySprite.__init__(self)
+        self.ball=None
+        self.gen=0                  # The use of the ball we are drawing, see Ball.gen
+        self.rect=pygame.Rect(0, 0, 0, 0)
+
+    def attach(self, ball, alpha=1):
+        self.ball=ball
+        self.gen=ball.gen
+        self.image=atlas.surface
+        self.source_rect=None
+        self.update(alpha)
+
+    def release(self):
+        # Taken off the screen, and kept for the next ball
+        self.kill()
+        self.ball=None
+        ballSprites.append(self)
+
+    def track(self, src, alpha):
+        # Centre src, a rectangle of the atlas, on the ball. The rectangle is changed in place. Only redraw if we
+        # have moved or changed
+        b=self.ball
+        r=self.rect
+        (x, y)=(r.x, r.y)
+        if(src is not self.source_rect or atlas.surface is not self.image):
+            self.image=atlas.surface
+            self.source_rect=src
+            r.size=src.size
+            self.dirty=1
+        r.centerx=origin[0]+(b.lastX+(b.x-b.lastX)*alpha)*VIEW
+        r.centery=origin[1]+(b.lastY+(b.y-b.lastY)*alpha)*VIEW
+        # Balls outside the view aren't drawn
+        visible=r.colliderect(boardRect)
+        if(visible!=self.visible):
+            # Redraws, or clears where it was
+            self.visible=visible
+        elif(visible and (r.x!=x or r.y!=y)):
+            self.dirty=1
+
+    def update(self, alpha=1):
+        # alpha is how far we are between the last game tick and the next, 0 to 1
+        b=self.ball
+        if(not b.alive or b.gen!=self.gen):
+            # Removed from the game
+            self.release()
             return
-        if(self.exploState>=0):
-            self.explode()
-        elif(self.wheel==-1):
-            msg=""  # Blank debugging message if needed
-            # What tile coord are we in, and what tile type is it?
-            xtile=math.floor((self.rect.centerx-origin[0])/TILESIZE)
-            # Special case on launch as the ball is off the board
-            if(xtile>=TILESX):
-                self.rect.x-=BALLSPEED
-                return
-            
-            ytile=math.floor((self.rect.centery-origin[1])/TILESIZE)
-            # Create tuple as useful index
-            tileTup=(xtile, ytile)
-            if(tileTup!=self.myTile):
-                #print("I'm on a new tile")
-                self.hitMiddle=False
-                self.myTile=tileTup
-            tiletype=levelData[ytile][xtile]
-            #msg="Tile coord ({},{}), type {}".format(xtile,ytile, tiletype)
-            # Calculate position within the tile
-            xpos=self.rect.centerx-origin[0]-TILESIZE*xtile
-            ypos=self.rect.centery-origin[1]-TILESIZE*ytile
-
-            # Are we over a wheel?
-            if(tiletype=="W"):
-                #msg="On a wheel, with direction going "+self.direction
-                point=opposite[self.direction]
-                whid=(xtile,ytile)
-                whdoc=wheels[whid].dockingpos[point]
-                # Dock if we have passed the docking location in x or y, but if we are over half way
-                # then we are being released and should not immediately doc
-                if(self.direction=="S" and ypos>whdoc[1] and ypos<TILESIZE/2):
-                    # Dock to the north
-                    self.dock(whid, point)
-                elif(self.direction=="N" and ypos<whdoc[1] and ypos>TILESIZE/2):
-                    # Dock to the south
-                    self.dock(whid, point)
-                elif(self.direction=="E" and xpos>whdoc[0] and xpos<TILESIZE/2):
-                    # Dock to the west
-                    self.dock(whid, point)
-                elif(self.direction=="W" and xpos<whdoc[0] and xpos>TILESIZE/2):
-                    # Dock to the East
-                    self.dock(whid, point)
-            else:
-                #msg="Not on a wheel"
-                bounce=False
-                atEdge=False
-                # Are we at the tile edge?
-                if(self.direction=="W" and (xpos-BALLSIZE/2)<BALLSPEED):
-                    atEdge=True  
-                elif(self.direction=="E" and (xpos+BALLSIZE/2)>TILESIZE):
-                    atEdge=True
-                elif(self.direction=="S" and (ypos+BALLSIZE/2)>TILESIZE):
-                    atEdge=True
-                elif(self.direction=="N" and (ypos-BALLSIZE/2)<BALLSPEED):
-                    atEdge=True
-                if(atEdge):
-                    nextTile=findNextTile((xtile,ytile), self.direction)
-                    if(nextTile==None or not isEndOpen(nextTile["type"], opposite[self.direction])):
-                        bounce=True
-                if(bounce):
-                    self.direction=opposite[self.direction]
-                    self.hitMiddle=False
-                        
-
-                # Are we at the tile middle?
-                if(self.hitMiddle==False):
-                    # Track with hitMiddle, we don't want this executing multiple times. That could be detected.
-                    # If the ball is not moving at 1px per time it may never hit the middle exactly.
-                    # This must reset as we enter a new tile
-                    if(self.direction=="W" and xpos<TILESIZE/2):
-                        self.hitMiddle=True
-                    elif(self.direction=="E" and xpos>TILESIZE/2):
-                        self.hitMiddle=True
-                    elif(self.direction=="N" and ypos<TILESIZE/2):
-                        self.hitMiddle=True
-                    elif(self.direction=="S" and ypos>TILESIZE/2):
-                        self.hitMiddle=True
-                    if(self.hitMiddle):
-                        # Take action on certain tiles, such as corners or Ts
-                        if(tiletype=="ST"):
-                            if(checkSTopen(self.myTile)):
-                                self.direction="S"
-                        elif(tiletype.endswith("L")):
-                            # We are on a corner, change direction
-                            self.direction=LotherEnd(tiletype, opposite[self.direction])
-                        elif(tiletype.startswith("PH") or tiletype.startswith("PV")):
-                            # Painter, change the colour of the ball
-                            self.changeColour(tiletype[3])
-                        elif(tiletype.startswith("BH") or tiletype.startswith("BV")):
-                            # Blocker, do we allow through or bounce?
-                            blcol=tiletype.split(".")[1]
-                            if(self.colour!=blcol):
-                                self.direction=opposite[self.direction]
-                                
-                    # End of hitMiddle actions
-            # End of 'not on a wheel'
-
-            if(msg!="" and msg!=self.msg):
-                print(msg)
-                self.msg=msg
-
-
-            # Move the ball if in motion
-            if(self.direction=="W"):
-                self.rect.x-=BALLSPEED
-            elif(self.direction=="E"):
-                self.rect.x+=BALLSPEED
-            elif(self.direction=="N"):
-                self.rect.y-=BALLSPEED
-            elif(self.direction=="S"):
-                self.rect.y+=BALLSPEED
-    # End of update
-
-    def dock(self, whid, point):
-        # Dock the ball in the wheel
-        #print("Docking ", point)
-        self.direction=point
-        self.wheel=whid
-        coord=wheels[whid].dockBall(self, point)
-        self.setCoord(coord, point)
-        if(self.newBall):
-            # This was a new ball, the top ally is now clear
-            self.newBall=False
-            launchNext()
-
-    def setCoord(self, coord, docPoint):
-        # Set the coordinate or the ball.
-        # Coord received will be center coords relative to the current tile
-        # docPoint will be the point of the wheel for a docked ball
-        self.rect.centerx=coord[0]+origin[0]+self.myTile[0]*TILESIZE
-        self.rect.centery=coord[1]+origin[1]+self.myTile[1]*TILESIZE
-        if(docPoint!=None):
-            self.direction=docPoint
-
-    def handleEvent(self,event):
-        isMe=False;
-        if(paused):
-            return False
-        if(self.rect.collidepoint(event.pos)):
-            #print("I was clicked ", self.colour)
-            isMe=True
-            if(self.wheel!=-1):
-                #print("  and I was docked in wheel {} point {}, lets go".format(self.wheel, self.direction))
-                # Check if I can launch in this direction
-                if(wheels[self.wheel].checkExit(self.direction)):
-                    # Yes, all clear
-                    wheels[self.wheel].undock(self.direction)
-                    # Remove from wheel
-                    self.wheel=-1
-                    sounds["launch"].play()
-                # else:
-                #     print("No valid exit that way....")
-        return isMe
-    # End of handle event
-
-    def explode(self):
-        # Start the explosion in motion or continue the explosion
-        if(self.exploState==-1):
-            # Explosion not started
-            self.exploState=EXP_NO
-            self.nextExplo=0
-        elif(self.exploState==0):
-            # Explosion effect finished
-            # If we are docked, undock
-            if(self.wheel!=-1):
-                wheels[self.wheel].undock(self.direction)
-            # And remove
-            self.kill()
-        else:
-            # Continue explosion
-            ctime=pygame.time.get_ticks()
-            if(ctime>self.nextExplo):
-                # This is the next explosion step
-                # Change the image
-                cx=self.rect.centerx
-                cy=self.rect.centery
-                self.image=explosion[self.exploState-1]
-                self.rect=self.image.get_rect()
-                # Centre the image
-                self.rect.centerx=cx
-                self.rect.centery=cy
-                # Update the timer
-                self.nextExplo=ctime+EXP_INTERVAL
-                # Drop the explosion counter
-                self.exploState-=1
-
-    def changeColour(self, c):
-        # Change the ball to this colour
-        self.colour=c
-        self.image=ballImage[c]
-# End of Ball class
-    
-class Wheel(pygame.sprite.Sprite):
-    def __init__(self, id):
-        pygame.sprite.Sprite.__init__(self)
-        #print("Init wheel ", id)
-        self.id=id
-        self.rotating=False         # Track if we are rotating
-        self.rotangle=0
-        self.blown=False
-        self.docked={"N":None,"E":None,"S":None,"W":None}
-        self.numDocked=0
-        # Docking positions for drawing the balls and doing cutouts
-        self.halftile=math.floor(TILESIZE/2)
-        self.ballrad=math.floor(BALLSIZE/2)
-        self.cutdist=math.floor(WHSIZE/2)-self.ballrad+5
-        self.dockingOrig={
-            "N":(TILESIZE/2,self.halftile-self.cutdist),
-            "E":(self.halftile+self.cutdist,TILESIZE/2),
-            "S":(TILESIZE/2,self.halftile+self.cutdist),
-            "W":(self.halftile-self.cutdist,TILESIZE/2),
-        }
-        self.dockingpos=self.dockingOrig.copy()        # Save a copy to revert to
-        self.image=self.imageGen()
-        self.rect=self.image.get_rect()
-        self.rect.centerx=origin[0]+TILESIZE*id[0]+TILESIZE/2
-        self.rect.centery=origin[1]+TILESIZE*id[1]+TILESIZE/2
-        self.rotlimit=math.pi/2         # 90 degrees in radians
-        self.rotdelta=self.rotlimit/ROTSTEPS
-
-        # Determine which exits are valid and do not allow ball launch if not
-        # i.e. a wheel that goes to a southT or nowhere
-        self.validExit={"N":False,"E":False,"S":False,"W":False}
-        for d in self.validExit:
-            # print("  Wheel: Checking ", d)
-            nextTile=findNextTile(id, d)
-            #print(nextTile)
-            # If the end open?
-            if(nextTile!=None):
-                o=opposite[d]
-                #if(nextTile["type"] in openEnds[o]):
-                if(isEndOpen(nextTile["type"], o)):
-                    # Yes, exit is valid
-                    self.validExit[d]=True
-                    #print("    Valid exit in direction ", d)
-    # End of init
- 
-    def update(self):
-        if(paused):
+        if(b.exploState>=0 and b.exploState<EXP_NO):
+            # The explosion takes over
+            startExplosion(b, alpha)
+            self.release()
             return
-        if(self.rotating):
-            self.rotangle+=self.rotdelta
-            ang=self.rotangle
-            # Calculate position changes
-            h=self.cutdist
-            xdelta=math.sin(ang)*h
-            ydelta=h-math.cos(ang)*h
-            # Adjust the docking positions, x then y
-            # North
-            x=self.dockingOrig["N"][0]+xdelta
-            y=self.dockingOrig["N"][1]+ydelta
-            self.dockingpos["N"]=(x, y)
-            # East
-            x=self.dockingOrig["E"][0]-ydelta
-            y=self.dockingOrig["E"][1]+xdelta
-            self.dockingpos["E"]=(x, y)
-            # South
-            x=self.dockingOrig["S"][0]-xdelta
-            y=self.dockingOrig["S"][1]-ydelta
-            self.dockingpos["S"]=(x, y)
-            # West
-            x=self.dockingOrig["W"][0]+ydelta
-            y=self.dockingOrig["W"][1]-xdelta
-            self.dockingpos["W"]=(x, y)
-            if(self.rotangle>self.rotlimit):
-                self.rotating=False
-                # Reset the docking positions to the original
-                self.dockingpos=self.dockingOrig.copy()
-                # Rotate the array of docked balls
-                t=self.docked["W"]    # temporary
-                self.docked["W"]=self.docked["S"]
-                self.docked["S"]=self.docked["E"]
-                self.docked["E"]=self.docked["N"]
-                self.docked["N"]=t
-            # Regenerate the image
-            self.image=self.imageGen()
-    # End of update
-
-
-    def imageGen(self):
-        img=wheelImage.copy()
-        # Cut out slots or put in balls
-        if(self.docked["N"]==None):
-            pygame.draw.circle(img, pygame.SRCALPHA, self.dockingpos["N"], self.ballrad)
-        else:
-            self.docked["N"].setCoord(self.dockingpos["N"], "N")
-
-        if(self.docked["E"]==None):
-            pygame.draw.circle(img, pygame.SRCALPHA, self.dockingpos["E"], self.ballrad)
-        else:
-            self.docked["E"].setCoord(self.dockingpos["E"], "E")
-
-        if(self.docked["S"]==None):
-            pygame.draw.circle(img, pygame.SRCALPHA, self.dockingpos["S"], self.ballrad)
-        else:
-            self.docked["S"].setCoord(self.dockingpos["S"], "S")
-
-        if(self.docked["W"]==None):
-            pygame.draw.circle(img, pygame.SRCALPHA, self.dockingpos["W"], self.ballrad)
-        else:
-            self.docked["W"].setCoord(self.dockingpos["W"], "W")
-        if(self.blown):
-            r=img.get_rect()
-            b=blownIcon.get_rect()
-            img.blit(blownIcon,(r.centerx-b.width/2,r.centery-b.height/2))
-        return img
-
-    def handleEvent(self,event):
-        if(paused):
+        self.track(ballImage[b.colour], alpha)
+# End of ballSprite class
+
+class explosionSprite(ballSprite):
+    # Draws an exploding ball, a frame for each exploState until the ball is removed. Kept in explosionSprites when
+    # done, see startExplosion()
+    def release(self):
+        self.kill()
+        self.ball=None
+        explosionSprites.append(self)
+
+    def update(self, alpha=1):
+        b=self.ball
+        if(not b.alive or b.gen!=self.gen):
+            self.release()
             return
-        if(self.rect.collidepoint(event.pos)):
-            #print("I was clicked ", self.id)
-            if(event.button==3):
-                self.rotating=True
-                self.rotangle=0
-                sounds["woosh"].play()
-            #elif(event.button==1):
-                # Should only click left on a wheel when debugging
-                #self.debugWheel()
-
-    def debugWheel(self):
-        print("Debugging wheel ", self.id)
-        for i in self.docked:
-            if(self.docked[i]==None):
-                print("  {} is empty".format(i))
-            else:
-                print("  {} = {}".format(i,self.docked[i].colour))
-        print("  There are {} balls docked".format(self.numDocked))
-
-    def slotEmpty(self, d):
-        # Is there a ball in slot d? True if empty, false if there is a ball
-        if(self.docked[d]==None):
-            return True
-        else:
-            return False
-        
-    def dockBall(self, ball, point):
-        # Dock the ball and return coordinates for docking point
-        global BLOWN_WHEELS
-        # Is there already another ball docked here?
-        #print("Docking ball, already docked=",self.numDocked)
-        if(self.docked[point]!=None):
-            # Yes, explode both
-            #print("BOOM")
-            self.docked[point].explode()
-            ball.explode()
-            #self.numDocked-=1   -- The explosion undocks and decreases the counter at the end
-            sounds["explode"].play()
-        else:
-            self.docked[point]=ball
-            self.numDocked+=1
-            sounds["dock"].play()
-        #print("  Number docked=",self.numDocked)
-        # Are we full?
-        if(self.numDocked==4):
-            # Yes
-            # What colour is north?
-            c=self.docked["N"].colour
-            sameCol=True
-            for p in self.docked:
-                # Is this the same colour? (North obviously will be)
-                if(self.docked[p].colour!=c):
-                    sameCol=False
-            if(sameCol==True):
-                # All the same colour, explode
-                sounds["explode"].play()
-                for p in self.docked:
-                    self.docked[p].explode()
-                    # Has this already been blown?
-                    if(self.blown==False):
-                        self.blown=True
-                        BLOWN_WHEELS+=1
-                        #print("BLOWN WHEELS=", BLOWN_WHEELS)
-                        # Game over is tracked in main game loop
-
-        return self.dockingOrig[point]
-    
-    def checkExit(self, point):
-        # Does this point contain a valid exit from the wheel?
-        return self.validExit[point]
-    
-    def undock(self, point):
-        # Ball has been launched or exploded, drop reference to it
-        # The slot might be none if the first of two balls has already exploded
-        if(self.docked[point]!=None):
-            self.docked[point]=None
-            self.image=self.imageGen()
-            self.numDocked-=1
-
-    def setInvalid(self, point):
-        # Mark an exit point as invalid
-        #print("Setting point {} on wheel {} as invalid".format(point, self.id))
-        self.validExit[point]=False
-
-# End of Wheel class
-
-class SouthT():
-    # southT class. These are special, used to drop balls from the top gully. There are a few rules:
-    # - Balls will not drop if the wheel at the end of the T has a docked ball facing it
-    # - Balls can not be ejected from the wheel in the direction of a southT
-    #
-    # I believe the original game had southTs mapping directly to wheels, but we need to permit
-    # something more interesting
-    def __init__(self, id):
-        self.id=id      # ID is sent as a tuple of the tile coordinates
-        #print("New southT at {}".format(id))
-        self.linkedWheel=None
-        self.wheelLoc=None          # Which location in the wheel does it check (N,E,S,W)
-        
-        # Find a wheel. We need to walk the path until we find it
-        foundWheel=0        # Three states, 0 (not found), 1 (found), 2 (error)
-        tilex=id[0]          # What tile are we on?
-        tiley=id[1]
-        entrydir="W"             # Which direction did we enter from? Doesn't really matter for a T
-        #print("Finding the linked wheel")
-        stepCount=0             # Used for error tracking
-        while(foundWheel==0):
-            # Find the next tile
-            #print("Inspecting tile at {},{}".format(tilex, tiley))
-            type=levelData[tiley][tilex]
-            # Find the exit
-            exit=None
-            if(type=="ST"):
-                # Special case, first tile, we should never encounter another one
-                exit="S"
-            else:
-                # All tiles should have one entry and one exit. Build list of the open ends of types
-                myOpen=listOpenEnds(type)
-
-                # for e in ["N", "E", "S", "W"]:
-                #     if(type in openEnds[e]):
-                #         myOpen.append(e)
-                l=len(myOpen)
-                if(l==0):
-                    errorQuit("Problem. SouthT leads to a dead end. This is not a valid level")
-                    break
-                elif(l!=2):
-                    errorQuit("Problem, we found the wrong number of open ends {}".format(myOpen))
-                    foundWheel=2
-                    break
-                # Which end do we look at?
-                if(myOpen[0]==entrydir):
-                    # We have entered from this end
-                    exit=myOpen[1]
-                else:
-                    # We have entered from the other end
-                    exit=myOpen[0]
-
-            nextTile=findNextTile((tilex,tiley), exit)
-            # print("Next tile is {}".format(nextTile))
-            # Have we exceeded limits?
-            if(nextTile==None):
-                foundWheel=2
-                errorQuit("Error, ST path took us off screen")
-            else:
-                # What direction do we enter the tile from?
-                entrydir=opposite[exit]
-                # Looks good, is the next tile a wheel?
-                if(nextTile["type"]=="W"):   
-                    # Yes
-                    foundWheel=1
-                    #print("Found a wheel")
-                else:
-                    # No, loop
-                    tilex=nextTile["coord"][0]
-                    tiley=nextTile["coord"][1]
-            if(stepCount>(TILESX*TILESY)):
-                foundWheel=2
-                errorQuit("Error: Unable to find wheel, infinite loop from tile {}".format(self.id))
-            else:
-                stepCount+=1       
-        # End of wheel while loop
-        self.linkedWheel=nextTile["coord"]
-        #print("Linked southT {} to wheel {} entry point {}".format(self.id, self.linkedWheel, entrydir))
-        self.wheelLoc=entrydir
-        wheels[self.linkedWheel].setInvalid(entrydir)
-        #print("  Wheel found, linking ST to wheel {}, docking point {}".format(self.linkedWheel, self.wheelLoc))
-    # End of init
-
-    def isOpen(self):
-        # Return if the path is open
-        return wheels[self.linkedWheel].slotEmpty(self.wheelLoc)
-
-# End of southT class
-
-class pauseButton(pygame.sprite.Sprite):
+        self.track(explosion[b.exploState], alpha)
+# End of explosionSprite class
+
+# Sprites no longer on the screen, to be used again
+ballSprites=[]
+explosionSprites=[]
+
+def newBallSprite(ball):
+    # A sprite to draw a new ball
+    spr=ballSprites.pop() if ballSprites else ballSprite()
+    spr.attach(ball)
+    return spr
+
+def startExplosion(ball, alpha=1):
+    # Put an explosion where the ball is
+    spr=explosionSprites.pop() if explosionSprites else explosionSprite()
+    spr.attach(ball, alpha)
+    all_sprites.add(spr, layer=BALL_LAYER)
+
+class wheelSprite(pygame.sprite.DirtySprite):
+    def __init__(self, wheel):
+        pygame.sprite.DirtySprite.__init__(self)
+        self.wheel=wheel
+        self.image=None
+        self.place()
+
+    def place(self):
+        # Set the image and position for the current scale
+        self.changes=-1             # Track the wheel's change counter, so we only redraw on change
+        self.update()
+        self.rect=self.image.get_rect()
+        self.rect.centerx=origin[0]+TILESIZE*self.wheel.id[0]+TILESIZE/2
+        self.rect.centery=origin[1]+TILESIZE*self.wheel.id[1]+TILESIZE/2
+        self.dirty=1
+
+    def update(self, alpha=1):
+        w=self.wheel
+        if(w.changes!=self.changes):
+            self.changes=w.changes
+            img=getWheelFrame(w.posStep, w.emptyMask(), w.blown)
+            if(img is not self.image):
+                self.image=img
+                self.dirty=1
+# End of wheelSprite class
+
+class pauseButton(pygame.sprite.DirtySprite):
     # Small class to implement the pause button
     def __init__(self):
-        pygame.sprite.Sprite.__init__(self)
-        self.image=ctrlIcons["pause"]
-        self.rect=self.image.get_rect()
+        pygame.sprite.DirtySprite.__init__(self)
+        self.place()
+
+    def place(self):
+        # Set the image and position for the current scale
+        self.image=atlas.surface
+        self.source_rect=ctrlIcons["play" if game!=None and game.paused else "pause"]
+        self.rect=self.source_rect.copy()
         self.rect.x=WIDTH-WINMARG-TOPBAR*2.5
         self.rect.y=WINMARG/2
+        self.dirty=1
 
-    def update(self):
+    def update(self, alpha=1):
         None
 
     def handleEvent(self, event):
-        global paused
         if(self.rect.collidepoint(event.pos)):
             self.pause()
     
     def pause(self):
-        global paused, showInfoPan, infPan, ts
+        global showInfoPan, infPan
         # print("Pause/play clicked?")
-        paused=not paused
-        if(paused):
-            self.image=ctrlIcons["play"]
+        game.paused=not game.paused
+        if(game.paused):
+            self.source_rect=ctrlIcons["play"]
             infPan.setMsg("Paused")
             showInfoPan=True
-            # Record start of pause
-            ts["pauseStart"]=pygame.time.get_ticks()
         else:
-            self.image=ctrlIcons["pause"]
+            self.source_rect=ctrlIcons["pause"]
             infPan.setMsg("")
             showInfoPan=False
-            # Adjust level timer by adding the paused time to the start and end variables
-            pt=pygame.time.get_ticks()-ts["pauseStart"]
-            ts["startTime"]+=pt
-            ts["endTime"]+=pt
 
 # End of pauseButton class
 
@@ -730,7 +402,7 @@ class infoPanel():
         self.msg=""         # Text to display
         self.size=(WIDTH-WINMARG*4, HEIGHT/4)
         # Make the default background
-        self.bg=pygame.Surface(self.size)
+        self.bg=pygame.Surface(self.size).convert()
         self.bg.fill(THEME["main"])
         pygame.draw.rect(self.bg, THEME["dark"], self.bg.get_rect(), INFOPBOR)
         self.genImage()
@@ -747,7 +419,7 @@ class infoPanel():
         else:
             font=fonts["infop"]
         if(self.msg!=""):
-            textSurf=outlineText(self.msg, font, THEME["font"], THEME["dark"], 4)
+            textSurf=texts.outline(self.msg, font, THEME["font"], THEME["dark"], 4)
             trect=textSurf.get_rect(center=(self.rect.width/2,self.rect.height/2))
             self.image.blit(textSurf, trect)
 
@@ -764,56 +436,176 @@ class infoPanel():
 
 # Draw the main game screen
 def drawGameScreen():
-    screen.fill(BG)
-
-    # Draw a grid, which the tiles will sit on top of.
-    # This code will become redundant
-    # Vertical lines
-    # for x in range(0,TILESX+1):
-    #     pygame.draw.lines(screen, LINECOL, False, [(WINMARG+x*TILESIZE,WINMARG), (WINMARG+x*TILESIZE,HEIGHT-WINMARG)], LINEWIDTH)
-    # # Horizontal
-    # for y in range(0,TILESY+1):
-    #     pygame.draw.lines(screen, LINECOL, False, [(WINMARG,WINMARG+y*TILESIZE),(WIDTH-WINMARG,WINMARG+y*TILESIZE)], LINEWIDTH)
-
-    # Draw the tiles
-    y=0
-    for row in levelData:
-        x=0
-        for tname in row:
-            img=tImg.getTile(tname)
-            screen.blit(img, (origin[0]+TILESIZE*x, origin[1]+TILESIZE*y))
-            x+=1
-        y+=1
-    
-    # Draw the top info bar
-    # This line just to test where it is
-    #pygame.draw.rect(screen, (255,0,0), [(WINMARG, WINMARG/2),(TILESIZE*TILESX, TOPBAR)])
-    # nextBall icon
-    screen.blit(nextBallIcon, (WIDTH-TOPBAR-WINMARG, WINMARG/2))
-    #screen.blit(ctrlIcons["pause"], (WIDTH-WINMARG-TOPBAR*2.5, WINMARG/2))
-
-    all_sprites.draw(screen)
-    # Cover up balls entering the screen
-    pygame.draw.rect(screen, BG, [(origin[0]+TILESIZE*TILESX, origin[1]),(WINMARG,TILESIZE)])
-
-    # Draw the timer bar
-    screen.blit(timerBar, (WINMARG, WINMARG/2))
-    # Mask out the elapsed time
-    pygame.draw.rect(screen,BG,ts["timerMask"])
-    if(showSeconds):
-        # Display the remaining time on the timer bar as text
-        t=math.ceil(ts["timeLeft"]/1000)
-        #print(t)
-        tsurf=fonts["time"].render(str(t),True, THEME["time"])
-        trect=tsurf.get_rect()
-        marg=TOPBAR/5
-        screen.blit(tsurf, (WINMARG+marg*2,WINMARG/2+marg*1.5))
+    # Only the areas which have changed are redrawn and pushed to the display. The whole screen is
+    # redrawn when a level is loaded or the info panel is taken away
+    rects=[]
+    if(showInfoPan):
+        msg=infPan.msg
+    else:
+        msg=None
+    if(msg!=screenState["infoPan"]):
+        if(msg==None):
+            # Panel removed, need to show what was under it
+            screenState["fullRedraw"]=True
+        screenState["infoPan"]=msg
+    full=screenState["fullRedraw"]
+    if(full):
+        screen.blit(background, (0,0))
+        all_sprites.repaint_rect(boardRect)
+        screenState["topBar"]=None
+        screenState["fullRedraw"]=False
+
+    # Sprites are clipped to the board, this covers up balls entering the screen
+    rects+=all_sprites.draw(screen, background)
+
+    # Draw the top info bar if it has changed
+    t=math.ceil(ts["timeLeft"]/1000)
+    topBar=(ts["timerMask"], t, showSeconds, nextBallIcon)
+    if(topBar!=screenState["topBar"]):
+        screenState["topBar"]=topBar
+        # nextBall icon
+        rects.append(screen.blit(atlas.surface, (WIDTH-TOPBAR-WINMARG, WINMARG/2), nextBallIcon))
+        # Draw the timer bar
+        rects.append(screen.blit(atlas.surface, (WINMARG, WINMARG/2), timerBar))
+        # Mask out the elapsed time
+        pygame.draw.rect(screen,BG,ts["timerMask"])
+        if(showSeconds):
+            # Display the remaining time on the timer bar as text, drawn from the digit glyphs
+            marg=TOPBAR/5
+            timeGlyphs.draw(screen, str(t), (WINMARG+marg*2,WINMARG/2+marg*1.5))
     # Do we display the infoPanel?
     if(showInfoPan):
-        screen.blit(infPan.image, infPan.rect)
-    pygame.display.flip()
+        rects.append(screen.blit(infPan.image, infPan.rect))
+    if(showProfile):
+        rects.append(drawProfileOverlay())
+    profiler.mark("draw")
+    if(full):
+        pygame.display.flip()
+    else:
+        pygame.display.update(rects)
+    profiler.mark("flip")
 # End of drawGameScreen()
 
+def drawProfileOverlay():
+    # Draw the profiler overlay at the top left of the board, it is redrawn every OVERLAY_UPDATE ms. Returns the
+    # rectangle drawn
+    t=pygame.time.get_ticks()
+    if(t>=profOverlay["nextUpdate"]):
+        profOverlay["nextUpdate"]=t+OVERLAY_UPDATE
+        old=profOverlay["image"]
+        profOverlay["image"]=genProfileOverlay()
+        if(old!=None and old.get_size()!=profOverlay["image"].get_size()):
+            # Don't leave the edge of the old one behind
+            screenState["fullRedraw"]=True
+    m=WINMARG/2
+    return screen.blit(profOverlay["image"], (boardRect.x+m, boardRect.y+m))
+
+def genProfileOverlay():
+    # The p50, p95 and p99 times of each phase of the frame, and a histogram of whole frame times
+    font=fonts["small"]
+    lh=font.get_linesize()
+    stats=profiler.stats()
+    nameW=font.size("sprites")[0]+lh
+    colW=font.size("000.00")[0]+lh/2
+    histH=lh*3
+    surf=pygame.Surface((round(nameW+colW*3+lh), round(lh*(len(stats)+2)+histH))).convert()
+    surf.fill(THEME["dark"])
+    rows=[("ms", "p50", "p95", "p99")]+[(s[0],)+tuple("{:.2f}".format(v) for v in s[1:]) for s in stats]
+    y=lh/2
+    for row in rows:
+        surf.blit(font.render(row[0], True, THEME["font"]), (lh/2, y))
+        for (i, cell) in enumerate(row[1:]):
+            # Numbers are right aligned
+            img=font.render(cell, True, THEME["font"])
+            surf.blit(img, (nameW+colW*(i+1)-img.get_width(), y))
+        y+=lh
+    hist=profiler.hist
+    top=max(hist) or 1
+    bw=(surf.get_width()-lh)/len(hist)
+    for (i, n) in enumerate(hist):
+        h=round(histH*n/top)
+        pygame.draw.rect(surf, THEME["light"], (lh/2+i*bw, y+histH-h, max(1, bw-1), h))
+    return surf
+
+def toggleProfile():
+    # Show or hide the profiler overlay
+    global showProfile
+    showProfile=not showProfile
+    profiler.enable(showProfile)
+    profOverlay["nextUpdate"]=0
+    if(not showProfile):
+        screenState["fullRedraw"]=True
+
+def genBackground():
+    # Draw the parts of the game screen which do not change during a level, the tiles in view
+    background.fill(BG)
+    background.set_clip(boardRect)
+    (xs, ys)=visibleTiles()
+    for y in ys:
+        row=game.levelData[y]
+        for x in xs:
+            background.blit(atlas.surface, (origin[0]+TILESIZE*x, origin[1]+TILESIZE*y), tiles.get(row[x], tiles["UNK"]))
+    background.set_clip(None)
+    screenState["fullRedraw"]=True
+
+def visibleTiles():
+    # Ranges of the columns and rows of tiles at least partly in view
+    left=(boardRect.left-origin[0])//TILESIZE
+    top=(boardRect.top-origin[1])//TILESIZE
+    right=(boardRect.right-origin[0]-1)//TILESIZE+1
+    bottom=(boardRect.bottom-origin[1]-1)//TILESIZE+1
+    return (range(max(0, left), min(game.tilesX, right)), range(max(0, top), min(game.tilesY, bottom)))
+
+def showWheels():
+    # Only the wheels in view have sprites, the others still turn in the game but aren't drawn
+    (xs, ys)=visibleTiles()
+    for (id, spr) in list(wheelSprites.items()):
+        if(id[0] not in xs or id[1] not in ys):
+            spr.kill()
+            del wheelSprites[id]
+    for y in ys:
+        for x in xs:
+            if((x, y) in wheelSprites):
+                wheelSprites[(x, y)].place()
+            elif((x, y) in game.wheels):
+                spr=wheelSprite(game.wheels[(x, y)])
+                wheelSprites[(x, y)]=spr
+                all_sprites.add(spr)
+
+def showView():
+    # Draw the part of the board in view, after scrolling or a change of scale
+    global origin
+    origin=(boardRect.x-round(scroll[0]*VIEW), boardRect.y-round(scroll[1]*VIEW))
+    showWheels()
+    genBackground()
+
+def scrollTo(x, y):
+    # Scroll so board position (x, y), in board units, is at the top left of the view. It stays on the board
+    x=min(max(0, x), max(0, (game.tilesX-TILESX)*BOARD_TILESIZE))
+    y=min(max(0, y), max(0, (game.tilesY-TILESY)*BOARD_TILESIZE))
+    if([x, y]!=scroll):
+        scroll[:]=[x, y]
+        showView()
+
+def scrollKeys(ms):
+    # Held arrow keys scroll the view, ms is the time since the last frame
+    keys=pygame.key.get_pressed()
+    dx=keys[pygame.K_RIGHT]-keys[pygame.K_LEFT]
+    dy=keys[pygame.K_DOWN]-keys[pygame.K_UP]
+    if(dx or dy):
+        step=SCROLL_SPEED*BOARD_TILESIZE*ms/1000
+        scrollTo(scroll[0]+dx*step, scroll[1]+dy*step)
+
+def scrollEvent(event):
+    # The mouse wheel scrolls a tile a click, sideways with shift held. Returns True if the event was one
+    if(event.type!=pygame.MOUSEWHEEL):
+        return False
+    (dx, dy)=(event.x, -event.y)
+    if(pygame.key.get_mods() & pygame.KMOD_SHIFT):
+        (dx, dy)=(dy, dx)
+    scrollTo(scroll[0]+dx*BOARD_TILESIZE, scroll[1]+dy*BOARD_TILESIZE)
+    return True
+
 def drawLobbyScreen():
     # Blits lobby components to the screen
     global lobScreen
@@ -821,6 +613,16 @@ def drawLobbyScreen():
     screen.blit(lobScreen["levelSel"], lobScreen["levelSel_rect"])
     screen.blit(lobScreen["diffSel"], lobScreen["diffSel_rect"])
     pygame.display.flip()
+    # The game screen will need to be fully drawn when we leave
+    screenState["fullRedraw"]=True
+
+def gradballImage():
+    # The shaded ball image the wheel and balls are drawn from, loaded the first time it is needed
+    global gradball
+    if(gradball==None):
+        gradball = pygame.image.load(os.path.join('sprites','300gradball.png')).convert()
+        gradball.set_colorkey((0,0,0))
+    return gradball
 
 def genWheelImage():
     # Create the wheel image. We need a blank (without the cutouts) and the stationary wheel with
@@ -829,36 +631,69 @@ def genWheelImage():
     whsurf=pygame.Surface((TILESIZE,TILESIZE), pygame.SRCALPHA, 32)
     
     whmarg=(TILESIZE-WHSIZE)/2
-    tmpsurf=pygame.Surface.copy(gradball)
+    tmpsurf=pygame.Surface.copy(gradballImage())
     tmpsurf=pygame.transform.scale(tmpsurf, (WHSIZE,WHSIZE))
     whsurf.blit(tmpsurf,(whmarg,whmarg))
     return whsurf
 
+# Wheel images only depend on the rotation step, which slots are empty and if the wheel has been
+# blown, so each one is drawn the first time it is needed and then shared by all wheels
+wheelFrames={}
+def getWheelFrame(step, emptyMask, blown):
+    key=(step, emptyMask, blown)
+    if key in wheelFrames:
+        return wheelFrames[key]
+    img=wheelImage.copy()
+    # Cut out empty slots, the balls are drawn over the others
+    ballrad=math.floor(BALLSIZE/2)
+    for d in range(4):
+        if(emptyMask & (1<<d)):
+            # Docking positions are in board units
+            (x, y)=DOCKSTEPS[step][d]
+            pygame.draw.circle(img, pygame.SRCALPHA, (x*VIEW, y*VIEW), ballrad)
+    if(blown):
+        r=img.get_rect()
+        b=blownIcon.get_rect()
+        img.blit(blownIcon,(r.centerx-b.width/2,r.centery-b.height/2))
+    wheelFrames[key]=img
+    return img
+
+def genBlownIcon():
+    # The token shown on a blown wheel
+    img=pygame.image.load(os.path.join('sprites','blownCoin.png')).convert_alpha()
+    return pygame.transform.scale(img, (WHSIZE/8,WHSIZE/8))
+
 def genBalls():
-    # Generate the coloured balls
+    # Generate the coloured balls, indexed by the colour numbers used in the game model
     #print("Generating balls")
-    blist={}
-    bmaster=pygame.transform.scale(gradball, (BALLSIZE,BALLSIZE))
+    blist=[]
+    bmaster=pygame.transform.scale(gradballImage(), (BALLSIZE,BALLSIZE))
     for b in BALLCOLS:
         bsurf=pygame.Surface((BALLSIZE,BALLSIZE), pygame.SRCALPHA,32)
         pygame.draw.circle(bsurf, BALLCOLS[b], (BALLSIZE/2,BALLSIZE/2), BALLSIZE/2)
         bmaster.set_alpha(128)
         bsurf.blit(bmaster, (0,0))
-        blist[b]=bsurf
+        blist.append(bsurf)
     return blist
 # End of genBalls
 
 def genNextBallIcon(c):
-    # Generate the next ball icon
+    # Show the next ball icon for colour c, None for no next ball
     global nextBallIcon
+    nextBallIcon=nextIcons[c]
+
+def genNextIcon(ball):
+    # Generate a next ball icon for a ball image, or a blank for None
+    if(ball==None):
+        return pygame.Surface((TOPBAR,TOPBAR)).convert()
     tsurf=genIcon((TOPBAR,TOPBAR))
     pos=(TOPBAR/2-BALLSIZE/2, TOPBAR/2-BALLSIZE/2)
-    tsurf.blit(ballImage[c],pos)
-    nextBallIcon=tsurf
+    tsurf.blit(ball,pos)
+    return tsurf
 
 def genIcon(size):
     # Generate an icon blank of the supplied size
-    tile=pygame.Surface((size))
+    tile=pygame.Surface((size)).convert()
     w=size[0]
     h=size[1]
     tile.fill(THEME["main"])
@@ -895,7 +730,7 @@ def genTimerBar():
     global timerBar, timerSlider
     marg=TOPBAR/5
     timerBar=(TILESIZE*TILESX-WINMARG-TOPBAR*2-marg, TOPBAR)
-    b=TIMEBARBOR
+    b=round(TIMEBARBOR*SCALE)
     timerSlider=((b,b),(timerBar[0]-b*2,TOPBAR-b*2))
     img=genIcon(timerBar)
 
@@ -924,71 +759,33 @@ def exploImages():
     return imgList
 
 def loadLevel(filename):
-    # Loads the level from file
-    global levelData,wheels,southTs, NUM_WHEELS
-    levelData=[]
-    #print("Loading file", filename)
-    lineCount=0
-    with open(filename) as f:
-        reader = csv.reader(f, skipinitialspace=True, delimiter=",")
-        for row in reader:
-            #print(row)
-            l=len(row)
-            if(l!=TILESX):
-                errorQuit("Error: In level file {}, line {} contains {} tiles, not {}".format(filename, lineCount, l, TILESX))
-            levelData.append(row)
-            lineCount+=1
-    # Check the number of lines loaded
-    if(lineCount!=TILESY):
-        errorQuit("Error: In level file {}, contains {} lines not {}".format(filename, lineCount, TILESY))
-    
-    # Initialise wheels and south Ts
-    wheels={}
-    southTs={}
-    coord=(-1,-1)
-    y=0
-    for row in levelData:
-        x=0
-        for tname in row:
-            coord=(x, y)
-            if(tname=="W"):
-                wheels[coord]=Wheel(coord)
-                all_sprites.add(wheels[coord])
-                NUM_WHEELS+=1
-            x+=1
-        y+=1
-    # Look for southTs in the top ally. Did not do this above as we need to set the associated wheel
-    # exits as invalid
-    y=0
-    x=0
-    for tname in levelData[0]:
-        coord=(x,y)
-        if(tname=="ST"):
-            southTs[coord]=SouthT(coord)
-        x+=1
-
+    # Loads the level from file and sets up the game model and sprites for it
+    global game
+    try:
+        i=pack.find(os.path.basename(filename)) if pack else -1
+        if(i>=0):
+            level=pack.load(i)
+            game=gameEngine(level.levelData, BALLSPEED, LEVEL_TIME, FPS, BALL_LIMIT, compiled=level)
+        else:
+            game=gameEngine(readLevel(filename), BALLSPEED, LEVEL_TIME, FPS, BALL_LIMIT)
+    except levelError as e:
+        errorQuit(str(e))
+    all_sprites.set_clip(boardRect)
+    # Start with the view at the top right, where the balls come on
+    wheelSprites.clear()
+    scroll[:]=[max(0, (game.tilesX-TILESX)*BOARD_TILESIZE), 0]
+    showView()
 # End of loadLevel
-        
-def checkSTopen(tile):
-    # Check if a tile is open to the south - is the associated wheel slot free?
-    r=southTs[tile].isOpen()
-    return r
-
-def nextBall():
-    # Pick a random colour for the next ball
-    r=random.choice(list(BALLCOLS))
-    #print("The next ball colour is ", r)
-    genNextBallIcon(r)
-    return r
-
-def LotherEnd(type, entry):
-    # Returns the exit direction for a corner based on the entry
-    # String should be of the format 'xyL', check what the first two characters are
-    if(type[0]==entry):
-        r=type[1]
-    else:
-        r=type[0]
-    return r
+
+def processGameEvents():
+    # Act on anything the game model has queued for us
+    for (e, obj) in game.popEvents():
+        if(e=="newBall"):
+            all_sprites.add(newBallSprite(obj), layer=BALL_LAYER)
+        elif(e=="nextBall"):
+            genNextBallIcon(obj)
+        elif(e in sounds):
+            sounds.play(e)
 
 def errorQuit(msg):
     # Quit if we have an error
@@ -996,121 +793,136 @@ def errorQuit(msg):
     pygame.quit()
     exit(1)
 
-def launchNext():
-    # Launch the next ball and pick the one to come after
-    global nextCol, ballCount
-    if(ballCount>=BALL_LIMIT-1 and BALL_LIMIT!=-1):
-        print("Ball limit reached")
-    else:
-        all_sprites.add(Ball(nextCol))
-        nextCol=nextBall()
-        ballCount+=1
-
-def findNextTile(coord, dir):
-    # Finds the next tile in a specified direction
-    # Returns None if there are no tiles (i.e. screen edge)
-    # or a dictionary of coord and type
-    x=coord[0]
-    y=coord[1]
-    if(dir=="N"):
-        y-=1
-    elif(dir=="E"):
-        x+=1
-    elif(dir=="S"):
-        y+=1
-    elif(dir=="W"):
-        x-=1
-    # Check limits
-    if(x<0 or y<0 or x==TILESX or y==TILESY):
-        return None
-    
-    rtn={'coord':(x, y),
-        'type': levelData[y][x]
+def screenToBoard(pos):
+    # Convert a screen position to board units used by the game model
+    return (math.floor((pos[0]-origin[0])/VIEW), math.floor((pos[1]-origin[1])/VIEW))
+
+def genScaleAssets():
+    # Draw everything that depends on the scale, at the current sizes. Images for START_SCALE come from the asset
+    # cache on disk, other scales are only drawn when they are used
+    def cached(get, name, make):
+        if(SCALE==START_SCALE):
+            return get(name, make)
+        return make()
+    v={}
+    v["fonts"]={
+        "infop":pygame.font.SysFont(fontName, round(128*SCALE)),
+        "infop_m":pygame.font.SysFont(fontName, round(96*SCALE)),
+        "time":pygame.font.SysFont(fontName, int(TOPBAR*0.66)),
+        "small":pygame.font.SysFont(fontName, round(24*SCALE)),
     }
-    return rtn
-# End of nextTile
-
-def isEndOpen(ttype, d):
-    # True if the end is open, false if not, None if tile doesn't exist
-    if(ttype==None):
-        # Been called with a None value, may be because the next tile is out of range
-        return None
-    # Split tile type, to ignore colours on painters or blockers
-    sp=ttype.split(".")
-    if(sp[0] in openEnds[d]):
-        return True
-    # Drop through to false
-    return False
-
-def listOpenEnds(type):
-    # Lists the ends open for a particular type of tile
-   # print("Checking ends for type ", type)
-
-    # Split tile type, to ignore colours on painters or blockers
-    sp=type.split(".")
-    r=[]                # Return array
-    for e in ["N", "E", "S", "W"]:
-        if(type in openEnds[e]):
-            r.append(e)
-    l=len(r)
-    #print("  {} ends found - {}".format(l, r))
-    if(type!="B"):
-        if(l==0):
-            errorQuit("Unknown tile type {}".format(type))
-        elif(len(r)!=2):
-            errorQuit("Problem, we found the wrong number of open ends {} for tile type {}".format(r, type))
-    return r
-
-# Draw a font with outline. Copied from
-# https://stackoverflow.com/questions/54363047/how-to-draw-outline-on-the-fontpygame
-_circle_cache = {}
-def _circlepoints(r):
-    r = int(round(r))
-    if r in _circle_cache:
-        return _circle_cache[r]
-    x, y, e = r, 0, 1 - r
-    _circle_cache[r] = points = []
-    while x >= y:
-        points.append((x, y))
-        y += 1
-        if e < 0:
-            e += 2 * y - 1
-        else:
-            x -= 1
-            e += 2 * (y - x) - 1
-    points += [(y, x) for x, y in points if x > y]
-    points += [(-x, y) for x, y in points if x]
-    points += [(x, -y) for x, y in points if y]
-    points.sort()
-    return points
-
-def outlineText(text, font, gfcolor=pygame.Color('dodgerblue'), ocolor=(255, 255, 255), opx=2):
-    # Also from stack overflow. Uses above function to produce text with an outline
-    textsurface = font.render(text, True, gfcolor).convert_alpha()
-    w = textsurface.get_width() + 2 * opx
-    h = font.get_height()
-
-    osurf = pygame.Surface((w, h + 2 * opx)).convert_alpha()
-    osurf.fill((0, 0, 0, 0))
-
-    surf = osurf.copy()
-
-    osurf.blit(font.render(text, True, ocolor).convert_alpha(), (0, 0))
-
-    for dx, dy in _circlepoints(opx):
-        surf.blit(osurf, (dx + opx, dy + opx))
-
-    surf.blit(textsurface, (opx, opx))
-    return surf
+    tileList=cached(assets.images, "tiles", lambda: tileImages(TILESIZE, PWIDTH, BALLCOLS).tileList)
+    balls=cached(assets.images, "balls", genBalls)
+    explo=cached(assets.images, "explosion", exploImages)
+    icons=genControlIcons()
+    nextCols=[None]+list(range(len(balls)))
+    # All the images are packed into one atlas, and drawn as rectangles of it
+    images={"blownIcon":cached(assets.image, "blownIcon", genBlownIcon),
+            "wheel":cached(assets.image, "wheel", genWheelImage),
+            "timerBar":genTimerBar()}
+    images.update(("tile:"+n, img) for (n, img) in tileList.items())
+    images.update(("ball:{}".format(i), img) for (i, img) in enumerate(balls))
+    images.update(("explosion:{}".format(i), img) for (i, img) in enumerate(explo))
+    images.update(("icon:"+n, img) for (n, img) in icons.items())
+    images.update(("next:{}".format(c), genNextIcon(None if c==None else balls[c])) for c in nextCols)
+    atlas=textureAtlas(images)
+    v["atlas"]=atlas
+    v["tiles"]={n:atlas.rect("tile:"+n) for n in tileList}
+    v["blownIcon"]=atlas.image("blownIcon")
+    v["wheelImage"]=atlas.image("wheel")
+    v["ballImage"]=[atlas.rect("ball:{}".format(i)) for i in range(len(balls))]
+    v["explosion"]=[atlas.rect("explosion:{}".format(i)) for i in range(len(explo))]
+    v["wheelFrames"]={}
+    v["ctrlIcons"]={n:atlas.rect("icon:"+n) for n in icons}
+    v["nextIcons"]={c:atlas.rect("next:{}".format(c)) for c in nextCols}
+    v["timerBar"]=atlas.rect("timerBar")
+    v["timeGlyphs"]=glyphStrip(v["fonts"]["time"], "0123456789", THEME["time"])
+    v["timerSlider"]=timerSlider
+    return v
+
+def setScale(scale):
+    # Draw the game at scale times the size of the game model. What is drawn for each scale is kept in
+    # scaleCache, and the least recently used scale is dropped when there are more than SCALE_CACHE
+    global SCALE, screen, background, boardRect, nextBallIcon, lobScreen, infPan
+    global fonts, atlas, tiles, blownIcon, wheelImage, ballImage, explosion, wheelFrames, ctrlIcons, nextIcons
+    global timerBar, timerSlider, timeGlyphs
+    SCALE=scale
+    setSizes(scale)
+    if(screen.get_size()!=(WIDTH, HEIGHT)):
+        screen=pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+    if(scale in scaleCache):
+        scaleCache.move_to_end(scale)
+    else:
+        scaleCache[scale]=genScaleAssets()
+        while(len(scaleCache)>SCALE_CACHE):
+            scaleCache.popitem(last=False)
+    v=scaleCache[scale]
+    fonts=v["fonts"]
+    atlas=v["atlas"]
+    tiles=v["tiles"]
+    blownIcon=v["blownIcon"]
+    wheelImage=v["wheelImage"]
+    ballImage=v["ballImage"]
+    explosion=v["explosion"]
+    wheelFrames=v["wheelFrames"]
+    ctrlIcons=v["ctrlIcons"]
+    nextIcons=v["nextIcons"]
+    timerBar=v["timerBar"]
+    timerSlider=v["timerSlider"]
+    timeGlyphs=v["timeGlyphs"]
+
+    background=pygame.Surface((WIDTH, HEIGHT))
+    boardRect=pygame.Rect(origin, (TILESIZE*TILESX, TILESIZE*TILESY))
+    msg=infPan.msg if infPan else ""
+    infPan=infoPanel()
+    infPan.setMsg(msg)
+    lobScreen=genLobbyScreen()
+    if(pButton):
+        pButton.place()
+    genNextBallIcon(game.nextCol if game!=None else None)
+    if(game!=None):
+        # Part way through a level, everything on the board moves to the new scale
+        all_sprites.set_clip(boardRect)
+        showView()
+        ts["nextUpdate"]=0
+    screenState["fullRedraw"]=True
+    screenState["topBar"]=None
+
+def fitScale(size):
+    # The largest scale whose window fits in size, or the smallest scale if none do
+    best=SCALES[0]
+    for s in SCALES:
+        t=round(BOARD_TILESIZE*s)
+        marg=t//3
+        if(t*TILESX+marg*2<=size[0] and t*TILESY+marg*2+math.floor((t//2.5)*0.7)+8<=size[1]):
+            best=s
+    return best
+
+def scaleEvent(event):
+    # Window resizes and the +/- keys change the scale. Returns True if the event was one of these
+    if(event.type==pygame.VIDEORESIZE):
+        scale=fitScale(event.size)
+    elif(event.type==pygame.KEYUP and event.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS)):
+        scale=SCALES[min(SCALES.index(SCALE)+1, len(SCALES)-1)]
+    elif(event.type==pygame.KEYUP and event.key in (pygame.K_MINUS, pygame.K_KP_MINUS)):
+        scale=SCALES[max(SCALES.index(SCALE)-1, 0)]
+    else:
+        return False
+    if(scale!=SCALE):
+        setScale(scale)
+    elif(screen.get_size()!=(WIDTH, HEIGHT)):
+        # Snap the window back to the size of the scale
+        setScale(scale)
+    return True
 
 def updateTimer():
-    # Update the game timer if the game is not paused
-    if(not paused):
+    # Update the game timer display if the game is not paused
+    if(not game.paused):
         global ts,timerSlider
         t=pygame.time.get_ticks()
         if(t>ts["nextUpdate"]):
             ts["nextUpdate"]=t+100         # Update the timer every thenth of a second
-            ts["timeLeft"]=ts["endTime"]-t
+            ts["timeLeft"]=game.timeLeft
             # Calculate the size of the timer bar mask
             f=1-ts["timeLeft"]/ts["levelTime"]        # Fraction of time left
             # Calculate the length the bar should be
@@ -1127,10 +939,12 @@ def lobby():
     leaveLobby=0        # 0=stay,1=start,2=quit
     while leaveLobby==0:
         # Lobby handling loop
-        clock.tick(FPS)
+        clock.tick(RENDER_FPS)
 
         event = pygame.event.poll()
-        if event.type == pygame.QUIT:
+        if scaleEvent(event):
+            pass
+        elif event.type == pygame.QUIT:
             leaveLobby=2
         elif event.type == pygame.MOUSEBUTTONDOWN:
             #print("Click")
@@ -1158,11 +972,12 @@ def lobby():
             elif(lobScreen["diffSel_rect"].collidepoint(event.pos)):
                 changeDifficulty(event.button)
                 (lobScreen["diffSel"],lobScreen["diffSel_rect"])=genDiffSel(bxmarg, bymarg, brad)
-                lobScreen["diffSel_rect"].center=(WIDTH/2,HEIGHT-WINMARG-575)
+                lobScreen["diffSel_rect"].center=(WIDTH/2,HEIGHT-WINMARG-575*SCALE)
         drawLobbyScreen()
     # What did we exit with
     if(leaveLobby==2):
         print("Quitting")
+        profiler.closeCSV()
         pygame.quit()
         quit()
 # End of the lobby loop
@@ -1175,16 +990,16 @@ def genLobbyScreen():
     msurf=pygame.Surface((WIDTH, HEIGHT))         # Main surface
     msurf.fill(THEME["bg"])
     pygame.draw.rect(msurf, THEME["main"], (WINMARG,WINMARG,WIDTH-WINMARG*2,HEIGHT-WINMARG*2))
-    title=outlineText("BamClone",fonts["infop"],THEME["font"], THEME["dark"], 4)
+    title=texts.outline("BamClone",fonts["infop"],THEME["font"], THEME["dark"], 4)
     trect=title.get_rect()
     trect.center=(WIDTH/2,trect.height)
     msurf.blit(title,trect)
     lobStruct["main"]=msurf
 
     # Start game button
-    ssurf=outlineText("Start game",fonts["infop_m"],THEME["font"], THEME["dark"], 4)
+    ssurf=texts.outline("Start game",fonts["infop_m"],THEME["font"], THEME["dark"], 4)
     srect=ssurf.get_rect()
-    srect.center=(WIDTH/2,HEIGHT-WINMARG-275)
+    srect.center=(WIDTH/2,HEIGHT-WINMARG-275*SCALE)
     msurf.blit(ssurf,srect)
     # Add an outline
     srect=srect.inflate(bxmarg, bymarg)
@@ -1192,9 +1007,9 @@ def genLobbyScreen():
     lobStruct["start_rect"]=srect       # Need record of dimensions for mouse detection
 
     # Make quit button
-    qsurf=outlineText("Quit",fonts["infop_m"],THEME["font"], THEME["dark"], 4)
+    qsurf=texts.outline("Quit",fonts["infop_m"],THEME["font"], THEME["dark"], 4)
     qrect=qsurf.get_rect()
-    qrect.center=(WIDTH/2,HEIGHT-WINMARG-125)
+    qrect.center=(WIDTH/2,HEIGHT-WINMARG-125*SCALE)
     msurf.blit(qsurf,qrect)
     # Add an outline
     qrect=qrect.inflate(bxmarg, bymarg)
@@ -1203,37 +1018,45 @@ def genLobbyScreen():
 
     # Add the level select button
     (lobStruct["levelSel"],lobStruct["levelSel_rect"])=genLevelSel(bxmarg, bymarg, brad)
-    lobStruct["levelSel_rect"].center=(WIDTH/2,HEIGHT-WINMARG-425)
+    lobStruct["levelSel_rect"].center=(WIDTH/2,HEIGHT-WINMARG-425*SCALE)
     #print(lobStruct["levelSel_rect"])
 
     # Add the difficulty select button
     (lobStruct["diffSel"],lobStruct["diffSel_rect"])=genDiffSel(bxmarg, bymarg, brad)
-    lobStruct["diffSel_rect"].center=(WIDTH/2,HEIGHT-WINMARG-575)
+    lobStruct["diffSel_rect"].center=(WIDTH/2,HEIGHT-WINMARG-575*SCALE)
 
     return lobStruct
 # End of genLobbyScreenS
 
+def genButton(btext, bxmarg, bymarg, brad):
+    # A lobby button with btext on it. Buttons are kept in texts, so clicking through the levels and difficulties
+    # only draws each button once
+    def make():
+        ssurf=texts.outline(btext,fonts["infop_m"],THEME["font"], THEME["dark"], 4)
+        srect=ssurf.get_rect()
+
+        # Add an outline
+        srectbor=srect.inflate(bxmarg, bymarg)
+        srectbor.center=(srectbor.width/2, srectbor.height/2)
+
+        # Make surfae to paste it all to
+        lsurf=pygame.Surface((srectbor.width, srectbor.height)).convert()
+        lsurf.fill(THEME["main"])
+        srect.center=(srectbor.width/2, srectbor.height/2)
+        lsurf.blit(ssurf, srect)
+        pygame.draw.rect(lsurf, THEME["dark"], srectbor, 4, border_radius=brad)
+        return lsurf
+    return texts.get(("button", btext, fonts["infop_m"], bxmarg, bymarg, brad), make)
+# End of genButton
+
 def genLevelSel(bxmarg, bymarg, brad):
     # Generate a level select button. Dynamic, will change according to the selected level number
     global curLevel
     # Button surface
     btext="Level {:02d}".format(curLevel+1)
-    ssurf=outlineText(btext,fonts["infop_m"],THEME["font"], THEME["dark"], 4)
-    srect=ssurf.get_rect()
-    #srect.center=((bxmarg+srect.width/2), (bymarg+srect.height)/2)
-
-    # Add an outline
-    srectbor=srect.inflate(bxmarg, bymarg)
-    srectbor.center=(srectbor.width/2, srectbor.height/2)
-
-    # Make surfae to paste it all to
-    lsurf=pygame.Surface((srectbor.width, srectbor.height))
-    lsurf.fill(THEME["main"])
-    srect.center=(srectbor.width/2, srectbor.height/2)
-    lsurf.blit(ssurf, srect)
-    pygame.draw.rect(lsurf, THEME["dark"], srectbor, 4, border_radius=brad)   
+    lsurf=genButton(btext, bxmarg, bymarg, brad)
     lrect=lsurf.get_rect()
-    lrect.centery=(HEIGHT-WINMARG-400)
+    lrect.centery=(HEIGHT-WINMARG-400*SCALE)
     return (lsurf, lrect)
 # End of genLevelSel
 
@@ -1243,22 +1066,9 @@ def genDiffSel(bxmarg, bymarg, brad):
 
     # Button surface
     btext=difficulty
-    ssurf=outlineText(btext,fonts["infop_m"],THEME["font"], THEME["dark"], 4)
-    srect=ssurf.get_rect()
-    #srect.center=((bxmarg+srect.width/2), (bymarg+srect.height)/2)
-
-    # Add an outline
-    srectbor=srect.inflate(bxmarg, bymarg)
-    srectbor.center=(srectbor.width/2, srectbor.height/2)
-
-    # Make surfae to paste it all to
-    lsurf=pygame.Surface((srectbor.width, srectbor.height))
-    lsurf.fill(THEME["main"])
-    srect.center=(srectbor.width/2, srectbor.height/2)
-    lsurf.blit(ssurf, srect)
-    pygame.draw.rect(lsurf, THEME["dark"], srectbor, 4, border_radius=brad)   
+    lsurf=genButton(btext, bxmarg, bymarg, brad)
     lrect=lsurf.get_rect()
-    lrect.centery=(HEIGHT-WINMARG-300)
+    lrect.centery=(HEIGHT-WINMARG-300*SCALE)
     return (lsurf, lrect)
 # End of genDiffSel
     
@@ -1286,36 +1096,22 @@ def changeDifficulty(d):
     LEVEL_TIME = diffParam[difficulty]["levelTime"]        # Default number of seconds for the level
 # End of changeDifficulty
 
-# Explode test
-def explodeTest():
-    # Test explode function, explode all balls, except the one in the top ally
-    for s in all_sprites:
-        if(type(s).__name__=="Ball"):
-            if(s.newBall==False):
-                s.explode()    
-
 def playLevel():
     # Main loop controlling playing an individual level
-    global curLevel, levelList, all_sprites, ts, showInfoPan, BLOWN_WHEELS, NUM_WHEELS, LEVEL_TIME, showSeconds
-    global ballCount, SCORE
+    global curLevel, levelList, all_sprites, ts, showInfoPan, LEVEL_TIME, showSeconds
+    global SCORE
 
     levelFile=levelList[curLevel]
     loadLevel(levelFile)
 
-    #print("Starting level, NUM_WHEELS=", NUM_WHEELS)
     # Inital display
     drawGameScreen()
 
-    # Add a ball to get us started
-    nextCol=nextBall()
-    all_sprites.add(Ball(nextCol))
-    nextCol=nextBall()
-    aTimer=-1          # Used for various timer purposes
-
-    # Start the level timer
+    # Add a ball to get us started, this also starts the level timer
     ts["levelTime"]=LEVEL_TIME*1000
-    ts["startTime"]=pygame.time.get_ticks()
-    ts["endTime"]=ts["startTime"]+ts["levelTime"]
+    ts["nextUpdate"]=0
+    game.start()
+    processGameEvents()
 
     # gameState:
     #   0 = running
@@ -1323,74 +1119,104 @@ def playLevel():
     #   2 = finished, failure/time out
     #   3 = user quit
     gameState=0
-    sounds["launch"].play()
+    # Game time owed, in ms. Real time is added each frame and paid off in game ticks of game.tickTime
+    owed=0
+    lastFrame=pygame.time.get_ticks()
     while gameState==0:
-        # Keep loop running at the right speed
-        clock.tick(FPS)
-        
-        event = pygame.event.poll()
-        if event.type == pygame.QUIT:
-            gameState=3
-        elif event.type == pygame.KEYUP:
-            if event.key == pygame.K_ESCAPE:
+        # Draw at the render rate, the game ticks are worked out from the real time passed
+        profiler.startFrame()
+        clock.tick(RENDER_FPS)
+        now=pygame.time.get_ticks()
+        frameTime=now-lastFrame
+        owed+=frameTime
+        lastFrame=now
+        profiler.mark("wait")
+
+        for event in pygame.event.get():
+            if scaleEvent(event) or scrollEvent(event):
+                pass
+            elif event.type == pygame.QUIT:
                 gameState=3
-                print("Escape - quitting")
-            elif event.key == pygame.K_e:
-                explodeTest()
-            elif event.key == pygame.K_w:
-                # Test winning
-                gameState=1
-            elif event.key == pygame.K_f:
-                # Test failure
-                gameState=2
-            elif event.key == pygame.K_p:
-                pButton.pause()
-            elif event.key == pygame.K_t:
-                showSeconds=not showSeconds
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            #print("CLICK")
-            # Button 3, right click. Did we click a wheel?
-            if(event.button==3):
-                #print("Right click")
-                for w in wheels:
-                    wheels[w].handleEvent(event)
-            elif(event.button==1):
-                # Left click, did we click a ball?
-                # print("Left click")
-                handled=False
-                for s in all_sprites:
-                    if(type(s).__name__=="Ball"):
-                        handled=s.handleEvent(event)
-                        if(handled):
-                            break;
-                # For debugging wheels, comment out
-                # if(not handled):
-                #     for w in wheels:
-                #         wheels[w].handleEvent(event)
-            pButton.handleEvent(event) 
-        # else:
-        #     print("Unknown event", event.type)
-        #     print(event)
-        # Update sprites
-        all_sprites.update()
+            elif event.type == pygame.KEYUP:
+                if event.key == pygame.K_ESCAPE:
+                    gameState=3
+                    print("Escape - quitting")
+                elif event.key == pygame.K_e:
+                    game.explodeAll()
+                elif event.key == pygame.K_w:
+                    # Test winning
+                    gameState=1
+                elif event.key == pygame.K_f:
+                    # Test failure
+                    gameState=2
+                elif event.key == pygame.K_p:
+                    pButton.pause()
+                elif event.key == pygame.K_t:
+                    showSeconds=not showSeconds
+                elif event.key == pygame.K_F3:
+                    toggleProfile()
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                #print("CLICK")
+                # Button 3, right click. Did we click a wheel? Only the board in view can be clicked
+                if(not boardRect.collidepoint(event.pos)):
+                    pass
+                elif(event.button==3):
+                    #print("Right click")
+                    game.clickWheel(screenToBoard(event.pos))
+                elif(event.button==1):
+                    # Left click, did we click a ball?
+                    # print("Left click")
+                    game.clickBall(screenToBoard(event.pos))
+                pButton.handleEvent(event) 
+            # else:
+            #     print("Unknown event", event.type)
+            #     print(event)
+        scrollKeys(frameTime)
+        profiler.mark("events")
+        # Move the game on by as many ticks as we owe, then bring the sprites up to date with it
+        if(game.paused):
+            # Nothing moves, don't build up time to catch up later
+            owed=0
+        steps=0
+        while(owed>=game.tickTime and steps<MAX_STEPS):
+            game.step()
+            owed-=game.tickTime
+            steps+=1
+        if(owed>=game.tickTime):
+            # Too far behind, drop the rest rather than trying to catch up on every frame after
+            owed%=game.tickTime
+        processGameEvents()
+        profiler.mark("game")
+        # Draw balls part way to where they will be next tick
+        all_sprites.update(1 if game.paused else owed/game.tickTime)
+        profiler.mark("sprites")
 
         # Update the game timer
         updateTimer()
-        if(ts["timeLeft"]<=0):
-            # Out of time
-            gameState=2
+        profiler.mark("timer")
         # Draw / render the scree
         drawGameScreen()
+        profiler.endFrame()
 
-        # Check to see if all wheels are blown
-        if(BLOWN_WHEELS==NUM_WHEELS):
-            # Delay for a little to finish the ball explode annimation
-            if(aTimer==-1):
-                aTimer=pygame.time.get_ticks()+EXPTIME+300
-            if(pygame.time.get_ticks()>aTimer):
-                print("*** Level complete, well done! ***")
-                gameState=1
+        # Has the level been won or timed out?
+        if(game.state==1):
+            print("*** Level complete, well done! ***")
+        if(game.state!=0):
+            gameState=game.state
     # End of level loop, process exit status
+    # Find difficulty multiplier
+    k=list(diffParam.keys())
+    for i in range(len(k)):
+        if(k[i]==difficulty):
+            p=i
+    dm=math.ceil(1*p*0.15)
+    #print("Difficulty multiplier=", dm)
+    if(SAVE_REPLAYS):
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        levelName=os.path.splitext(os.path.basename(levelFile))[0]
+        repFile=os.path.join(REPLAY_DIR, "{}-{}.rep".format(levelName, time.strftime("%Y%m%d-%H%M%S")))
+        saveReplay(game, repFile, dm)
+        print("Replay saved to", repFile)
     moreLevels=False    # Assume we are done
     if(gameState==1):
         # Level completed successfully
@@ -1398,23 +1224,7 @@ def playLevel():
         curLevel+=1
 
         # Calculate score
-        ballScore=100-(ballCount-NUM_WHEELS*4)
-        if(ballScore<0):
-            ballScore=0
-        #print("Ball score=", ballScore)
-        timeScore=int(ts["timeLeft"]/1000)
-        #print("Time score=", timeScore)
-        baseScore=ballScore+timeScore
-        #print("Base score=", baseScore)
-
-        # Find difficulty multiplier
-        k=list(diffParam.keys())
-        for i in range(len(k)):
-            if(k[i]==difficulty):
-                p=i
-        dm=math.ceil(1*p*0.15)
-        #print("Difficulty multiplier=", dm)
-        levelScore=baseScore*dm
+        levelScore=game.levelScore(dm)
         #print("Level score=", levelScore)
         SCORE+=levelScore
 
@@ -1428,14 +1238,14 @@ def playLevel():
             moreLevels=True # Keep playing
         showInfoPan=True
         drawGameScreen()
-        sounds["success"].play()
+        sounds.play("success")
         pygame.time.delay(3000)
         showInfoPan=False
     elif(gameState==2):
         infPan.setMsg("Out of time, score={}".format(SCORE))
         showInfoPan=True
         drawGameScreen()
-        sounds["fail"].play()
+        sounds.play("fail")
         pygame.time.delay(3000)
         showInfoPan=False
     return moreLevels
@@ -1443,45 +1253,33 @@ def playLevel():
 
 # ************* End of functions / Start of main code ******************
 
-# Load fonts
-fonts={
-    "infop":pygame.font.SysFont(fontName, 128),
-    "infop_m":pygame.font.SysFont(fontName, 96),
-    "time":pygame.font.SysFont(fontName, int(TOPBAR*0.66)),
-}
-
-# Generate images
-wheelImage = genWheelImage()
-ballImage = genBalls()
-explosion = exploImages()
-ctrlIcons = genControlIcons()
-timerBar = genTimerBar()
+# Load fonts and generate images, the info panel and lobby screen for the starting scale
+pButton = None
+infPan = None
+setScale(SCALE)
+assets.save()
 
 pButton = pauseButton()
 all_sprites.add(pButton)
 
-infPan=infoPanel()
-lobScreen=genLobbyScreen()
 
+# Main loop structure. An explicit quit is called on the lobby screen, so a while True is valid. Importing
+# bamclone sets everything up without playing, so the functions above can be timed
+if __name__ == "__main__":
+    while True:
+        # Show lobby screen
+        lobby()
 
-# Main loop structure. An explicit quit is called on the lobby screen, so a while True is valid
-while True:
-    # Show lobby screen
-    lobby()
+        gameRunning=True
+        while gameRunning:
+            # Reset everything and load next level
+            all_sprites = pygame.sprite.LayeredDirty()
+            gameRunning=playLevel()
 
-    gameRunning=True
-    while gameRunning:
-        # Reset everything and load next level
-        all_sprites = pygame.sprite.Group()
-        BLOWN_WHEELS=0
-        NUM_WHEELS=0
-        ballCount = 0
-        gameRunning=playLevel()
-
-    # Level may have changed, regenerate the icon
-    lobScreen=genLobbyScreen()
+        # Level may have changed, regenerate the icon
+        lobScreen=genLobbyScreen()
 
-# End of main loop
+    # End of main loop
 
-# We should never reach this line
-pygame.quit()
\ No newline at end of file
+    # We should never reach this line
+    pygame.quit()
\ No newline at end of file
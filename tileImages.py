@@ -1,7 +1,18 @@
 # tileImages
 # Used to create the tile images. These are generated on the fly rather than drawn, to give that retro feel
+#
+# If NumPy is installed the blocker waves, tile borders, studs and pipe gradients are filled in as whole arrays
+# with surfarray, rather than a line or rectangle at a time. Both ways give exactly the same pixels, set
+# USE_ARRAYS to False to use pygame drawing only
 import pygame
 import math
+try:
+    import numpy
+    import pygame.surfarray
+except ImportError:
+    numpy=None
+
+USE_ARRAYS=numpy!=None
 
 TILEBG=(160,160,120)
 TILEBOR=6
@@ -87,23 +98,7 @@ class tileImages():
         for c in cols:
             img=pygame.Surface.copy(self.tileList["B"])
             himg=pygame.Surface.copy(self.tileList["B"])
-            barimg=pygame.Surface((ts,ts), pygame.SRCALPHA)
-            #barimg.set_alpha(128)
-            w=ts/5          # Width of barrier
-            p=ts-TILEBOR    # Number of points
-            f=4             # Wave frequency
-            a=5          # Wave amplitude
-            hl=3        # Thickness of highlight
-            for i in range(TILEBOR,p+1):
-                j=i/p*2*math.pi
-                y=(ts/2-w/2)+(a*math.cos(j*f))
-                pygame.draw.rect(barimg,cols[c],(i,y,1,w))
-                # Add highlights
-                darkCol=self.colorInc(cols[c],-20)
-                baseC=pygame.Color(cols[c])
-                lightCol=baseC.lerp((255,255,255),0.5)
-                pygame.draw.rect(barimg,lightCol,(i,y,1,hl))
-                pygame.draw.rect(barimg,darkCol,(i,y+w-hl,1,hl))
+            barimg=self.genBarrier(cols[c])
             # Make a vertical stripe (to be applied to horizontal)
             horizbar=pygame.transform.rotate(barimg,90)
             # Create the vertical image
@@ -117,6 +112,47 @@ class tileImages():
 
     # End of init, and tile creation
 
+    def genBarrier(self, col):
+        # The wavy vertical barrier of a blocker, on a transparent surface
+        ts=self.ts
+        barimg=pygame.Surface((ts,ts), pygame.SRCALPHA)
+        #barimg.set_alpha(128)
+        w=ts/5          # Width of barrier
+        p=ts-TILEBOR    # Number of points
+        f=4             # Wave frequency
+        a=5          # Wave amplitude
+        hl=3        # Thickness of highlight
+        # Add highlights
+        darkCol=self.colorInc(col,-20)
+        baseC=pygame.Color(col)
+        lightCol=baseC.lerp((255,255,255),0.5)
+        # Top of the barrier for each column
+        xs=range(TILEBOR,p+1)
+        ys=[(ts/2-w/2)+(a*math.cos(i/p*2*math.pi*f)) for i in xs]
+        if(not USE_ARRAYS):
+            for (i, y) in zip(xs, ys):
+                pygame.draw.rect(barimg,col,(i,y,1,w))
+                pygame.draw.rect(barimg,lightCol,(i,y,1,hl))
+                pygame.draw.rect(barimg,darkCol,(i,y+w-hl,1,hl))
+            return barimg
+        # Each column is three runs of rows, found for all columns at once, later runs drawn over earlier ones.
+        # Rects are cut down to whole pixels, the same as pygame does. Only the band of rows the wave covers is
+        # worked on
+        top=numpy.array(ys)
+        lo=max(0, int(top.min()))
+        hi=min(ts, int(top.max()+w)+1)
+        rows=numpy.arange(lo, hi, dtype=numpy.int16)[:,None]
+        def run(y, height):
+            y=y.astype(numpy.int16)
+            return (rows>=y) & (rows<y+int(height))
+        # Pixel values for transparent, then the barrier, highlight and shadow colours
+        palette=numpy.array([0]+[barimg.map_rgb(c)&0xFFFFFFFF for c in (col, lightCol, darkCol)], numpy.uint32)
+        n=[numpy.uint8(i) for i in range(4)]
+        runs=numpy.where(run(top+w-hl, hl), n[3], numpy.where(run(top, hl), n[2], numpy.where(run(top, w), n[1], n[0])))
+        # surfarray is indexed x first, the transpose writes a row at a time
+        pygame.surfarray.pixels2d(barimg).T[lo:hi,TILEBOR:p+1]=palette[runs]
+        return barimg
+
     def unkTile(self):
         # An unknown tile, returned when we don't know what is being asked for
         tile=pygame.Surface((self.ts,self.ts))
@@ -141,19 +177,26 @@ class tileImages():
         lightCol=self.colorInc(bgcol, 20)
         vdarkCol=self.colorInc(bgcol, -40)
 
-        for i in range(0,TILEBOR):
-            # Dark border bottom and right
-            pygame.draw.line(tile, darkCol, (i,self.ts-i),(self.ts,self.ts-i))
-            pygame.draw.line(tile, darkCol, (self.ts-i,i),(self.ts-i,self.ts))
-            # Light border top and left
-            pygame.draw.line(tile, lightCol, (0,i),(self.ts-i,i))
-            pygame.draw.line(tile, lightCol, (i,0),(i,self.ts-i))
+        if(USE_ARRAYS):
+            self.arrayBorder(tile, darkCol, lightCol)
+        else:
+            for i in range(0,TILEBOR):
+                # Dark border bottom and right
+                pygame.draw.line(tile, darkCol, (i,self.ts-i),(self.ts,self.ts-i))
+                pygame.draw.line(tile, darkCol, (self.ts-i,i),(self.ts-i,self.ts))
+                # Light border top and left
+                pygame.draw.line(tile, lightCol, (0,i),(self.ts-i,i))
+                pygame.draw.line(tile, lightCol, (i,0),(i,self.ts-i))
 
         # Draw studs on it
         tileOff=TILESTUD*2.5
         studList=[(tileOff,tileOff), (self.ts-tileOff,tileOff), (self.ts-tileOff, self.ts-tileOff), (tileOff, self.ts-tileOff)]
+        drawList=studList
+        if(TILESTUD!=0 and USE_ARRAYS and self.studsCopy(studList)):
+            # Draw the first stud and copy it to the other corners
+            drawList=studList[:1]
         if(TILESTUD!=0):
-            for coord in studList:
+            for coord in drawList:
                 # Outer circle very dark
                 pygame.draw.circle(tile, vdarkCol, coord, TILESTUD)
                 # Inner stud dark
@@ -167,8 +210,42 @@ class tileImages():
                 #pygame.draw.rect(tile,(0,255,0),rect)
                 #
                 pygame.draw.arc(tile, lightCol, rect,math.pi/2,math.pi,1)
+            if(drawList is not studList):
+                self.copyStud(tile, studList)
 
         return tile
+
+    def studsCopy(self, studList):
+        # Can the studs be drawn once and copied? They must be on whole pixels, and the square around each one
+        # must be plain background, clear of the border and the other studs
+        lo=min(v for coord in studList for v in coord)
+        hi=max(v for coord in studList for v in coord)
+        return (all(float(v).is_integer() for coord in studList for v in coord) and
+                lo-TILESTUD-1>=TILEBOR and hi+TILESTUD+2<=self.ts-TILEBOR and hi-lo>=TILESTUD*2+3)
+
+    def copyStud(self, tile, studList):
+        # Copy the square around the first stud to the others
+        r=TILESTUD+1
+        px=pygame.surfarray.pixels2d(tile)
+        (sx, sy)=(int(v) for v in studList[0])
+        stud=px[sx-r:sx+r+1, sy-r:sy+r+1].copy()
+        for (x, y) in studList[1:]:
+            px[int(x)-r:int(x)+r+1, int(y)-r:int(y)+r+1]=stud
+
+    def arrayBorder(self, tile, darkCol, lightCol):
+        # The same lines as genBlank() draws, as slices. Later lines are drawn over earlier ones, as before
+        ts=self.ts
+        px=pygame.surfarray.pixels2d(tile)
+        darkCol=numpy.uint32(tile.map_rgb(darkCol)&0xFFFFFFFF)
+        lightCol=numpy.uint32(tile.map_rgb(lightCol)&0xFFFFFFFF)
+        for i in range(0,TILEBOR):
+            # Dark border bottom and right, the first of these are just off the tile
+            if(i>0):
+                px[i:ts, ts-i]=darkCol
+                px[ts-i, i:ts]=darkCol
+            # Light border top and left
+            px[0:ts-i+1, i]=lightCol
+            px[i, 0:ts-i+1]=lightCol
     
     def colorInc(self, col, p):
         # Increases a colour by p percent (can be negative)
@@ -198,8 +275,13 @@ class tileImages():
         pygame.draw.line(hpipe,PEDGECOL,(0,0),(0,0))
         pygame.draw.line(hpipe,PMIDCOL,(0,1),(0,1))
         pygame.draw.line(hpipe,PEDGECOL,(0,2),(0,2))
-        # Stretch it
-        hpipe = pygame.transform.smoothscale(hpipe, (self.ts, self.pipew-PIPEBORDER*2))
+        # Stretch it. Every column comes out the same, so with arrays only one is stretched and it is copied across
+        if(USE_ARRAYS):
+            col = pygame.transform.smoothscale(hpipe, (1, self.pipew-PIPEBORDER*2))
+            hpipe = pygame.Surface((self.ts, col.get_height()))
+            pygame.surfarray.pixels2d(hpipe).T[:]=pygame.surfarray.pixels2d(col).T
+        else:
+            hpipe = pygame.transform.smoothscale(hpipe, (self.ts, self.pipew-PIPEBORDER*2))
         # Add it to the horizontal tile
         psurf.blit(hpipe,(0,tilemid+PIPEBORDER))
 